@@ -0,0 +1,28 @@
+import pytest
+
+from giterator.testing import Repo
+
+
+@pytest.fixture(params=[False, True], ids=['git', 'graph'])
+def ancestry_repo(synthetic: Repo, request) -> Repo:
+    if request.param:
+        synthetic('commit-graph', 'write', '--reachable')
+    return synthetic
+
+
+def bench_is_ancestor(measure, ancestry_repo: Repo, scale: int):
+    first = ancestry_repo.rev_parse(f'tag-{scale // 2}', short=False)
+    last = ancestry_repo.rev_parse('HEAD', short=False)
+    measure(ancestry_repo.is_ancestor, first, last)
+
+
+def bench_merge_base(measure, ancestry_repo: Repo, scale: int):
+    first = ancestry_repo.rev_parse('branch-1', short=False)
+    last = ancestry_repo.rev_parse('HEAD', short=False)
+    measure(ancestry_repo.merge_base, first, last, short=False)
+
+
+def bench_branches_containing(measure, ancestry_repo: Repo, scale: int):
+    commit = ancestry_repo.rev_parse(f'tag-{scale // 2}', short=False)
+    branches = ancestry_repo.branch_hashes(short=False)
+    measure(ancestry_repo.branches_containing, commit, branches)
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from giterator import Git, User
+from giterator.testing import Repo
+
+USER = User(name='Giterator', email='giterator@example.com')
+
+
+def bench_call(measure, synthetic: Repo):
+    measure(synthetic, 'rev-parse', 'HEAD')
+
+
+def bench_stream(measure, synthetic: Repo):
+    measure(lambda: list(synthetic.stream('rev-list', 'HEAD')))
+
+
+def bench_init(benchmark, tmp_path: Path, unique):
+    def setup():
+        return (Git(tmp_path / next(unique)),), {'user': USER}
+    benchmark.pedantic(Git.init, setup=setup, rounds=20)
+
+
+def bench_clone(benchmark, synthetic: Repo, tmp_path: Path, unique):
+    def setup():
+        return (synthetic, tmp_path / next(unique)), {}
+    benchmark.pedantic(Git.clone, setup=setup, rounds=5)
+
+
+def bench_clone_shallow(benchmark, synthetic: Repo, tmp_path: Path, unique):
+    def setup():
+        return (synthetic, tmp_path / next(unique)), {'depth': 1}
+    benchmark.pedantic(Git.clone, setup=setup, rounds=5)
+
+
+def bench_clone_shared(benchmark, synthetic: Repo, tmp_path: Path, unique):
+    def setup():
+        return (synthetic, tmp_path / next(unique)), {'shared': True}
+    benchmark.pedantic(Git.clone, setup=setup, rounds=5)
+
+
+def bench_diff(measure, synthetic: Repo, scale: int):
+    first = synthetic.rev_parse(f'tag-{scale // 2}', short=False)
+    second = synthetic.rev_parse('HEAD', short=False)
+    measure(synthetic, 'diff', '--stat', first, second)
+
+
+def bench_diff_cached(measure, synthetic: Repo, scale: int):
+    first = synthetic.rev_parse(f'tag-{scale // 2}', short=False)
+    second = synthetic.rev_parse('HEAD', short=False)
+    with Repo(synthetic.path, command_cache=10 * 1024 * 1024) as repo:
+        measure(repo, 'diff', '--stat', first, second)
@@ -0,0 +1,62 @@
+from giterator.testing import Repo
+
+
+def bench_rev_parse(measure, synthetic: Repo):
+    measure(synthetic.rev_parse, 'HEAD')
+
+
+def bench_rev_parse_full(measure, synthetic: Repo):
+    measure(synthetic.rev_parse, 'HEAD', short=False)
+
+
+def bench_rev_parse_tag(measure, synthetic: Repo, scale: int):
+    measure(synthetic.rev_parse, f'tag-{scale // 2}')
+
+
+def bench_object_info(measure, synthetic: Repo):
+    measure(synthetic.object_info, 'HEAD')
+
+
+def bench_read_object(measure, synthetic: Repo):
+    measure(synthetic.read_object, 'HEAD')
+
+
+def bench_log(measure, synthetic: Repo):
+    measure(lambda: list(synthetic.log()))
+
+
+def bench_log_recent(measure, synthetic: Repo):
+    measure(lambda: list(synthetic.log(max_count=10)))
+
+
+def bench_rev_parse_cached(measure, synthetic: Repo):
+    with Repo(synthetic.path, rev_parse_cache=100) as repo:
+        repo.rev_parse('HEAD')
+        measure(repo.rev_parse, 'HEAD')
+
+
+def walk(repo: Repo, hash: str, limit: int = 100) -> None:
+    # Follow first parents, reading each commit and its tree, as history analysis does:
+    for _ in range(limit):
+        commit = repo.read_object(hash).content
+        headers = dict(line.split(b' ', 1) for line in commit.split(b'\n\n', 1)[0].split(b'\n'))
+        repo.read_object(headers[b'tree'].decode())
+        if b'parent' not in headers:
+            break
+        hash = headers[b'parent'].decode()
+
+
+def bench_read_object_native(measure, synthetic: Repo):
+    hash = synthetic.rev_parse('HEAD', short=False)
+    with Repo(synthetic.path, native_objects=True) as repo:
+        measure(repo.read_object, hash)
+
+
+def bench_walk(measure, synthetic: Repo):
+    measure(walk, synthetic, synthetic.rev_parse('HEAD', short=False))
+
+
+def bench_walk_native(measure, synthetic: Repo):
+    hash = synthetic.rev_parse('HEAD', short=False)
+    with Repo(synthetic.path, native_objects=True) as repo:
+        measure(walk, repo, hash)
@@ -0,0 +1,38 @@
+import pytest
+
+from giterator.testing import Repo
+
+
+@pytest.fixture(params=[False, True], ids=['git', 'native'])
+def native_refs(request) -> bool:
+    return request.param
+
+
+@pytest.fixture()
+def refs_repo(synthetic: Repo, native_refs: bool) -> Repo:
+    with Repo(synthetic.path, native_refs=native_refs) as repo:
+        yield repo
+
+
+def bench_tags(measure, refs_repo: Repo):
+    measure(refs_repo.tags)
+
+
+def bench_tag_hashes(measure, refs_repo: Repo):
+    measure(refs_repo.tag_hashes)
+
+
+def bench_tag_hashes_full(measure, refs_repo: Repo):
+    measure(refs_repo.tag_hashes, short=False)
+
+
+def bench_branches(measure, refs_repo: Repo):
+    measure(refs_repo.branches)
+
+
+def bench_branch_hashes(measure, refs_repo: Repo):
+    measure(refs_repo.branch_hashes)
+
+
+def bench_refs(measure, synthetic: Repo):
+    measure(synthetic.refs)
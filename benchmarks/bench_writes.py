@@ -0,0 +1,61 @@
+from giterator.testing import Repo
+
+
+def bench_commit(benchmark, synthetic: Repo, unique):
+    def setup():
+        (synthetic.path / next(unique)).write_text('content')
+        return ('a commit',), {}
+    benchmark.pedantic(synthetic.commit, setup=setup, rounds=20)
+
+
+def bench_commit_content(measure, synthetic: Repo, unique):
+    measure(lambda: synthetic.commit_content(next(unique)))
+
+
+def bench_import_commits(measure, synthetic: Repo, unique):
+    measure(lambda: synthetic.import_commits(synthetic.content(next(unique)) for _ in range(100)))
+
+
+def bench_tag(measure, synthetic: Repo, unique):
+    measure(lambda: synthetic.tag(next(unique)))
+
+
+def bench_branch(measure, synthetic: Repo, unique):
+    measure(lambda: synthetic.branch(next(unique)))
+
+
+def bench_commit_paths(benchmark, synthetic: Repo, unique):
+    def setup():
+        name = next(unique)
+        (synthetic.path / name).write_text('content')
+        return ('a commit',), {'paths': [name]}
+    benchmark.pedantic(synthetic.commit, setup=setup, rounds=20)
+
+
+def bench_commit_without_index(benchmark, synthetic: Repo, unique):
+    def setup():
+        name = next(unique)
+        (synthetic.path / name).write_text('content')
+        return ('a commit',), {'paths': [name], 'index': False}
+    benchmark.pedantic(synthetic.commit, setup=setup, rounds=20)
+
+
+def bench_write_commit(measure, synthetic: Repo, unique):
+    measure(lambda: synthetic.write_commit('a commit', {next(unique): 'content'}))
+
+
+def tag_many(repo: Repo, commit: str, names, count: int = 100) -> None:
+    with repo.ref_transaction() as refs:
+        for _ in range(count):
+            refs.create(f'refs/tags/{next(names)}', commit)
+
+
+def bench_tag_many(measure, synthetic: Repo, unique):
+    def tag_each():
+        for _ in range(100):
+            synthetic.tag(next(unique))
+    measure(tag_each)
+
+
+def bench_tag_many_transaction(measure, synthetic: Repo, unique):
+    measure(tag_many, synthetic, synthetic.rev_parse('HEAD', short=False), unique)
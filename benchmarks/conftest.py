@@ -0,0 +1,93 @@
+"""
+Fixtures for the benchmarks, which use `pytest-benchmark`__ and run against
+the local git binary. Run them from the directory containing ``setup.py``
+as follows::
+
+  $ pytest benchmarks
+
+__ https://pytest-benchmark.readthedocs.io/
+
+Each benchmark runs against synthetic repos with 100 and 10,000 commits
+and refs. Set ``GITERATOR_BENCHMARK_LARGE=1`` to also use a repo with
+100,000 commits and refs, which takes a while to build.
+
+The ``cached_repo`` fixture comes from :mod:`giterator.pytest_plugin`, which
+``pytest.ini`` enables.
+
+The number of git commands run by the first call of each benchmarked
+operation is recorded in the ``extra_info`` of the results, so that changes
+in the number of subprocesses show up alongside changes in timing.
+"""
+import os
+from subprocess import run
+from functools import partial
+from itertools import count
+from typing import Callable, Iterator
+
+import pytest
+
+from giterator.testing import Repo
+from giterator.tracing import trace
+
+SCALES = [100, 10_000]
+if os.environ.get('GITERATOR_BENCHMARK_LARGE'):
+    SCALES.append(100_000)
+
+#: The number of files that the commits in a synthetic repo cycle through,
+#: keeping its trees small no matter how many commits there are.
+FILES = 100
+
+
+def build(repo: Repo, scale: int) -> None:
+    """
+    Make a repo with ``scale`` commits, each tagged, and ``scale // 10``
+    branches pointing at every tenth commit, with the refs packed as they
+    would be in a long-lived repo.
+    """
+    commits = repo.import_commits(
+        (repo.content(f'file-{i % FILES}', tag=f'tag-{i}') for i in range(scale)),
+        short=False,
+    )
+    lines = ''.join(
+        f'create refs/heads/branch-{i} {commit}\n' for i, commit in enumerate(commits[::10])
+    )
+    run(['git', 'update-ref', '--stdin'], input=lines.encode(), cwd=repo.path, check=True)
+    repo('pack-refs', '--all')
+
+
+@pytest.fixture(params=SCALES)
+def scale(request) -> int:
+    return request.param
+
+
+@pytest.fixture()
+def synthetic(cached_repo, scale: int) -> Repo:
+    """
+    A copy of the synthetic repo for the current scale.
+    """
+    return cached_repo(partial(build, scale=scale), key=f'synthetic-{scale}')
+
+
+@pytest.fixture()
+def unique() -> Iterator[str]:
+    """
+    An iterator of unique names, for operations that need a new one each round.
+    """
+    return (f'unique-{i}' for i in count())
+
+
+@pytest.fixture()
+def measure(benchmark) -> Callable:
+    """
+    Benchmark a function, recording the git commands that the first call to
+    it runs before timing it.
+    """
+    def measure(func, *args, **kw):
+        with trace() as stats:
+            func(*args, **kw)
+        benchmark.extra_info['git_commands'] = len(stats.calls)
+        benchmark.extra_info['git_subcommands'] = {
+            subcommand: summary.calls for subcommand, summary in stats.report().items()
+        }
+        return benchmark(func, *args, **kw)
+    return measure
@@ -0,0 +1,59 @@
+"""
+Compare the ways of finding the hashes of all the tags in a repo.
+
+Usage::
+
+  $ python benchmarks/tag_hashes.py --tags 10000
+"""
+from argparse import ArgumentParser
+from pathlib import Path
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from giterator.testing import Repo
+
+
+def make_repo(path: Path, tags: int) -> Repo:
+    repo = Repo.make(path)
+    commit = repo.commit_content('a', short=False)
+    lines = ''.join(f'create refs/tags/tag-{i} {commit}\n' for i in range(tags))
+    run(['git', 'update-ref', '--stdin'], input=lines.encode(), cwd=repo.path, check=True)
+    return repo
+
+
+def rev_parse_per_tag(repo: Repo):
+    # How tag_hashes used to work: one fork per tag.
+    return {
+        tag: repo('rev-parse', '--verify', '-q', '--short', tag).strip()
+        for tag in repo.tags()
+    }
+
+
+def cat_file_per_tag(repo: Repo):
+    return {tag: repo.rev_parse(tag) for tag in repo.tags()}
+
+
+def for_each_ref(repo: Repo):
+    return repo.tag_hashes()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--tags', type=int, default=10000)
+    args = parser.parse_args()
+    with TemporaryDirectory() as path:
+        repo = make_repo(Path(path) / 'repo', args.tags)
+        expected = None
+        for method in rev_parse_per_tag, cat_file_per_tag, for_each_ref:
+            start = perf_counter()
+            hashes = method(repo)
+            elapsed = perf_counter() - start
+            assert expected is None or hashes == expected, method.__name__
+            expected = hashes
+            print(f'{method.__name__:>20}: {elapsed:8.3f}s for {len(hashes)} tags')
+        repo.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,35 @@
-from .git import Git, GitError, User
+from importlib import import_module
 
 
 __all__ = [
+    'CommitSpec',
     'Git',
+    'RefTransaction',
     'User',
 ]
+
+# Importing .git pulls in subprocess, datetime and more, which the command
+# line doesn't need just to parse its arguments, so these are imported on
+# first use:
+_lazy = {
+    'CommitSpec': '.git',
+    'Git': '.git',
+    'GitError': '.git',
+    'RefTransaction': '.git',
+    'User': '.git',
+    'testing': '.testing',
+}
+
+
+def __getattr__(name: str):
+    module_name = _lazy.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    module = import_module(module_name, __name__)
+    value = module if name == 'testing' else getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
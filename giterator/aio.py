@@ -0,0 +1,221 @@
+import asyncio
+from asyncio.subprocess import PIPE, STDOUT
+from os import makedirs
+from pathlib import Path
+from time import perf_counter
+from typing import Union, Dict, List, Optional
+from weakref import WeakKeyDictionary
+
+from . import tracing
+from .git import Git, User, _error, FILTERING_UPLOAD_PACK
+from .objects import Ref
+from .typing import Date
+
+_default_semaphores: 'WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = (
+    WeakKeyDictionary()
+)
+
+
+class AsyncGit:
+    """
+    Represents a local work tree and repo, running git commands using
+    :mod:`asyncio` subprocesses. The methods mirror those of :class:`~giterator.Git`
+    but are coroutines.
+
+    :param path: The path to an existing work tree or local repo.
+    :param semaphore: A semaphore limiting how many git processes may run at
+      once. Pass the same semaphore to several instances to share a limit
+      between them. If not supplied, all instances without one share a limit
+      of :attr:`default_limit` processes per event loop.
+    """
+
+    _user: User = None
+
+    #: The number of git processes that instances without their own semaphore
+    #: may run at once. This must be set before any commands are run.
+    default_limit: int = 32
+
+    def __init__(self, path: Union[Path, str], *, semaphore: asyncio.Semaphore = None):
+        if not isinstance(path, Path):
+            path = Path(path)
+        #: The path where this instance is located.
+        self.path: Path = path
+        self._semaphore = semaphore
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is not None:
+            return self._semaphore
+        loop = asyncio.get_running_loop()
+        semaphore = _default_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = _default_semaphores[loop] = asyncio.Semaphore(self.default_limit)
+        return semaphore
+
+    async def __call__(self, *command, env: dict = None, cwd: Path = None) -> str:
+        """
+        Run a git command in this repo. For example:
+
+        .. code-block:: python
+
+            await AsyncGit(...)('log', '-1')
+        """
+        command = ('git',) + command
+        cwd = cwd or self.path
+        async with self._get_semaphore():
+            start = perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *command, cwd=cwd, stdout=PIPE, stderr=STDOUT, env=env
+            )
+            output, _ = await process.communicate()
+        if tracing.tracers:
+            tracing.record(command, cwd, start, process.returncode, len(output))
+        if process.returncode:
+            raise _error(command, process.returncode, output)
+        return output.decode()
+
+    git = __call__
+
+    async def _set_user(self, user: Optional[User]):
+        if user:
+            self._user = user
+            await self('config', 'user.name', user.name)
+            await self('config', 'user.email', user.email)
+
+    async def init(self, user: User = None) -> None:
+        """
+        Create an empty Git repository or reinitialize an existing one.
+        If the path doesn't exist, it will be created. This includes any missing
+        parent directories.
+
+        :param user: The user to configure in the local repo.
+        """
+        makedirs(self.path, exist_ok=True)
+        await self('init')
+        await self._set_user(user)
+
+    @classmethod
+    async def clone(
+            cls,
+            source: Union[str, Path, Git, 'AsyncGit'],
+            path: Union[str, Path],
+            user: User = None,
+            *,
+            depth: int = None,
+            filter: str = None,
+            single_branch: bool = None,
+            branch: str = None,
+            reference: Union[str, Path, Git, 'AsyncGit'] = None,
+            dissociate: bool = False,
+            shared: bool = False,
+            semaphore: asyncio.Semaphore = None,
+    ) -> 'AsyncGit':
+        """
+        Clone a local repo, as :meth:`Git.clone <giterator.Git.clone>` does.
+        """
+        if isinstance(source, (Git, AsyncGit)):
+            user = user or source._user
+            source = source.path
+        source = Path(source)
+        dest = source.parent.joinpath(Path(path)).absolute()
+        git = cls(dest, semaphore=semaphore)
+        await git(*Git._clone_command(
+            source, dest, depth, filter, single_branch, branch, reference, dissociate, shared
+        ), cwd=source.parent)
+        if filter is not None:
+            await git('config', 'remote.origin.uploadpack', FILTERING_UPLOAD_PACK)
+        await git._set_user(user)
+        return git
+
+    async def commit(
+            self,
+            msg: str,
+            author_date: Date = None,
+            commit_date: Date = None,
+            short: bool = True,
+    ) -> str:
+        """
+        Commit changes in this repo, including and new or deleted files.
+
+        :param msg: The commit message.
+        :param author_date: The author date.
+        :param commit_date: The commit date. Defaults to author date if not specified.
+        :param short: Return the short commit hash instead of the full 40-character hash.
+        """
+        await self('add', '.')
+        command = ['commit', '-m', msg]
+        if author_date:
+            command.extend(['--date', Git._coerce_date(author_date)])
+        env = {}
+        if commit_date:
+            env['GIT_COMMITTER_DATE'] = Git._coerce_date(commit_date)
+        await self(*command, env=env)
+        return await self.rev_parse('HEAD', short)
+
+    async def rev_parse(self, label: str, short: bool = True) -> str:
+        """
+        Return the hash of the object referred to by the label supplied, which
+        can be anything understood by ``git rev-parse``.
+
+        :param short: Return the short hash instead of the full 40-character hash.
+        """
+        command = ['rev-parse', '--verify', '-q']
+        if short:
+            command.append('--short')
+        command.append(label)
+        return (await self(*command)).strip()
+
+    async def tag(self, name: str) -> None:
+        """
+        Create a tag with the specified name.
+        """
+        await self('tag', name)
+
+    async def tags(self) -> List[str]:
+        """
+        Return a list of tags in this repo.
+        """
+        return (await self('tag')).split()
+
+    async def tag_hashes(self, short: bool = True) -> Dict[str, str]:
+        """
+        Return a mapping of tag name to commit hash.
+
+        :param short: Return short hashes instead of full 40-character hashes.
+        """
+        return await self._ref_hashes('refs/tags/', short)
+
+    async def branch(self, name: str) -> None:
+        """
+        Create and checkout a branch with the specified name.
+        """
+        await self('checkout', '-b', name)
+
+    async def branches(self) -> List[str]:
+        """
+        Return a list of branches in this repo.
+        """
+        return (await self('for-each-ref', '--format', '%(refname:short)', 'refs/heads/')).split()
+
+    async def branch_hashes(self, short: bool = True) -> Dict[str, str]:
+        """
+        Return a mapping of branch name to commit hash.
+
+        :param short: Return short hashes instead of full 40-character hashes.
+        """
+        return await self._ref_hashes('refs/heads/', short)
+
+    async def refs(self, *patterns: str, short: bool = True) -> List[Ref]:
+        """
+        Return a list of :class:`~giterator.objects.Ref` instances, sorted by
+        name, for the references in this repo.
+
+        :param patterns: If supplied, only references matching at least one
+          of these patterns, such as ``refs/tags/``, are returned.
+        :param short: Return short hashes instead of full 40-character hashes.
+        """
+        output = await self(*Git._refs_command(patterns, short))
+        return Git._parse_refs(output.splitlines())
+
+    async def _ref_hashes(self, prefix: str, short: bool) -> Dict[str, str]:
+        refs = await self.refs(prefix, short=short)
+        return {ref.name[len(prefix):]: ref.hash for ref in refs}
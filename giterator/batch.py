@@ -0,0 +1,183 @@
+"""
+Running operations on many repos, described as lines of JSON, so that a
+script can make thousands of calls through one process and reuse a
+:class:`~giterator.Git`, and its long-running processes, for each repo.
+"""
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from os import cpu_count
+from pathlib import Path
+from threading import Lock, Semaphore
+from typing import Any, Deque, Dict, Iterable, TextIO, Tuple
+
+from .git import Git, GitError, User
+from .objects import Commit, ObjectInfo, Ref
+
+# The types of result written as mappings of their public attributes:
+RECORDS = (Commit, ObjectInfo, Ref, User)
+
+
+def jsonable(value: Any) -> Any:
+    """
+    Convert a value returned by a :class:`~giterator.Git` method into one
+    that can be written as JSON. Objects such as
+    :class:`~giterator.objects.Ref` become mappings of their attributes,
+    a :class:`~giterator.Git` becomes its path, iterators become lists, and
+    bytes are decoded as UTF-8.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) or hasattr(value, '__next__'):
+        return [jsonable(item) for item in value]
+    if isinstance(value, Git):
+        return str(value.path)
+    if isinstance(value, RECORDS):
+        names = [name for cls in type(value).__mro__ for name in getattr(cls, '__slots__', ())]
+        if not names:
+            names = [name for name in vars(value) if not name.startswith('_')]
+        return {name: jsonable(getattr(value, name)) for name in names}
+    raise TypeError(f'Cannot convert {value!r} to JSON')
+
+
+Operation = Tuple[Any, str, list, dict]
+
+
+class _InvalidOperation(Exception):
+
+    def __init__(self, id_: Any, message: str):
+        super().__init__(message)
+        self.id = id_
+
+
+def _parse(line: str, number: int) -> Tuple[Path, Operation]:
+    try:
+        operation = json.loads(line)
+    except ValueError as e:
+        raise _InvalidOperation(number, f'Invalid JSON: {e}')
+    if not isinstance(operation, dict):
+        raise _InvalidOperation(number, 'Operation must be a JSON object')
+    id_ = operation.get('id', number)
+    for key in 'repo', 'method':
+        if not isinstance(operation.get(key), str):
+            raise _InvalidOperation(id_, f'{key!r} must be a string')
+    args = operation.get('args', [])
+    kwargs = operation.get('kwargs', {})
+    if not isinstance(args, list) or not isinstance(kwargs, dict):
+        raise _InvalidOperation(id_, "'args' must be a list and 'kwargs' an object")
+    # So that different spellings of the same path share a Git:
+    return Path(operation['repo']).resolve(), (id_, operation['method'], args, kwargs)
+
+
+def _error(e: Exception) -> str:
+    if isinstance(e, GitError):
+        return str(e)
+    return f'{type(e).__name__}: {e}'
+
+
+def run_batch(lines: Iterable[str], output: TextIO, jobs: int = None) -> int:
+    """
+    Run the operations supplied, one JSON object per line, writing a line
+    of JSON to the output for each as it finishes.
+
+    An operation looks like this, where ``args``, ``kwargs`` and ``id``
+    are optional:
+
+    .. code-block:: json
+
+      {"id": 1, "repo": "path/to/repo", "method": "rev_parse", "args": ["HEAD"], "kwargs": {}}
+
+    ``method`` is the name of a public :class:`~giterator.Git` method, such as
+    ``rev_parse``, ``tag_hashes`` or ``git`` to run any git command.
+    The result is written as ``{"id": 1, "result": ...}``, converted using
+    :func:`jsonable`, or ``{"id": 1, "error": "..."}`` if the operation
+    failed. ``id`` defaults to the operation's line number.
+
+    Operations on different repos are run in parallel, while those on the same
+    repo are run one at a time in the order given, so results may be written
+    in a different order to the operations.
+
+    :param jobs: The maximum number of operations run at once.
+      Defaults to the number of CPUs.
+    :return: The number of operations that failed.
+    """
+    jobs = jobs or cpu_count() or 1
+    repos: Dict[Path, Git] = {}
+    # Repos with operations in progress, and those waiting behind them:
+    queues: Dict[Path, Deque[Operation]] = {}
+    lock = Lock()
+    # Bounds how far reading can get ahead of the operations being run:
+    pending = Semaphore(jobs * 2)
+    failed = 0
+
+    def write(id_: Any, key: str, value: Any) -> None:
+        nonlocal failed
+        line = json.dumps({'id': id_, key: value})
+        with lock:
+            if key == 'error':
+                failed += 1
+            output.write(line + '\n')
+            output.flush()
+
+    def run(git: Git, operation: Operation) -> None:
+        id_, method, args, kwargs = operation
+        try:
+            if method.startswith('_') or not callable(getattr(git, method, None)):
+                raise ValueError(f'{method!r} is not a method that can be called')
+            value = getattr(git, method)(*args, **kwargs)
+            try:
+                result = jsonable(value)
+            finally:
+                # Such as the new repo from clone:
+                if isinstance(value, Git):
+                    value.close()
+        except Exception as e:
+            write(id_, 'error', _error(e))
+        else:
+            write(id_, 'result', result)
+
+    def drain(path: Path) -> None:
+        git = repos.get(path)
+        if git is None:
+            git = repos[path] = Git(path)
+        while True:
+            with lock:
+                if not queues[path]:
+                    del queues[path]
+                    return
+                operation = queues[path].popleft()
+            run(git, operation)
+            pending.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    path, operation = _parse(line, number)
+                except _InvalidOperation as e:
+                    write(e.id, 'error', str(e))
+                    continue
+                pending.acquire()
+                with lock:
+                    queue = queues.get(path)
+                    if queue is None:
+                        queues[path] = deque([operation])
+                    else:
+                        queue.append(operation)
+                if queue is None:
+                    executor.submit(drain, path)
+    finally:
+        for git in repos.values():
+            git.close()
+    return failed
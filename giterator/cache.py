@@ -0,0 +1,267 @@
+"""
+Caching the output of git commands that only depend on immutable objects.
+"""
+import os
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Optional, Sequence
+
+from .refs import FULL_HASH, Signature, _path_signature, find_git_dirs
+
+#: The subcommands whose output can be cached, when all the revisions they are
+#: given are full hashes.
+CACHEABLE = frozenset(('cat-file', 'diff', 'diff-tree', 'ls-tree', 'show'))
+
+# The types cat-file can be asked for an object as:
+OBJECT_TYPES = frozenset(('blob', 'commit', 'tag', 'tree'))
+
+# Options that make these subcommands look at the index, the work tree,
+# notes or other files, or write files:
+UNCACHEABLE_OPTIONS = frozenset((
+    '--cached', '--staged', '--no-index', '--output', '--textconv', '--filters', '--batch',
+    '--batch-check', '--stdin', '--find-copies-harder', '--ext-diff', '--notes',
+    '--show-notes', '--standard-notes',
+))
+
+#: The name of the directory, within the common git directory, where the cache is kept.
+DIRECTORY = 'giterator-cache'
+
+# When the cache is too big, entries are evicted until it is this fraction
+# of its maximum size, so that eviction doesn't happen on every store:
+EVICT_TO = 0.75
+
+# How stale, in seconds, the last use of an entry must be before using it
+# again is recorded, to avoid a write on every hit:
+USE_RESOLUTION = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    command TEXT PRIMARY KEY,
+    output TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outputs_used ON outputs (used);
+CREATE TABLE IF NOT EXISTS total (size INTEGER NOT NULL);
+INSERT INTO total SELECT 0 WHERE NOT EXISTS (SELECT * FROM total);
+CREATE TRIGGER IF NOT EXISTS outputs_insert AFTER INSERT ON outputs BEGIN
+    UPDATE total SET size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS outputs_delete AFTER DELETE ON outputs BEGIN
+    UPDATE total SET size = size - old.size;
+END;
+"""
+
+
+def _is_revision(arg: str) -> bool:
+    # A full hash, possibly followed by a path within it, or a range of full hashes:
+    for separator in ('...', '..'):
+        if separator in arg:
+            return all(FULL_HASH.fullmatch(part) for part in arg.split(separator))
+    return FULL_HASH.fullmatch(arg.split(':', 1)[0]) is not None
+
+
+def cacheable(command: Sequence[str]) -> bool:
+    """
+    Return whether the output of the git command supplied, without the
+    leading ``git``, depends only on immutable objects, such as
+    ``('ls-tree', '-r', <full hash>)``. Commands that refer to objects by
+    anything other than a full hash, such as a branch name or a short
+    hash, are never cacheable. Nor is ``show`` without ``--no-notes``,
+    since notes can be added to a commit.
+    """
+    if not command or command[0] not in CACHEABLE:
+        return False
+    subcommand = command[0]
+    positional = []
+    for arg in command[1:]:
+        if not isinstance(arg, str):
+            return False
+        if arg == '--':
+            break
+        if arg.startswith('-'):
+            if arg.split('=', 1)[0] in UNCACHEABLE_OPTIONS:
+                return False
+        else:
+            positional.append(arg)
+    if subcommand == 'ls-tree':
+        # Anything after the tree is a path within it:
+        positional = positional[:1]
+    elif subcommand == 'cat-file':
+        if positional[:-1] and positional[0] not in OBJECT_TYPES:
+            return False
+        positional = positional[-1:]
+    # Anything else could be a revision or a path in the work tree:
+    if not positional or not all(_is_revision(arg) for arg in positional):
+        return False
+    revisions = sum(2 if '..' in arg else 1 for arg in positional)
+    if subcommand == 'show':
+        return '--no-notes' in command
+    # With fewer revisions, diff compares with the work tree or index:
+    return subcommand != 'diff' or revisions == 2
+
+
+class CommandCache:
+    """
+    A cache of the output of git commands, stored in an sqlite database so
+    that it persists between processes and can be shared by those running
+    at the same time. When the outputs stored exceed the maximum size, those
+    least recently used are evicted.
+
+    Only commands that are :func:`cacheable` should be stored. Configuration
+    that changes their output, such as ``diff.algorithm``, is not taken into
+    account, so :meth:`clear` should be called if it changes.
+
+    :param path: The path of the database file, which is created if needed.
+    :param max_size: The maximum total size, in bytes, of the outputs stored.
+    :param common_dir: The common git directory of the repo the commands are
+      run in. If supplied, the cache is not used while the repo has replace
+      refs, grafts or is shallow, since these change what a full hash refers to.
+    """
+
+    def __init__(self, path: Path, max_size: int, common_dir: Path = None):
+        self.path = path
+        self.max_size = max_size
+        self.common_dir = common_dir
+        self._packed_signature: Optional[Signature] = None
+        self._packed_replace = False
+        path.parent.mkdir(exist_ok=True)
+        self._lock = Lock()
+        self._connection = sqlite3.connect(
+            str(path), timeout=1, isolation_level=None, check_same_thread=False
+        )
+        try:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(f'BEGIN IMMEDIATE; {SCHEMA} COMMIT;')
+        except BaseException:
+            self._connection.close()
+            raise
+
+    @classmethod
+    def for_path(cls, path: Path, max_size: int) -> Optional['CommandCache']:
+        """
+        Return the cache for the work tree or bare repo at the path specified,
+        which is kept in the :data:`DIRECTORY` of its common git directory,
+        or ``None`` if that can't be found or the cache can't be opened.
+        """
+        dirs = find_git_dirs(path)
+        if dirs is None:
+            return None
+        try:
+            return cls(dirs[1] / DIRECTORY / 'commands.sqlite', max_size, dirs[1])
+        except (OSError, sqlite3.Error):
+            return None
+
+    def _rewritten(self) -> bool:
+        # Whether history, as seen through full hashes, is being rewritten:
+        common_dir = self.common_dir
+        if common_dir is None:
+            return False
+        if (common_dir / 'shallow').exists() or (common_dir / 'info' / 'grafts').exists():
+            return True
+        try:
+            with os.scandir(common_dir / 'refs' / 'replace') as entries:
+                if any(entries):
+                    return True
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        packed = common_dir / 'packed-refs'
+        signature = _path_signature(packed)
+        if signature != self._packed_signature:
+            try:
+                self._packed_replace = b' refs/replace/' in packed.read_bytes()
+            except FileNotFoundError:
+                self._packed_replace = False
+            self._packed_signature = signature
+        return self._packed_replace
+
+    def get(self, command: Sequence[str]) -> Optional[str]:
+        """
+        Return the output stored for the command, or ``None`` if there isn't
+        any or the cache can't currently be used.
+        """
+        if self._rewritten():
+            return None
+        key = '\0'.join(command)
+        now = int(time())
+        try:
+            with self._lock:
+                row = self._connection.execute(
+                    'SELECT output, used FROM outputs WHERE command = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                output, used = row
+                if now - used > USE_RESOLUTION:
+                    self._connection.execute(
+                        'UPDATE outputs SET used = ? WHERE command = ?', (now, key)
+                    )
+        except sqlite3.Error:
+            # The cache is busy or damaged, which is no reason to fail:
+            return None
+        return output
+
+    def set(self, command: Sequence[str], output: str) -> None:
+        """
+        Store the output of the command, evicting the least recently used
+        outputs if the cache is now too big.
+        """
+        if self._rewritten():
+            return
+        key = '\0'.join(command)
+        size = len(key.encode()) + len(output.encode())
+        if size > self.max_size:
+            return
+        try:
+            with self._lock:
+                connection = self._connection
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    connection.execute(
+                        'INSERT INTO outputs VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING',
+                        (key, output, size, int(time()))
+                    )
+                    total, = connection.execute('SELECT size FROM total').fetchone()
+                    if total > self.max_size:
+                        self._evict(total - int(self.max_size * EVICT_TO))
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+                connection.execute('COMMIT')
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, excess: int) -> None:
+        freed = 0
+        keys = []
+        rows = self._connection.execute('SELECT command, size FROM outputs ORDER BY used')
+        for key, size in rows:
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._connection.executemany('DELETE FROM outputs WHERE command = ?', keys)
+
+    def size(self) -> int:
+        """
+        Return the total size, in bytes, of the outputs stored.
+        """
+        with self._lock:
+            return self._connection.execute('SELECT size FROM total').fetchone()[0]
+
+    def clear(self) -> None:
+        """
+        Remove all the outputs stored.
+        """
+        with self._lock:
+            self._connection.execute('DELETE FROM outputs')
+
+    def close(self) -> None:
+        """
+        Close the database.
+        """
+        with self._lock:
+            self._connection.close()
@@ -1,3 +1,4 @@
+import sys
 from argparse import ArgumentParser, Namespace
 
 
@@ -11,25 +12,82 @@ class Command:
 
 
 class Pack(Command):
-    pass
+    """
+    Write a compressed snapshot of a repo, including its work tree.
+    """
+
+    def add_args(self, parser: ArgumentParser):
+        parser.add_argument('repo', help='The path to the repo to pack.')
+        parser.add_argument('archive', help="The path of the archive to write, or '-' for stdout.")
+        parser.add_argument('--jobs', type=int, help='The number of threads used to compress.')
+
+    def __call__(self, args: Namespace):
+        from .git import Git
+        from .snapshot import pack
+        if args.archive == '-':
+            pack(Git(args.repo), sys.stdout.buffer, args.jobs)
+        else:
+            with open(args.archive, 'wb') as output:
+                pack(Git(args.repo), output, args.jobs)
 
 
 class Unpack(Command):
-    pass
+    """
+    Restore a snapshot written by pack into a new repo.
+    """
+
+    def add_args(self, parser: ArgumentParser):
+        parser.add_argument('archive', help="The path of the archive to read, or '-' for stdin.")
+        parser.add_argument('repo', help='The path at which to create the repo.')
+
+    def __call__(self, args: Namespace):
+        from .snapshot import unpack
+        if args.archive == '-':
+            unpack(sys.stdin.buffer, args.repo)
+        else:
+            with open(args.archive, 'rb') as input:
+                unpack(input, args.repo)
+
+
+class Batch(Command):
+    """
+    Run operations on repos, read as lines of JSON from stdin, writing
+    a line of JSON with the result of each to stdout.
+    """
+
+    def add_args(self, parser: ArgumentParser):
+        parser.add_argument(
+            '--jobs', type=int, help='The maximum number of operations run at once.'
+        )
+
+    def __call__(self, args: Namespace):
+        from .batch import run_batch
+        if run_batch(sys.stdin, sys.stdout, args.jobs):
+            sys.exit(1)
 
 
-def parse_args() -> Namespace:
-    parser = ArgumentParser()
+def parse_args(argv: list[str] = None) -> Namespace:
+    argv = sys.argv[1:] if argv is None else argv
+    # Only the command being run needs its arguments adding, which may be
+    # costly; the top-level parser only has --help, so it's the first word:
+    requested = next((arg for arg in argv if not arg.startswith('-')), None)
+    parser = ArgumentParser(prog='giterator')
     subparsers = parser.add_subparsers(dest='command')
     subparsers.required = True
     for command_class in Command.__subclasses__():
-        command_parser = subparsers.add_parser(command_class.__name__.lower())
-        command = command_class()
-        command.add_args(command_parser)
-        command_parser.set_defaults(command=command)
-    return parser.parse_args()
+        name = command_class.__name__.lower()
+        command_parser = subparsers.add_parser(name, help=command_class.__doc__.strip())
+        if name == requested:
+            command = command_class()
+            command.add_args(command_parser)
+            command_parser.set_defaults(command=command)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    args.command(args)
+    from .git import GitError
+    try:
+        args.command(args)
+    except GitError as e:
+        sys.exit(str(e))
@@ -1,10 +1,28 @@
-from os import makedirs
+from datetime import datetime
+from os import makedirs, fsencode, readlink
 from pathlib import Path
-from subprocess import check_output, STDOUT, CalledProcessError
-from typing import Union, Dict, List, Optional
+from stat import S_ISLNK, S_ISREG, S_IXUSR
+from struct import unpack
+from subprocess import check_output, STDOUT, CalledProcessError, Popen, PIPE
+from tempfile import TemporaryFile, TemporaryDirectory
+from threading import RLock
+from time import perf_counter
+from typing import (
+    Union, Dict, List, Optional, Sequence, Set, Iterator, Iterable, Mapping, Tuple,
+    TYPE_CHECKING,
+)
 
+from . import tracing
+from .cache import CommandCache, cacheable
+from .objects import ObjectInfo, Object, Ref, Commit
+from .graph import CommitGraph
+from .packs import MAX_ALTERNATE_DEPTH, ObjectStore, UnsupportedFormat
+from .refs import FULL_HASH, RefReader, UnsupportedLayout, LabelCache
 from .typing import Date
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .aio import AsyncGit
+
 
 class User:
     """
@@ -16,26 +34,440 @@ class User:
         self.email = email
 
 
+class CommitSpec:
+    """
+    A description of a commit to be made by :meth:`Git.import_commits`.
+
+    :param msg: The commit message.
+    :param files: A mapping of path to new content for the files changed by
+      this commit. Content may be text or bytes; ``None`` deletes the file.
+    :param author_date: The author date. Strings must be in ISO 8601 format.
+    :param commit_date: The commit date. Defaults to author date if not specified.
+    :param tag: If specified, a tag with this name is created for the commit.
+    :param branch: If specified, a branch with this name is created from the
+      previous commit, and this commit and those that follow are made on it.
+    """
+
+    __slots__ = ('msg', 'files', 'author_date', 'commit_date', 'tag', 'branch')
+
+    def __init__(
+            self,
+            msg: str,
+            files: Mapping[str, Union[str, bytes, None]],
+            author_date: Date = None,
+            commit_date: Date = None,
+            *,
+            tag: str = None,
+            branch: str = None,
+    ):
+        self.msg = msg
+        self.files = files
+        self.author_date = author_date
+        self.commit_date = commit_date
+        self.tag = tag
+        self.branch = branch
+
+
 class GitError(Exception):
     """
     Something went wrong while running a git command.
     """
 
+    #: The return code of the git command, where one ran and failed.
+    returncode: Optional[int] = None
+    #: What the git command that failed wrote, including to its standard error.
+    output: bytes = b''
+
+
+def _error(command: Sequence[str], returncode: int, output: bytes) -> GitError:
+    error = GitError(
+        f"{' '.join(command)!r} gave return code {returncode}:\n\n"
+        f"{output.decode()}\n\n"
+    )
+    error.returncode = returncode
+    error.output = output
+    return error
+
+
+class Process:
+    """
+    A long-running git process that is fed requests on its standard input
+    and answers them on its standard output, such as ``git cat-file --batch``.
+
+    The process is started when first used. Callers must hold the process,
+    by using it as a context manager, for the whole of a request and its
+    response.
+    """
+
+    def __init__(self, command: Sequence[str], cwd: Path):
+        self.command = ('git',) + tuple(command)
+        self.cwd = cwd
+        self._popen: Optional[Popen] = None
+        self._lock = RLock()
+
+    def __enter__(self) -> 'Process':
+        self._lock.acquire()
+        self._start = perf_counter()
+        self._output_size = 0
+        self._returncode = None
+        if self._popen is None:
+            self._stderr = TemporaryFile()
+            try:
+                self._popen = Popen(
+                    self.command, cwd=self.cwd, stdin=PIPE, stdout=PIPE, stderr=self._stderr
+                )
+            except BaseException:
+                self._stderr.close()
+                self._lock.release()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is not None:
+                # The conversation is now in an unknown state, so start again next time:
+                self._stop()
+            if tracing.tracers:
+                tracing.record(
+                    self.command, self.cwd, self._start, self._returncode, self._output_size
+                )
+        finally:
+            self._lock.release()
+
+    def write(self, data: bytes) -> None:
+        try:
+            self._popen.stdin.write(data)
+        except BrokenPipeError:
+            raise self._failed() from None
+
+    def flush(self) -> None:
+        try:
+            self._popen.stdin.flush()
+        except BrokenPipeError:
+            raise self._failed() from None
+
+    def readline(self) -> bytes:
+        line = self._popen.stdout.readline()
+        if not line:
+            raise self._failed()
+        self._output_size += len(line)
+        return line
+
+    def read(self, size: int) -> bytes:
+        data = self._popen.stdout.read(size)
+        if len(data) < size:
+            raise self._failed()
+        self._output_size += size
+        return data
+
+    def _stop(self) -> Optional[GitError]:
+        popen, self._popen = self._popen, None
+        if popen is None:
+            return None
+        try:
+            popen.stdin.close()
+        except BrokenPipeError:
+            pass
+        popen.stdout.close()
+        returncode = self._returncode = popen.wait()
+        with self._stderr as stderr:
+            stderr.seek(0)
+            return _error(self.command, returncode, stderr.read()) if returncode else None
+
+    def _failed(self) -> GitError:
+        return self._stop() or GitError(f"{' '.join(self.command)!r} exited unexpectedly")
+
+    def close(self) -> None:
+        """
+        Close the process's standard input and wait for it to exit,
+        raising a :class:`GitError` if it was not successful.
+        This is a no-op if the process is not running.
+        """
+        with self._lock:
+            error = self._stop()
+        if error is not None:
+            raise error
+
+
+class RefTransaction:
+    """
+    A set of changes to references that are applied together, all or
+    nothing, by a single ``git update-ref --stdin`` process.
+    These are obtained from :meth:`Git.ref_transaction`.
+
+    Changes are queued until :meth:`commit` is called, which happens when
+    the ``with`` block the transaction is used in ends without an exception.
+
+    Where an ``old`` value is supplied, the change is only made if the
+    reference currently points to it, otherwise no changes are made and a
+    :class:`GitError` is raised.
+    """
+
+    def __init__(self, git: 'Git'):
+        self._git = git
+        self._commands: List[bytes] = []
+
+    def __enter__(self) -> 'RefTransaction':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def _queue(self, command: str, ref: str, *values: Optional[str]) -> None:
+        fields = [f'{command} {ref}'] + [value or '' for value in values]
+        self._commands.append(b''.join(field.encode() + b'\0' for field in fields))
+
+    def create(self, ref: str, new: str) -> None:
+        """
+        Make the reference with the full name supplied, such as
+        ``refs/tags/v1.0``, point to the new value. The reference must not
+        already exist.
+        """
+        self._queue('create', ref, new)
+
+    def update(self, ref: str, new: str, old: str = None) -> None:
+        """
+        Make the reference with the full name supplied point to the new value,
+        creating it if necessary and if no ``old`` value is supplied.
+        """
+        self._queue('update', ref, new, old)
+
+    def delete(self, ref: str, old: str = None) -> None:
+        """
+        Delete the reference with the full name supplied.
+        """
+        self._queue('delete', ref, old)
+
+    def verify(self, ref: str, old: str = None) -> None:
+        """
+        Check the reference with the full name supplied points to the ``old``
+        value, or doesn't exist if no ``old`` value is supplied, without
+        changing it.
+        """
+        self._queue('verify', ref, old)
+
+    def commit(self) -> None:
+        """
+        Apply all the changes queued so far. If any can't be made, none
+        are, and a :class:`GitError` is raised.
+        """
+        commands, self._commands = self._commands, []
+        if not commands:
+            return
+        process = Process(['update-ref', '--stdin', '-z'], self._git.path)
+        try:
+            with process:
+                for command in commands:
+                    process.write(command)
+            process.close()
+        finally:
+            self._git._changed()
+
+    def abort(self) -> None:
+        """
+        Discard all the changes queued so far.
+        """
+        self._commands = []
+
+
+FALLBACK_ABBREV = 7
+LOG_FORMAT = '%x00'.join(('%H', '%P', '%an', '%ae', '%aI', '%cn', '%ce', '%cI', '%s'))
+LOG_FIELDS = LOG_FORMAT.count('%x00') + 1
+STREAM_CHUNK_SIZE = 64 * 1024
+TREE_MODE = '040000'
+# Serving a partial clone needs the source's permission, which can be given
+# like this when the source is local:
+FILTERING_UPLOAD_PACK = 'git -c uploadpack.allowFilter=true upload-pack'
+OBJECT_TYPES = {TREE_MODE: 'tree', '160000': 'commit'}
+
+
+def _quote_path(path: str) -> str:
+    # fast-import reads a path as C-style quoted if it starts with a quote,
+    # which is also the only way to give it one with a newline in:
+    if not path.startswith('"') and not any(c < ' ' or c in '\\\x7f' for c in path):
+        return path
+    quoted = []
+    for c in path:
+        if c in '"\\':
+            quoted.append('\\' + c)
+        elif c == '\n':
+            quoted.append('\\n')
+        elif c == '\t':
+            quoted.append('\\t')
+        elif c < ' ' or c == '\x7f':
+            quoted.append(f'\\{ord(c):03o}')
+        else:
+            quoted.append(c)
+    return '"' + ''.join(quoted) + '"'
+
+
+def _multi_pack_index(pack: Path) -> Tuple[int, Set[str]]:
+    # The number of objects in the multi-pack-index, and the indexes it covers.
+    try:
+        data = (pack / 'multi-pack-index').read_bytes()
+    except FileNotFoundError:
+        return 0, set()
+    if data[:4] != b'MIDX':
+        return 0, set()
+    chunks, packs = data[6], unpack('>I', data[8:12])[0]
+    offsets = {}
+    for i in range(chunks):
+        entry = data[12 + i * 12:24 + i * 12]
+        offsets[entry[:4]] = unpack('>Q', entry[4:])[0]
+    fanout = offsets[b'OIDF']
+    count = unpack('>I', data[fanout + 255 * 4:fanout + 256 * 4])[0]
+    names = data[offsets[b'PNAM']:].split(b'\0', packs)[:packs]
+    return count, {name.decode() for name in names}
+
+
+def _approximate_object_count(objects: Path) -> int:
+    # This mirrors git's own approximation, which counts the packed objects
+    # of the repo and its alternates, but not loose objects.
+    count = 0
+    seen = set()
+    pending = [(objects, 0)]
+    while pending:
+        objects, depth = pending.pop()
+        if objects.resolve() in seen:
+            continue
+        seen.add(objects.resolve())
+        pack = objects / 'pack'
+        indexed_count, indexed = _multi_pack_index(pack)
+        count += indexed_count
+        for index in pack.glob('*.idx'):
+            if index.name in indexed or not index.with_suffix('.pack').exists():
+                continue
+            with index.open('rb') as source:
+                header = source.read(8 + 256 * 4)
+            if header[:4] == b'\377tOc':
+                header = header[8:]
+            count += unpack('>I', header[255 * 4:256 * 4])[0]
+        if depth < MAX_ALTERNATE_DEPTH:
+            try:
+                lines = (objects / 'info' / 'alternates').read_text().splitlines()
+            except FileNotFoundError:
+                lines = []
+            for line in lines:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    pending.append((objects / line, depth + 1))
+    return count
+
 
 class Git:
     """
     Represents a local work tree and repo.
 
+    Some operations are served by long-running git processes that belong to
+    this instance. These are started when first needed and can be stopped
+    by calling :meth:`close` or by using the instance as a context manager.
+
     :param path: The path to an existing work tree or local repo.
+    :param native_refs: If ``True``, :meth:`tags`, :meth:`branches` and
+      the ``*_hashes`` methods read refs directly from the repo's files
+      rather than running git, where the repo's layout allows.
+    :param rev_parse_cache: If supplied, :meth:`rev_parse` caches what up to
+      this many labels resolve to. Entries are discarded when the ref files
+      they were resolved from change, and after any changes made using this
+      instance. Labels based on a full hash are cached until evicted, while
+      short hashes are only used while the abbreviation length is the same.
+    :param native_objects: If ``True``, :meth:`object_info` and
+      :meth:`read_object` read objects referred to by a full hash directly
+      from the repo's pack files and loose objects, using an
+      :class:`~giterator.packs.ObjectStore`, rather than asking git.
+    :param command_cache: If supplied, the output of commands run by calling
+      this instance whose output depends only on immutable objects, as
+      decided by :func:`~giterator.cache.cacheable`, is stored on disk in a
+      :class:`~giterator.cache.CommandCache` of up to this many bytes, within
+      the repo, and used instead of running git again.
     """
 
     _user: User = None
 
-    def __init__(self, path: Union[Path, str]):
+    def __init__(
+            self,
+            path: Union[Path, str],
+            *,
+            native_refs: bool = False,
+            rev_parse_cache: int = 0,
+            native_objects: bool = False,
+            command_cache: int = 0,
+    ):
         if not isinstance(path, Path):
             path = Path(path)
         #: The path where this instance is located.
         self.path: Path = path
+        #: Whether refs are read directly from the repo's files where possible.
+        self.native_refs: bool = native_refs
+        #: The maximum number of labels whose resolution :meth:`rev_parse` caches.
+        self.rev_parse_cache: int = rev_parse_cache
+        #: Whether objects are read directly from the repo's files where possible.
+        self.native_objects: bool = native_objects
+        #: The maximum size, in bytes, of the outputs of commands cached on disk.
+        self.command_cache: int = command_cache
+        self._command_cache: Optional[CommandCache] = None
+        self._object_store: Optional[ObjectStore] = None
+        self._commit_graph: Optional[CommitGraph] = None
+        self._commit_graph_signature: Optional[tuple] = None
+        self._ref_reader: Optional[RefReader] = None
+        self._label_cache: Optional[LabelCache] = None
+        self._processes: Dict[tuple, Process] = {}
+        self._abbrev: Optional[int] = None
+        self._objects_path: Optional[Path] = None
+
+    def __getstate__(self):
+        # Long-running processes and cached state stay with the original:
+        state = self.__dict__.copy()
+        state.update(
+            _processes={}, _ref_reader=None, _label_cache=None, _abbrev=None, _objects_path=None,
+            _object_store=None, _commit_graph=None, _commit_graph_signature=None,
+            _command_cache=None,
+        )
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop any long-running git processes started by this instance.
+        They will be started again if needed.
+        """
+        processes, self._processes = self._processes, {}
+        for process in processes.values():
+            process.close()
+        self._abbrev = self._objects_path = None
+        store, self._object_store = self._object_store, None
+        if store is not None:
+            store.close()
+        graph, self._commit_graph = self._commit_graph, None
+        self._commit_graph_signature = None
+        if graph is not None:
+            graph.close()
+        cache, self._command_cache = self._command_cache, None
+        if cache is not None:
+            cache.close()
+
+    def _process(self, *command: str) -> Process:
+        process = self._processes.get(command)
+        if process is None:
+            process = self._processes[command] = Process(command, self.path)
+        return process
+
+    def _changed(self) -> None:
+        # Called after this instance changes the repo in a way that may not be
+        # visible in the signatures of ref files, such as within the same tick.
+        if self._label_cache is not None:
+            self._label_cache.invalidate()
 
     def __call__(self, *command, env: dict = None, cwd: Path = None) -> str:
         """
@@ -45,19 +477,83 @@ class Git:
 
             Git(...)('log', '-1')
         """
+        cache = None
+        if self.command_cache and env is None and cwd is None and cacheable(command):
+            cache = self._cache()
+            if cache is not None:
+                output = cache.get(command)
+                if output is not None:
+                    return output
+        command = ('git',) + command
+        cwd = cwd or self.path
+        start = perf_counter()
         try:
-            output = check_output(
-                ('git',) + command, cwd=cwd or self.path, stderr=STDOUT, env=env
-            )
+            output = check_output(command, cwd=cwd, stderr=STDOUT, env=env)
         except CalledProcessError as e:
-            raise GitError(
-                f"{' '.join(e.cmd)!r} gave return code {e.returncode}:\n\n"
-                f"{e.output.decode()}\n\n"
-            ) from None
-        return output.decode()
+            if tracing.tracers:
+                tracing.record(command, cwd, start, e.returncode, len(e.output))
+            raise _error(e.cmd, e.returncode, e.output) from None
+        if tracing.tracers:
+            tracing.record(command, cwd, start, 0, len(output))
+        output = output.decode()
+        if cache is not None:
+            cache.set(command[1:], output)
+        return output
 
     git = __call__
 
+    def _cache(self) -> Optional[CommandCache]:
+        if self._command_cache is None:
+            self._command_cache = CommandCache.for_path(self.path, self.command_cache)
+        return self._command_cache
+
+    def stream(
+            self, *command, sep: str = '\n', env: dict = None, cwd: Path = None
+    ) -> Iterator[str]:
+        """
+        Run a git command in this repo, yielding its output one record at a
+        time as it arrives rather than collecting it all in memory first.
+        For example:
+
+        .. code-block:: python
+
+            for path in Git(...).stream('ls-files', '-z', sep='\\0'):
+                ...
+
+        A :class:`GitError` is raised once the output is exhausted if the command
+        fails. If iteration is abandoned early, the command is killed.
+
+        :param sep: The separator between records, usually a newline or NUL.
+        """
+        command = ('git',) + command
+        cwd = cwd or self.path
+        separator = sep.encode()
+        start = perf_counter()
+        size = 0
+        with TemporaryFile() as stderr:
+            popen = Popen(command, cwd=cwd, stdout=PIPE, stderr=stderr, env=env)
+            try:
+                pending = b''
+                for chunk in iter(lambda: popen.stdout.read1(STREAM_CHUNK_SIZE), b''):
+                    size += len(chunk)
+                    records = (pending + chunk).split(separator)
+                    pending = records.pop()
+                    for record in records:
+                        yield record.decode()
+                if pending:
+                    yield pending.decode()
+            finally:
+                if popen.poll() is None:
+                    popen.kill()
+                popen.stdout.close()
+                returncode = popen.wait()
+                if tracing.tracers:
+                    # This can't raise, so can't hide an exception from above:
+                    tracing.record(command, cwd, start, returncode, size)
+            if returncode:
+                stderr.seek(0)
+                raise _error(command, returncode, stderr.read())
+
     def _set_user(self, user: Optional[User]):
         if user:
             self._user = user
@@ -74,30 +570,139 @@ class Git:
         """
         makedirs(self.path, exist_ok=True)
         self('init')
+        self._label_cache = None
         self._set_user(user)
 
     @classmethod
-    def clone(cls, source: Union[str, Path, 'Git'], path: Union[str, Path], user: User = None):
+    def clone(
+            cls,
+            source: Union[str, Path, 'Git'],
+            path: Union[str, Path],
+            user: User = None,
+            *,
+            depth: int = None,
+            filter: str = None,
+            single_branch: bool = None,
+            branch: str = None,
+            reference: Union[str, Path, 'Git'] = None,
+            dissociate: bool = False,
+            shared: bool = False,
+    ) -> 'Git':
+        """
+        Clone the local repo at ``source`` into a new work tree at ``path``,
+        which is relative to the source's parent directory.
+
+        :param user: The user to configure in the new repo. Defaults to the
+          source's user, if it is a :class:`Git` with one.
+        :param depth: Make a shallow clone with history truncated to this
+          number of commits.
+        :param filter: Make a partial clone using this filter, such as
+          ``blob:none`` or ``tree:0``. Missing objects are fetched from the
+          source when needed.
+        :param single_branch: If ``True``, only clone the history of one branch,
+          which is ``branch`` or the source's ``HEAD``. If ``False``, clone all
+          branches even when ``depth`` is supplied.
+        :param branch: The branch to check out instead of the source's ``HEAD``.
+        :param reference: A local repo from which objects are borrowed, rather
+          than copied, where it has them.
+        :param dissociate: Copy any objects borrowed from ``reference`` once the
+          clone is complete, so that the new repo no longer depends on it.
+        :param shared: Borrow all objects from the source rather than copying
+          or hard linking them, including when ``depth``, ``filter`` or
+          ``reference`` are supplied. The new repo will break if the source
+          loses objects it needs.
+        """
         if isinstance(source, Git):
             user = user or source._user
             source = source.path
         source = Path(source)
         dest = source.parent.joinpath(Path(path)).absolute()
         git = cls(dest)
-        git('clone', str(source), str(git.path), cwd=source.parent)
+        git(*cls._clone_command(
+            source, dest, depth, filter, single_branch, branch, reference, dissociate, shared
+        ), cwd=source.parent)
+        if filter is not None:
+            # so that missing objects can be fetched later:
+            git('config', 'remote.origin.uploadpack', FILTERING_UPLOAD_PACK)
         git._set_user(user)
         return git
 
+    @staticmethod
+    def _clone_command(
+            source: Path,
+            dest: Path,
+            depth: Optional[int],
+            filter: Optional[str],
+            single_branch: Optional[bool],
+            branch: Optional[str],
+            reference: Union[str, Path, 'Git', 'AsyncGit', None],
+            dissociate: bool,
+            shared: bool,
+    ) -> List[str]:
+        command = []
+        url = str(source)
+        if depth is not None or filter is not None or reference is not None:
+            # When cloning from a path rather than a URL, git ignores depth and
+            # filter, and copies all objects even if the reference has them:
+            url = source.absolute().as_uri()
+        command.append('clone')
+        if filter is not None:
+            command.extend(['--upload-pack', FILTERING_UPLOAD_PACK])
+        if depth is not None:
+            command.append(f'--depth={depth}')
+        if filter is not None:
+            command.append(f'--filter={filter}')
+        if single_branch is not None:
+            command.append('--single-branch' if single_branch else '--no-single-branch')
+        if branch is not None:
+            command.extend(['--branch', branch])
+        if reference is not None:
+            if not isinstance(reference, (str, Path)):
+                reference = reference.path
+            command.extend(['--reference', str(Path(reference).absolute())])
+        if dissociate:
+            command.append('--dissociate')
+        if shared:
+            if url == str(source):
+                command.append('--shared')
+            else:
+                # git ignores --shared for URLs, but borrowing from the source
+                # as a reference does the same:
+                command.extend(['--reference', str(source.absolute())])
+        command.extend([url, str(dest)])
+        return command
+
     @staticmethod
     def _coerce_date(dt):
         return dt if isinstance(dt, str) else dt.isoformat()
 
+    @staticmethod
+    def _raw_date(dt: Date) -> str:
+        if isinstance(dt, str):
+            dt = datetime.fromisoformat(dt.replace('Z', '+00:00'))
+        elif not isinstance(dt, datetime):
+            dt = datetime(dt.year, dt.month, dt.day)
+        if dt.tzinfo is None:
+            # naive datetimes are in local time, as git treats them:
+            dt = dt.astimezone()
+        offset = int(dt.utcoffset().total_seconds()) // 60
+        sign = '-' if offset < 0 else '+'
+        hours, minutes = divmod(abs(offset), 60)
+        return f'{int(dt.timestamp())} {sign}{hours:02d}{minutes:02d}'
+
+    @staticmethod
+    def _parse_date(text: str) -> Optional[datetime]:
+        return datetime.fromisoformat(text.replace('Z', '+00:00')) if text else None
+
     def commit(
             self,
             msg: str,
             author_date: Date = None,
             commit_date: Date = None,
             short: bool = True,
+            *,
+            paths: Sequence[str] = None,
+            index: bool = True,
     ) -> str:
         """
         Commit changes in this repo, including and new or deleted files.
@@ -106,56 +711,678 @@ class Git:
         :param author_date: The author date.
         :param commit_date: The commit date. Defaults to author date if not specified.
         :param short: Return the short commit hash instead of the full 40-character hash.
+        :param paths: If supplied, only changes to these files are added before
+          committing, and the rest of the work tree is not checked for changes.
+          A path that no longer exists is removed. Commit hooks are not run.
+        :param index: If ``False``, the commit is made from ``HEAD`` and the
+          current content of the ``paths``, which must be supplied, without
+          reading the index or including anything already staged. The index
+          entries for the ``paths`` are then updated to match.
         """
-        self('add', '.')
-        command = ['commit', '-m', msg]
-        if author_date:
-            command.extend(['--date', self._coerce_date(author_date)])
+        if paths is None:
+            if not index:
+                raise ValueError('paths must be supplied when index is False')
+            self('add', '.')
+            command = ['commit', '-m', msg]
+            if author_date:
+                command.extend(['--date', self._coerce_date(author_date)])
+            env = {}
+            if commit_date:
+                env['GIT_COMMITTER_DATE'] = self._coerce_date(commit_date)
+            self(*command, env=env)
+            self._changed()
+            return self.rev_parse('HEAD', short)
+
+        pathspecs = [f':(literal){path}' for path in paths]
+        parent = self._head()
+        parent_tree = self.object_info(f'{parent}^{{tree}}').hash if parent else None
+        if index:
+            self('add', '--all', '--', *pathspecs)
+            tree = self('write-tree').strip()
+        else:
+            tree = self._write_tree(parent_tree, self._hash_paths(paths)) or self._mktree({})
+        if tree == parent_tree:
+            raise GitError('nothing to commit')
+        commit = self._commit_tree(tree, [parent] if parent else [], msg, author_date, commit_date)
+        self('update-ref', '-m', f'commit: {msg}', 'HEAD', commit, parent or '')
+        self._changed()
+        if not index:
+            self('reset', '--quiet', '--', *pathspecs)
+        return self._abbreviate(commit) if short else commit
+
+    def write_commit(
+            self,
+            msg: str,
+            files: Mapping[str, Union[str, bytes, None]],
+            author_date: Date = None,
+            commit_date: Date = None,
+            *,
+            parents: Sequence[str] = None,
+            ref: Optional[str] = 'HEAD',
+            short: bool = True,
+    ) -> str:
+        """
+        Make a commit from content supplied in memory, writing it straight into
+        the object database. The work tree and index, if there are any, are
+        neither read nor changed, so this works just as well in a bare repo.
+
+        :param msg: The commit message.
+        :param files: A mapping of path to new content for the files changed by
+          this commit, relative to the first parent. Content may be text or bytes;
+          ``None`` deletes the file.
+        :param author_date: The author date. Defaults to the current time.
+        :param commit_date: The commit date. Defaults to the current time.
+        :param parents: Labels for the parents of the commit. Defaults to the
+          commit ``ref``, or ``HEAD`` if ``ref`` is ``None``, currently points at,
+          if any. Pass an empty sequence to make a root commit.
+        :param ref: The full name of the ref, such as ``refs/heads/main``, to
+          point at the new commit. It is only updated if it has not changed since
+          it was read. Pass ``None`` to leave all refs alone.
+        :param short: Return the short commit hash instead of the full 40-character hash.
+        """
+        try:
+            current = self.object_info(ref or 'HEAD').hash
+        except GitError:
+            current = None
+        if parents is None:
+            parents = [current] if current else []
+        else:
+            parents = [self.object_info(f'{parent}^{{commit}}').hash for parent in parents]
+        base = self.object_info(f'{parents[0]}^{{tree}}').hash if parents else None
+        contents = [content for content in files.values() if content is not None]
+        hashes = iter(self._hash_blobs([
+            content.encode() if isinstance(content, str) else content for content in contents
+        ]))
+        changes = {
+            fsencode(path): None if content is None else ('100644', next(hashes))
+            for path, content in files.items()
+        }
+        tree = self._write_tree(base, changes) or self._mktree({})
+        commit = self._commit_tree(tree, parents, msg, author_date, commit_date)
+        if ref is not None:
+            # This fails if the ref has been changed since it was read above:
+            self('update-ref', '-m', f'commit: {msg}', ref, commit, current or '')
+            self._changed()
+        return self._abbreviate(commit) if short else commit
+
+    def _head(self) -> Optional[str]:
+        try:
+            return self.object_info('HEAD').hash
+        except GitError:
+            return None
+
+    def _commit_tree(
+            self,
+            tree: str,
+            parents: Sequence[str],
+            msg: str,
+            author_date: Optional[Date],
+            commit_date: Optional[Date],
+    ) -> str:
+        command = ['commit-tree', tree, '-m', msg]
+        for parent in parents:
+            command.extend(['-p', parent])
         env = {}
+        if author_date:
+            env['GIT_AUTHOR_DATE'] = self._coerce_date(author_date)
         if commit_date:
             env['GIT_COMMITTER_DATE'] = self._coerce_date(commit_date)
-        self(*command, env=env)
-        return self.rev_parse('HEAD', short)
+        return self(*command, env=env).strip()
 
-    def rev_parse(self, label: str, short: bool = True) -> str:
-        command = ['rev-parse', '--verify', '-q']
+    def _hash_paths(self, paths: Iterable[str]) -> Dict[bytes, Optional[Tuple[str, str]]]:
+        # Returns a mapping of path to mode and blob hash, or None for deleted paths.
+        changes = {}
+        with self._process('hash-object', '-w', '--stdin-paths') as process:
+            for path in paths:
+                key = fsencode(path)
+                full_path = self.path / path
+                try:
+                    stat = full_path.lstat()
+                except (FileNotFoundError, NotADirectoryError):
+                    changes[key] = None
+                    continue
+                if S_ISLNK(stat.st_mode):
+                    changes[key] = '120000', self._hash_blobs([fsencode(readlink(full_path))])[0]
+                    continue
+                if not S_ISREG(stat.st_mode):
+                    raise GitError(f'{path!r} is not a file')
+                if b'\n' in key:
+                    raise GitError(f'Cannot hash {path!r}')
+                process.write(key + b'\n')
+                process.flush()
+                mode = '100755' if stat.st_mode & S_IXUSR else '100644'
+                changes[key] = mode, process.readline().decode().strip()
+        return changes
+
+    def _hash_blobs(self, contents: Sequence[bytes]) -> List[str]:
+        # Blobs are written exactly as supplied, without any filters being applied.
+        hashes = []
+        if not contents:
+            return hashes
+        with TemporaryDirectory() as tmp:
+            with self._process('hash-object', '-w', '--no-filters', '--stdin-paths') as process:
+                for i, content in enumerate(contents):
+                    path = Path(tmp, str(i))
+                    path.write_bytes(content)
+                    process.write(fsencode(path) + b'\n')
+                    process.flush()
+                    hashes.append(process.readline().decode().strip())
+        return hashes
+
+    def _tree_entries(self, tree: str) -> Dict[bytes, Tuple[str, str]]:
+        content = self.read_object(tree).content
+        hash_size = len(tree) // 2
+        entries = {}
+        position = 0
+        while position < len(content):
+            space = content.index(b' ', position)
+            nul = content.index(b'\0', space)
+            mode = content[position:space].decode()
+            hash = content[nul + 1:nul + 1 + hash_size].hex()
+            entries[content[space + 1:nul]] = mode.rjust(6, '0'), hash
+            position = nul + 1 + hash_size
+        return entries
+
+    def _write_tree(
+            self, tree: Optional[str], changes: Mapping[bytes, Optional[Tuple[str, str]]]
+    ) -> Optional[str]:
+        # Returns the hash of the tree with the changes applied, or None if that
+        # tree would be empty.
+        here = {}
+        below: Dict[bytes, Dict[bytes, Optional[Tuple[str, str]]]] = {}
+        for path, change in changes.items():
+            name, _, rest = path.partition(b'/')
+            if rest:
+                below.setdefault(name, {})[rest] = change
+            else:
+                here[name] = change
+        entries = self._tree_entries(tree) if tree else {}
+        for name, change in here.items():
+            if change is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = change
+        for name, subtree_changes in below.items():
+            mode, hash = entries.get(name, (None, None))
+            subtree = self._write_tree(hash if mode == TREE_MODE else None, subtree_changes)
+            if subtree is not None:
+                entries[name] = TREE_MODE, subtree
+            elif mode == TREE_MODE:
+                del entries[name]
+        if not entries:
+            return None
+        return self._mktree(entries)
+
+    def _mktree(self, entries: Mapping[bytes, Tuple[str, str]]) -> str:
+        request = bytearray()
+        for name, (mode, hash) in entries.items():
+            type_ = OBJECT_TYPES.get(mode, 'blob')
+            request += f'{mode} {type_} {hash}\t'.encode() + name + b'\0'
+        request += b'\0'
+        with self._process('mktree', '-z', '--batch') as process:
+            process.write(bytes(request))
+            process.flush()
+            return process.readline().decode().strip()
+
+    @staticmethod
+    def _batch_request(process: Process, label: str) -> bytes:
+        if '\n' in label:
+            raise GitError(f'Could not resolve {label!r}')
+        process.write(label.encode() + b'\n')
+        process.flush()
+        header = process.readline()
+        if header.endswith((b' missing\n', b' ambiguous\n')):
+            raise GitError(f'Could not resolve {label!r}')
+        return header
+
+    def object_info(self, label: str) -> ObjectInfo:
+        """
+        Return the :class:`~giterator.objects.ObjectInfo` for the object
+        referred to by the label supplied, which can be anything understood
+        by ``git rev-parse``.
+
+        This is answered by a long-running ``git cat-file --batch-check`` process,
+        unless ``native_objects`` was passed and the label is a full hash.
+        """
+        store = self._native_objects(label)
+        if store is not None:
+            try:
+                info = store.info(label)
+            except UnsupportedFormat:
+                info = None
+            if info is not None:
+                return info
+        with self._process('cat-file', '--batch-check') as process:
+            hash, type_, size = self._batch_request(process, label).split()
+        return ObjectInfo(hash.decode(), type_.decode(), int(size))
+
+    def read_object(self, label: str) -> Object:
+        """
+        Return the :class:`~giterator.objects.Object` referred to by the label
+        supplied, which can be anything understood by ``git rev-parse``.
+
+        This is answered by a long-running ``git cat-file --batch`` process,
+        unless ``native_objects`` was passed and the label is a full hash.
+        """
+        store = self._native_objects(label)
+        if store is not None:
+            try:
+                object_ = store.read(label)
+            except UnsupportedFormat:
+                object_ = None
+            if object_ is not None:
+                return object_
+        with self._process('cat-file', '--batch') as process:
+            hash, type_, size = self._batch_request(process, label).split()
+            size = int(size)
+            content = process.read(size + 1)[:-1]
+        return Object(hash.decode(), type_.decode(), size, content)
+
+    def _native_objects(self, label: str) -> Optional[ObjectStore]:
+        # Returns None if the object can't be read natively, so git should be used.
+        if not self.native_objects or not FULL_HASH.fullmatch(label):
+            return None
+        if self._object_store is None:
+            self._object_store = ObjectStore.for_path(self.path)
+        return self._object_store
+
+    def _abbrev_length(self) -> int:
+        if self._abbrev is None:
+            try:
+                abbrev = self('config', '--get', 'core.abbrev').strip().lower()
+            except GitError:
+                abbrev = 'auto'
+            if abbrev in ('no', 'off', 'false'):
+                self._abbrev = 0
+            elif abbrev == 'auto':
+                self._abbrev = -1
+            else:
+                self._abbrev = int(abbrev)
+        length = self._abbrev
+        if length < 0:
+            if self._objects_path is None:
+                self._objects_path = self.path / self('rev-parse', '--git-path', 'objects').strip()
+            count = _approximate_object_count(self._objects_path)
+            length = max(FALLBACK_ABBREV, (count.bit_length() + 1) // 2)
+        return length
+
+    def _abbreviate(self, hash: str, length: int = None) -> str:
+        if length is None:
+            length = self._abbrev_length()
+        if not length:
+            return hash
+        with self._process('cat-file', '--batch-check') as process:
+            while length < len(hash):
+                process.write(hash[:length].encode() + b'\n')
+                process.flush()
+                if not process.readline().endswith(b' ambiguous\n'):
+                    break
+                length += 1
+        return hash[:length]
+
+    def _ident(self) -> str:
+        if self._user:
+            return f'{self._user.name} <{self._user.email}>'
+        ident = self('var', 'GIT_AUTHOR_IDENT').strip()
+        return ident[:ident.rindex('>') + 1]
+
+    def import_commits(self, commits: Iterable[CommitSpec], short: bool = True) -> List[str]:
+        """
+        Make the commits described by the :class:`CommitSpec` instances supplied,
+        in order, on top of the current branch, streaming them all through a
+        single ``git fast-import`` process. The work tree, if there is one, and
+        ``HEAD`` are then updated as though the commits had been made one at
+        a time.
+
+        Commits without an author date are given the current time.
+
+        :param short: Return short commit hashes instead of full 40-character hashes.
+        :return: The hashes of the new commits.
+        """
+        try:
+            branch = self('symbolic-ref', '-q', 'HEAD').strip()
+        except GitError:
+            raise GitError('HEAD is detached, so commits cannot be imported') from None
+        try:
+            tip = self.rev_parse('HEAD', short=False)
+        except GitError:
+            tip = None
+        start = branch, tip
+        ident = self._ident()
+        now = self._raw_date(datetime.now())
+        marks = 0
+        with TemporaryDirectory() as tmp:
+            marks_path = Path(tmp) / 'marks'
+            process = Process(
+                ['fast-import', '--quiet', '--date-format=raw', f'--export-marks={marks_path}'],
+                self.path
+            )
+            with process:
+                for spec in commits:
+                    marks += 1
+                    if spec.branch:
+                        branch = f'refs/heads/{spec.branch}'
+                    author_date = self._raw_date(spec.author_date) if spec.author_date else now
+                    commit_date = (
+                        self._raw_date(spec.commit_date) if spec.commit_date else author_date
+                    )
+                    msg = spec.msg.encode()
+                    if not msg.endswith(b'\n'):
+                        msg += b'\n'
+                    process.write(
+                        f'commit {branch}\nmark :{marks}\n'
+                        f'author {ident} {author_date}\n'
+                        f'committer {ident} {commit_date}\n'
+                        f'data {len(msg)}\n'.encode() + msg
+                    )
+                    if tip:
+                        process.write(f'from {tip}\n'.encode())
+                    for path, content in spec.files.items():
+                        if content is None:
+                            process.write(f'D {_quote_path(path)}\n'.encode())
+                            continue
+                        if isinstance(content, str):
+                            content = content.encode()
+                        process.write(
+                            f'M 100644 inline {_quote_path(path)}\n'
+                            f'data {len(content)}\n'.encode() + content
+                        )
+                    process.write(b'\n')
+                    tip = f':{marks}'
+                    if spec.tag:
+                        process.write(f'reset refs/tags/{spec.tag}\nfrom {tip}\n\n'.encode())
+            process.close()
+            hashes = dict(line.split() for line in marks_path.read_text().splitlines())
+        commits = [hashes[f':{mark}'] for mark in range(1, marks + 1)]
+        if commits:
+            self._update_work_tree(start, branch, commits[-1])
+            self._changed()
         if short:
-            command.append('--short')
-        command.append(label)
-        return self(*command).strip()
+            length = self._abbrev_length()
+            commits = [self._abbreviate(commit, length) for commit in commits]
+        return commits
+
+    def _update_work_tree(self, start: tuple, branch: str, tip: str):
+        start_branch, start_tip = start
+        if self('rev-parse', '--is-bare-repository').strip() == 'false':
+            # This carries local changes across, just like checkout would:
+            self('read-tree', '-m', '-u', *filter(None, (start_tip, tip)))
+        if branch != start_branch:
+            self('symbolic-ref', 'HEAD', branch)
+
+    def rev_parse(self, label: str, short: bool = True) -> str:
+        """
+        Return the hash of the object referred to by the label supplied, which
+        can be anything understood by ``git rev-parse``.
+
+        If this instance was created with a ``rev_parse_cache``, labels seen
+        before are usually answered without asking git.
+
+        :param short: Return the short hash instead of the full 40-character hash.
+        """
+        if not self.rev_parse_cache:
+            return self._rev_parse(label, short)
+        if self._label_cache is None:
+            self._label_cache = LabelCache(self.rev_parse_cache, self.path)
+        # The abbreviation length grows with the repo, so is part of the key:
+        length = self._abbrev_length() if short else None
+        key = label, length
+        hash = self._label_cache.get(key)
+        if hash is None:
+            dependencies = self._label_cache.dependencies(label)
+            hash = self.object_info(label).hash
+            if short:
+                hash = self._abbreviate(hash, length)
+            if dependencies is not None:
+                self._label_cache.set(key, dependencies, hash)
+        return hash
+
+    def _rev_parse(self, label: str, short: bool) -> str:
+        hash = self.object_info(label).hash
+        return self._abbreviate(hash) if short else hash
+
+    def log(
+            self, *revisions: str, paths: Sequence[str] = (), max_count: int = None
+    ) -> Iterator[Commit]:
+        """
+        Yield a :class:`~giterator.objects.Commit` for each commit in this
+        repo's history, newest first, as ``git log`` produces them.
+
+        :param revisions: The revisions or ranges, such as ``main..feature``,
+          to include. Defaults to ``HEAD``.
+        :param paths: If supplied, only commits that touch these paths are included.
+        :param max_count: The maximum number of commits to yield.
+        """
+        command = ['log', '-z', f'--format=tformat:{LOG_FORMAT}']
+        if max_count is not None:
+            command.append(f'--max-count={max_count}')
+        command.extend(revisions)
+        command.append('--')
+        command.extend(paths)
+        fields = []
+        for field in self.stream(*command, sep='\0'):
+            fields.append(field)
+            if len(fields) == LOG_FIELDS:
+                (hash, parents, author_name, author_email, author_date,
+                 committer_name, committer_email, commit_date, subject) = fields
+                yield Commit(
+                    hash,
+                    parents.split(),
+                    User(author_name, author_email),
+                    self._parse_date(author_date),
+                    User(committer_name, committer_email),
+                    self._parse_date(commit_date),
+                    subject,
+                )
+                fields = []
+
+    def _graph(self) -> Optional[CommitGraph]:
+        # Returns None if there's no commit-graph that can be read directly.
+        signature = CommitGraph.signature(self.path)
+        if signature != self._commit_graph_signature:
+            if self._commit_graph is not None:
+                self._commit_graph.close()
+            self._commit_graph = None if signature is None else CommitGraph.for_path(self.path)
+            self._commit_graph_signature = signature
+        return self._commit_graph
+
+    def _commit_hash(self, label: str) -> str:
+        if FULL_HASH.fullmatch(label):
+            return label
+        return self.rev_parse(f'{label}^{{commit}}', short=False)
+
+    def _graph_positions(
+            self, hashes: Sequence[str]
+    ) -> Tuple[Optional[CommitGraph], Optional[List[int]]]:
+        # Returns the positions of the commits in the commit-graph,
+        # unless it's missing or doesn't contain all of them:
+        graph = self._graph()
+        if graph is None:
+            return None, None
+        positions = [graph.position(hash) for hash in hashes]
+        if None in positions:
+            return None, None
+        return graph, positions
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        """
+        Return whether the first commit is the second or one of its ancestors.
+        Both can be anything understood by ``git rev-parse``.
+
+        This is answered from the repo's commit-graph, walking only the history
+        with generation numbers that could contain the ancestor. If there is no
+        commit-graph, or it doesn't include both commits,
+        ``git merge-base --is-ancestor`` is used instead.
+        """
+        hashes = [self._commit_hash(ancestor), self._commit_hash(descendant)]
+        graph, positions = self._graph_positions(hashes)
+        if graph is not None:
+            return graph.is_ancestor(*positions)
+        try:
+            self('merge-base', '--is-ancestor', *hashes)
+        except GitError as e:
+            # Anything else, or complaints such as about a missing object,
+            # means the answer isn't known:
+            if e.returncode != 1 or e.output:
+                raise
+            return False
+        return True
+
+    def merge_base(self, first: str, second: str, short: bool = True) -> Optional[str]:
+        """
+        Return the best common ancestor of two commits, as ``git merge-base``
+        does, or ``None`` if they have no common history. Where there is more
+        than one, the most recently committed is returned.
+
+        This is answered from the repo's commit-graph where possible, as
+        :meth:`is_ancestor` is.
+
+        :param short: Return a short hash instead of the full 40-character hash.
+        """
+        hashes = [self._commit_hash(first), self._commit_hash(second)]
+        graph, positions = self._graph_positions(hashes)
+        if graph is not None:
+            bases = graph.merge_bases(*positions)
+            hash = graph.hash(bases[0]) if bases else None
+        else:
+            try:
+                hash = self('merge-base', *hashes).strip()
+            except GitError as e:
+                if e.returncode != 1 or e.output:
+                    raise
+                hash = None
+        if hash is not None and short:
+            hash = self._abbreviate(hash)
+        return hash
+
+    def branches_containing(self, commit: str, branches: Mapping[str, str] = None) -> List[str]:
+        """
+        Return the names of the branches that contain the commit supplied,
+        which can be anything understood by ``git rev-parse``.
+
+        Using the repo's commit-graph, the history walked for one branch is
+        not walked again for the others. Without one, or for branches it
+        doesn't include, :meth:`is_ancestor` is used for each branch.
+
+        :param branches: A mapping of branch name to commit, such as that
+          returned by :meth:`branch_hashes`. Defaults to all the branches
+          in this repo.
+        """
+        if branches is None:
+            branches = self.branch_hashes(short=False)
+        hash = self._commit_hash(commit)
+        tips = {name: self._commit_hash(tip) for name, tip in branches.items()}
+        graph, positions = self._graph_positions([hash, *tips.values()])
+        if graph is not None:
+            contained = graph.contains(positions[0], positions[1:])
+            return [name for name, contains in zip(tips, contained) if contains]
+        return [name for name, tip in tips.items() if self.is_ancestor(hash, tip)]
 
     def tag(self, name: str) -> None:
         """
         Create a tag with the specified name.
         """
         self('tag', name)
+        self._changed()
+
+    def ref_transaction(self) -> RefTransaction:
+        """
+        Return a :class:`RefTransaction` for creating, updating and deleting
+        many references at once, using a single git process. For example:
+
+        .. code-block:: python
+
+            with git.ref_transaction() as refs:
+                for name, commit in releases.items():
+                    refs.create(f'refs/tags/{name}', commit)
+        """
+        return RefTransaction(self)
 
     def tags(self) -> List[str]:
         """
         Return a list of tags in this repo.
         """
-        return self('tag').split()
+        refs = self._read_refs('refs/tags/')
+        if refs is not None:
+            return [ref.name[len('refs/tags/'):] for ref in refs]
+        return list(self.stream('tag'))
 
-    def tag_hashes(self) -> Dict[str, str]:
+    def tag_hashes(self, short: bool = True) -> Dict[str, str]:
         """
         Return a mapping of tag name to commit hash.
+
+        :param short: Return short hashes instead of full 40-character hashes.
         """
-        return {tag: self.rev_parse(tag) for tag in self.tags()}
+        return self._ref_hashes('refs/tags/', short)
 
     def branch(self, name: str) -> None:
         """
         Create and checkout a branch with the specified name.
         """
         self('checkout', '-b', name)
+        self._changed()
 
     def branches(self) -> List[str]:
         """
         Return a list of branches in this repo.
         """
-        return self('for-each-ref', '--format', '%(refname:short)', 'refs/heads/').split()
+        refs = self._read_refs('refs/heads/')
+        if refs is not None:
+            return [ref.name[len('refs/heads/'):] for ref in refs]
+        return list(self.stream('for-each-ref', '--format', '%(refname:short)', 'refs/heads/'))
 
-    def branch_hashes(self) -> Dict[str, str]:
+    def branch_hashes(self, short: bool = True) -> Dict[str, str]:
         """
         Return a mapping of branch name to commit hash.
+
+        :param short: Return short hashes instead of full 40-character hashes.
+        """
+        return self._ref_hashes('refs/heads/', short)
+
+    def refs(self, *patterns: str, short: bool = True) -> List[Ref]:
         """
-        return {branch: self.rev_parse(branch) for branch in self.branches()}
+        Return a list of :class:`~giterator.objects.Ref` instances, sorted by
+        name, for the references in this repo. This takes a single
+        ``git for-each-ref`` call, however many references there are.
+
+        :param patterns: If supplied, only references matching at least one
+          of these patterns, such as ``refs/tags/``, are returned.
+        :param short: Return short hashes instead of full 40-character hashes.
+        """
+        return self._parse_refs(self.stream(*self._refs_command(patterns, short)))
+
+    @staticmethod
+    def _refs_command(patterns: Sequence[str], short: bool) -> List[str]:
+        objectname = 'objectname:short' if short else 'objectname'
+        format_ = f'%(refname)%00%({objectname})%00%(*{objectname})%00%(creatordate:iso-strict)'
+        return ['for-each-ref', '--format', format_, *patterns]
+
+    @classmethod
+    def _parse_refs(cls, lines: Iterable[str]) -> List[Ref]:
+        refs = []
+        for line in lines:
+            name, hash, peeled, date = line.split('\0')
+            refs.append(Ref(name, hash, peeled or None, cls._parse_date(date)))
+        return refs
+
+    def _read_refs(self, prefix: str) -> Optional[List[Ref]]:
+        # Returns None if refs can't be read natively, so git should be used.
+        if not self.native_refs:
+            return None
+        if self._ref_reader is None:
+            self._ref_reader = RefReader.for_path(self.path)
+            if self._ref_reader is None:
+                return None
+        try:
+            return self._ref_reader.refs(prefix)
+        except UnsupportedLayout:
+            return None
+
+    def _ref_hashes(self, prefix: str, short: bool) -> Dict[str, str]:
+        refs = self._read_refs(prefix)
+        if refs is None:
+            refs = self.refs(prefix, short=short)
+        elif short:
+            length = self._abbrev_length()
+            return {ref.name[len(prefix):]: self._abbreviate(ref.hash, length) for ref in refs}
+        return {ref.name[len(prefix):]: ref.hash for ref in refs}
@@ -0,0 +1,332 @@
+"""
+Answering ancestry queries from a repo's commit-graph files, without running git.
+"""
+import heapq
+import mmap
+import os
+from bisect import bisect_right
+from pathlib import Path
+from struct import unpack_from
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .refs import _path_signature, find_git_dirs
+
+HASH_SIZES = {1: 20, 2: 32}
+PARENT_NONE = 0x70000000
+EXTRA_EDGES = 0x80000000
+LAST_EDGE = 0x80000000
+
+# Flags used when painting history to find merge bases:
+FIRST = 1
+SECOND = 2
+STALE = 4
+
+
+class UnsupportedGraph(Exception):
+    """
+    A commit-graph file is written in a way that :class:`CommitGraph` can't read.
+    """
+
+
+class _Layer:
+    # One commit-graph file, which may be one of a chain of split files.
+
+    def __init__(self, path: Path, base: int):
+        self.path = path
+        #: The position of this layer's first commit in the whole graph.
+        self.base = base
+        with open(path, 'rb') as source:
+            self._data = data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:5] != b'CGPH\1' or data[5] not in HASH_SIZES:
+            data.close()
+            raise UnsupportedGraph(f'{path} is not a version 1 commit-graph')
+        self.hash_size = HASH_SIZES[data[5]]
+        chunks = {}
+        for i in range(data[6] + 1):
+            start = 8 + i * 12
+            chunks[data[start:start + 4]] = unpack_from('>Q', data, start + 4)[0]
+        try:
+            self._fanout = unpack_from('>256I', data, chunks[b'OIDF'])
+            self._hashes = chunks[b'OIDL']
+            self._commits = chunks[b'CDAT']
+        except KeyError:
+            data.close()
+            raise UnsupportedGraph(f'{path} is missing required chunks') from None
+        self._edges = chunks.get(b'EDGE')
+        self.count = self._fanout[255]
+
+    def close(self) -> None:
+        self._data.close()
+
+    def find(self, hash: bytes) -> Optional[int]:
+        first = hash[0]
+        low = self._fanout[first - 1] if first else 0
+        high = self._fanout[first]
+        size = self.hash_size
+        data = self._data
+        while low < high:
+            middle = (low + high) // 2
+            start = self._hashes + middle * size
+            candidate = data[start:start + size]
+            if candidate < hash:
+                low = middle + 1
+            elif candidate > hash:
+                high = middle
+            else:
+                return self.base + middle
+        return None
+
+    def hash(self, local: int) -> str:
+        start = self._hashes + local * self.hash_size
+        return self._data[start:start + self.hash_size].hex()
+
+    def commit(self, local: int) -> Tuple[Tuple[int, ...], int, int]:
+        # The parents, generation number and commit time of a commit:
+        start = self._commits + local * (self.hash_size + 16) + self.hash_size
+        first, second, generation, time = unpack_from('>IIII', self._data, start)
+        if first == PARENT_NONE:
+            parents: Tuple[int, ...] = ()
+        elif second == PARENT_NONE:
+            parents = (first,)
+        elif second & EXTRA_EDGES:
+            octopus = [first]
+            position = self._edges + (second & ~EXTRA_EDGES) * 4
+            while True:
+                edge, = unpack_from('>I', self._data, position)
+                octopus.append(edge & ~LAST_EDGE)
+                if edge & LAST_EDGE:
+                    break
+                position += 4
+            parents = tuple(octopus)
+        else:
+            parents = (first, second)
+        return parents, generation >> 2, ((generation & 3) << 32) | time
+
+
+def _graph_paths(info: Path) -> Tuple[Path, Path]:
+    return info / 'commit-graph', info / 'commit-graphs' / 'commit-graph-chain'
+
+
+class CommitGraph:
+    """
+    Reads the commit-graph files of a repo, as written by ``git commit-graph
+    write`` or ``git gc``, to answer questions about which commits are
+    ancestors of which others. Generation numbers are used to stop walking
+    history as soon as the answer is known.
+
+    Commits are referred to by their position in the graph. Commits made
+    since the graph was written are not in it.
+
+    :param paths: The commit-graph files, with the base of any chain first.
+    """
+
+    def __init__(self, paths: Iterable[Path]):
+        self._layers: List[_Layer] = []
+        self._bases: List[int] = []
+        base = 0
+        try:
+            for path in paths:
+                layer = _Layer(path, base)
+                self._layers.append(layer)
+                self._bases.append(base)
+                base += layer.count
+        except BaseException:
+            self.close()
+            raise
+        #: The number of commits in the graph.
+        self.count = base
+
+    @staticmethod
+    def signature(path: Path) -> Optional[tuple]:
+        """
+        Return something that changes when the commit-graph files of the repo
+        at the path supplied are rewritten, or ``None`` if they can't be
+        read directly.
+        """
+        if 'GIT_OBJECT_DIRECTORY' in os.environ:
+            return None
+        dirs = find_git_dirs(path)
+        if dirs is None:
+            return None
+        common_dir = dirs[1]
+        # History is rewritten by these, which the graph doesn't know about:
+        replace = common_dir / 'refs' / 'replace'
+        if (
+            (common_dir / 'shallow').exists() or
+            (common_dir / 'info' / 'grafts').exists() or
+            (replace.is_dir() and any(replace.iterdir()))
+        ):
+            return None
+        paths = _graph_paths(common_dir / 'objects' / 'info') + (common_dir / 'packed-refs',)
+        return (common_dir,) + tuple(_path_signature(p) for p in paths)
+
+    @classmethod
+    def for_path(cls, path: Path) -> Optional['CommitGraph']:
+        """
+        Return a graph for the work tree or bare repo at the path specified,
+        or ``None`` if it doesn't have one that can be read directly.
+        """
+        signature = cls.signature(path)
+        if signature is None:
+            return None
+        common_dir = signature[0]
+        try:
+            if b'refs/replace/' in (common_dir / 'packed-refs').read_bytes():
+                return None
+        except FileNotFoundError:
+            pass
+        info = common_dir / 'objects' / 'info'
+        single, chain = _graph_paths(info)
+        if chain.exists():
+            paths = [
+                info / 'commit-graphs' / f'graph-{line.strip()}.graph'
+                for line in chain.read_text().splitlines() if line.strip()
+            ]
+        elif single.exists():
+            paths = [single]
+        else:
+            return None
+        try:
+            return cls(paths)
+        except (FileNotFoundError, ValueError, UnsupportedGraph):
+            return None
+
+    def close(self) -> None:
+        """
+        Unmap the commit-graph files.
+        """
+        for layer in self._layers:
+            layer.close()
+        self._layers = []
+
+    def position(self, hash: str) -> Optional[int]:
+        """
+        Return the position in the graph of the commit with the full hash
+        supplied, or ``None`` if it isn't in the graph.
+        """
+        try:
+            binary = bytes.fromhex(hash)
+        except ValueError:
+            return None
+        for layer in self._layers:
+            if len(binary) != layer.hash_size:
+                return None
+            position = layer.find(binary)
+            if position is not None:
+                return position
+        return None
+
+    def _layer(self, position: int) -> _Layer:
+        if len(self._layers) == 1:
+            return self._layers[0]
+        return self._layers[bisect_right(self._bases, position) - 1]
+
+    def hash(self, position: int) -> str:
+        """
+        Return the full hash of the commit at the position supplied.
+        """
+        layer = self._layer(position)
+        return layer.hash(position - layer.base)
+
+    def _commit(self, position: int) -> Tuple[Tuple[int, ...], int, int]:
+        layer = self._layer(position)
+        return layer.commit(position - layer.base)
+
+    def parents(self, position: int) -> Tuple[int, ...]:
+        """
+        Return the positions of the parents of the commit at the position supplied.
+        """
+        return self._commit(position)[0]
+
+    def generation(self, position: int) -> int:
+        """
+        Return the generation number of the commit at the position supplied,
+        which is always greater than those of its ancestors.
+        """
+        return self._commit(position)[1]
+
+    def commit_time(self, position: int) -> int:
+        """
+        Return the commit time, in seconds since the epoch, of the commit at
+        the position supplied.
+        """
+        return self._commit(position)[2]
+
+    def contains(self, commit: int, tips: Iterable[int]) -> List[bool]:
+        """
+        Return whether the commit is reachable from each of the tips supplied.
+        History is walked once for all the tips, newest generation first,
+        and only as far back as the commit's generation.
+        """
+        generation = self.generation(commit)
+        tips = list(tips)
+        # For each commit waiting to be visited, a mask of the tips it's
+        # reachable from, along with its parents:
+        waiting: Dict[int, List] = {}
+        queue = []
+
+        def add(position: int, tips_mask: int) -> None:
+            entry = waiting.get(position)
+            if entry is None:
+                parents, position_generation, _ = self._commit(position)
+                waiting[position] = [tips_mask, parents]
+                heapq.heappush(queue, (-position_generation, position))
+            else:
+                entry[0] |= tips_mask
+
+        for i, tip in enumerate(tips):
+            add(tip, 1 << i)
+        found = 0
+        while queue:
+            negative_generation, position = heapq.heappop(queue)
+            if -negative_generation < generation:
+                break
+            tips_mask, parents = waiting.pop(position)
+            if position == commit:
+                found = tips_mask
+                break
+            if -negative_generation > generation:
+                for parent in parents:
+                    add(parent, tips_mask)
+        return [bool(found >> i & 1) for i in range(len(tips))]
+
+    def is_ancestor(self, ancestor: int, descendant: int) -> bool:
+        """
+        Return whether the first commit is the second, or one of its ancestors.
+        """
+        return self.contains(ancestor, [descendant])[0]
+
+    def merge_bases(self, first: int, second: int) -> List[int]:
+        """
+        Return the best common ancestors of two commits, those that are not
+        ancestors of any other common ancestor, most recently committed first.
+        """
+        # Commits are visited newest generation first, so that by the time a
+        # commit is reached, it's known whether any merge base found reaches it:
+        flags = {first: FIRST}
+        flags[second] = flags.get(second, 0) | SECOND
+        queue = [(-self.generation(p), p) for p in flags]
+        heapq.heapify(queue)
+        not_stale = len(queue)
+        bases = []
+        while not_stale:
+            _, position = heapq.heappop(queue)
+            position_flags = flags[position]
+            if not position_flags & STALE:
+                not_stale -= 1
+            if position_flags & (FIRST | SECOND) == FIRST | SECOND and not position_flags & STALE:
+                bases.append(position)
+                position_flags |= STALE
+            for parent in self.parents(position):
+                parent_flags = flags.get(parent)
+                if parent_flags is None:
+                    flags[parent] = position_flags
+                    heapq.heappush(queue, (-self.generation(parent), parent))
+                    if not position_flags & STALE:
+                        not_stale += 1
+                elif parent_flags | position_flags != parent_flags:
+                    was_stale = parent_flags & STALE
+                    flags[parent] = parent_flags | position_flags
+                    if position_flags & STALE and not was_stale:
+                        not_stale -= 1
+        return sorted(bases, key=self.commit_time, reverse=True)
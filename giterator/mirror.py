@@ -0,0 +1,226 @@
+"""
+A cache of bare mirrors of the repos that are cloned often, so that clones
+borrow objects from a local mirror rather than copying them from the source.
+"""
+import fcntl
+import os
+import shutil
+from contextlib import contextmanager
+from hashlib import sha1
+from pathlib import Path
+from time import time
+from typing import Iterator, List, Optional, Tuple, Union
+
+from .git import Git, User
+
+
+def _directory_size(path: Path) -> int:
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class MirrorCache:
+    """
+    Keeps bare mirrors, created with ``git clone --mirror``, of sources in
+    a directory, and makes clones of those sources that borrow objects from
+    their mirrors using ``--reference``.
+
+    Mirrors are refreshed with a single fetch under a file lock, so several
+    processes can share a cache directory. When the cache grows beyond its
+    limits, the mirrors used least recently are removed.
+
+    .. warning::
+
+      A clone made without ``dissociate=True`` relies on its mirror for
+      objects, and will break if the mirror is evicted.
+
+    :param directory: The directory in which to keep the mirrors.
+    :param max_mirrors: The maximum number of mirrors to keep.
+    :param max_size: The maximum total size, in bytes, of the mirrors kept.
+      The mirror most recently used is always kept, even if it is bigger.
+    """
+
+    def __init__(
+            self, directory: Union[Path, str], max_mirrors: int = None, max_size: int = None
+    ):
+        self.directory = Path(directory)
+        self.max_mirrors = max_mirrors
+        self.max_size = max_size
+
+    @staticmethod
+    def _key(source: Union[str, Path, Git]) -> str:
+        if isinstance(source, Git):
+            source = source.path
+        if isinstance(source, Path) or Path(source).exists():
+            return str(Path(source).absolute())
+        return source
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        name = sha1(key.encode()).hexdigest()
+        return self.directory / f'{name}.git', self.directory / f'{name}.lock'
+
+    @contextmanager
+    def _locked(self, lock: Path, operation: int) -> Iterator[None]:
+        while True:
+            with open(lock, 'a') as handle:
+                fcntl.flock(handle, operation)
+                try:
+                    # The lock file is removed when its mirror is evicted, so make
+                    # sure the one locked is still the one in use:
+                    try:
+                        current = os.fstat(handle.fileno()).st_ino == lock.stat().st_ino
+                    except FileNotFoundError:
+                        current = False
+                    if current:
+                        yield
+                        return
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def mirror(self, source: Union[str, Path, Git], refresh: bool = True) -> Git:
+        """
+        Return a :class:`~giterator.Git` for the mirror of the source, which
+        may be a local path, a :class:`~giterator.Git` or a URL. The mirror
+        is created if needed, or otherwise brought up to date unless
+        ``refresh`` is ``False``.
+
+        If several callers ask for the same mirror to be refreshed at once,
+        only one fetch is done.
+        """
+        key = self._key(source)
+        path, lock = self._paths(key)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        requested = time()
+        with self._locked(lock, fcntl.LOCK_EX):
+            git = Git(path)
+            if not path.exists():
+                try:
+                    git('clone', '--mirror', '--quiet', key, str(path), cwd=self.directory)
+                except BaseException:
+                    shutil.rmtree(path, ignore_errors=True)
+                    raise
+            elif refresh and self._fetched(path) < requested:
+                git('fetch', '--prune', '--quiet', 'origin')
+            os.utime(lock)
+        self.evict(keep=path)
+        return git
+
+    @staticmethod
+    def _fetched(path: Path) -> float:
+        # When the mirror was last brought up to date, by being created or fetched:
+        for name in 'FETCH_HEAD', 'HEAD':
+            try:
+                return (path / name).stat().st_mtime
+            except FileNotFoundError:
+                pass
+        return 0
+
+    def clone(
+            self,
+            source: Union[str, Path, Git],
+            path: Union[str, Path],
+            user: User = None,
+            *,
+            refresh: bool = True,
+            **options,
+    ) -> Git:
+        """
+        Clone the source into a new work tree at the path specified, borrowing
+        objects from its mirror, which is created or refreshed as needed.
+        The ``origin`` remote of the clone is the source, not the mirror.
+
+        :param user: The user to configure in the new repo. Defaults to the
+          source's user, if it is a :class:`~giterator.Git` with one.
+        :param refresh: Whether to bring an existing mirror up to date first.
+        :param options: Other options to pass to :meth:`Git.clone <giterator.Git.clone>`,
+          such as ``branch`` or ``dissociate``. ``reference`` can't be passed,
+          as the mirror is used.
+        """
+        if 'reference' in options:
+            raise TypeError('reference cannot be supplied, as the mirror is used')
+        if isinstance(source, Git):
+            user = user or source._user
+        key = self._key(source)
+        mirror_path, lock = self._paths(key)
+        while True:
+            self.mirror(source, refresh)
+            # Held so that the mirror is not evicted while being cloned:
+            with self._locked(lock, fcntl.LOCK_SH):
+                if mirror_path.exists():
+                    git = Git.clone(
+                        mirror_path, Path(path).absolute(), user, reference=mirror_path, **options
+                    )
+                    break
+        git('remote', 'set-url', 'origin', key)
+        return git
+
+    def _mirrors(self) -> List[Tuple[float, Path, Path]]:
+        mirrors = []
+        for lock in self.directory.glob('*.lock'):
+            path = lock.with_suffix('.git')
+            try:
+                used = lock.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if path.exists():
+                mirrors.append((used, path, lock))
+        return sorted(mirrors, reverse=True)
+
+    def evict(self, keep: Optional[Path] = None) -> List[Path]:
+        """
+        Remove the mirrors used least recently until the cache is within its
+        limits, skipping any that are in use. This is done automatically each
+        time a mirror is used.
+
+        :param keep: The path of a mirror that should not be removed.
+        :return: The paths of the mirrors removed.
+        """
+        if self.max_mirrors is None and self.max_size is None:
+            return []
+        kept = 0
+        size = 0
+        removed = []
+        for _, path, lock in self._mirrors():
+            mirror_size = _directory_size(path) if self.max_size is not None else 0
+            within_limits = (
+                (self.max_mirrors is None or kept < self.max_mirrors) and
+                (self.max_size is None or size + mirror_size <= self.max_size)
+            )
+            if path == keep or within_limits or not self._remove(path, lock):
+                kept += 1
+                size += mirror_size
+            else:
+                removed.append(path)
+        return removed
+
+    @staticmethod
+    def _remove(path: Path, lock: Path) -> bool:
+        # The lock file is not created if missing, as that means another
+        # process has already removed the mirror:
+        try:
+            handle = open(os.open(lock, os.O_RDWR), 'rb')
+        except FileNotFoundError:
+            return True
+        with handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                try:
+                    current = os.fstat(handle.fileno()).st_ino == lock.stat().st_ino
+                except FileNotFoundError:
+                    return True
+                if not current:
+                    return False
+                shutil.rmtree(path)
+                lock.unlink()
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return True
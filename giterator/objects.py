@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Optional, List, TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .git import User
+
+
+class ObjectInfo:
+    """
+    Information about an object in a git repo's object database.
+    """
+
+    __slots__ = ('hash', 'type', 'size')
+
+    def __init__(self, hash: str, type: str, size: int):
+        #: The full hash of the object.
+        self.hash = hash
+        #: The type of object: ``commit``, ``tree``, ``blob`` or ``tag``.
+        self.type = type
+        #: The size of the object's content, in bytes.
+        self.size = size
+
+    def __repr__(self):
+        return f'<{type(self).__name__}: {self.type} {self.hash}>'
+
+
+class Object(ObjectInfo):
+    """
+    An object from a git repo's object database, including its content.
+    """
+
+    __slots__ = ('content',)
+
+    def __init__(self, hash: str, type: str, size: int, content: bytes):
+        super().__init__(hash, type, size)
+        #: The raw content of the object.
+        self.content = content
+
+
+class Ref:
+    """
+    A reference, such as a branch or tag, in a git repo.
+    """
+
+    __slots__ = ('name', 'hash', 'peeled', 'date')
+
+    def __init__(
+            self,
+            name: str,
+            hash: str,
+            peeled: Optional[str] = None,
+            date: Optional[datetime] = None,
+    ):
+        #: The full name of the reference, such as ``refs/heads/main``.
+        self.name = name
+        #: The hash of the object the reference points to.
+        self.hash = hash
+        #: For annotated tags, the hash of the object the tag points to.
+        self.peeled = peeled
+        #: The date the object the reference points to was created.
+        self.date = date
+
+    def __repr__(self):
+        return f'<{type(self).__name__}: {self.name} {self.hash}>'
+
+
+class Commit:
+    """
+    A commit, as returned by :meth:`giterator.Git.log`.
+    """
+
+    __slots__ = (
+        'hash', 'parents', 'author', 'author_date', 'committer', 'commit_date', 'subject'
+    )
+
+    def __init__(
+            self,
+            hash: str,
+            parents: List[str],
+            author: 'User',
+            author_date: datetime,
+            committer: 'User',
+            commit_date: datetime,
+            subject: str,
+    ):
+        #: The full hash of the commit.
+        self.hash = hash
+        #: The full hashes of the commit's parents.
+        self.parents = parents
+        #: The :class:`~giterator.User` who authored the commit.
+        self.author = author
+        #: The date the commit was authored.
+        self.author_date = author_date
+        #: The :class:`~giterator.User` who committed the commit.
+        self.committer = committer
+        #: The date the commit was committed.
+        self.commit_date = commit_date
+        #: The first line of the commit message.
+        self.subject = subject
+
+    def __repr__(self):
+        return f'<{type(self).__name__}: {self.hash} {self.subject!r}>'
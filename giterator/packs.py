@@ -0,0 +1,511 @@
+"""
+Reading objects directly from a repo's loose object files and pack files,
+without running git.
+"""
+import mmap
+import os
+import re
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from struct import unpack_from
+from threading import Lock
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .objects import Object, ObjectInfo
+from .refs import find_git_dirs
+
+TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+OFS_DELTA = 6
+REF_DELTA = 7
+HASH_SIZES = {'sha1': 20, 'sha256': 32}
+MAX_ALTERNATE_DEPTH = 5
+# How much of a pack is handed to zlib at a time, after a first guess based
+# on the size of the object:
+CHUNK = 64 * 1024
+
+OBJECT_FORMAT = re.compile(r'^\s*objectformat\s*=\s*(\S+)', re.IGNORECASE | re.MULTILINE)
+
+
+class UnsupportedFormat(Exception):
+    """
+    An object or pack is stored in a way that :class:`ObjectStore` can't read.
+    """
+
+
+def _varint(data: bytes, position: int) -> Tuple[int, int]:
+    # The little-endian sizes at the start of a delta:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """
+    Return the content made by applying the git delta supplied to its base.
+    """
+    base_size, position = _varint(delta, 0)
+    if base_size != len(base):
+        raise UnsupportedFormat(f'Delta is for a base of {base_size} bytes, not {len(base)}')
+    size, position = _varint(delta, position)
+    source = memoryview(base)
+    result = bytearray()
+    end = len(delta)
+    while position < end:
+        op = delta[position]
+        position += 1
+        if op & 0x80:
+            offset = length = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[position] << (8 * i)
+                    position += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    length |= delta[position] << (8 * i)
+                    position += 1
+            result += source[offset:offset + (length or 0x10000)]
+        elif op:
+            result += delta[position:position + op]
+            position += op
+        else:
+            raise UnsupportedFormat('Invalid delta instruction')
+    if len(result) != size:
+        raise UnsupportedFormat(f'Delta made {len(result)} bytes, not {size}')
+    return bytes(result)
+
+
+class Pack:
+    """
+    A memory-mapped pack file and its version 2 index.
+
+    :param idx_path: The path to the ``.idx`` file, next to which the
+      ``.pack`` file must be found.
+    :param hash_size: The size, in bytes, of the repo's object hashes.
+    """
+
+    def __init__(self, idx_path: Path, hash_size: int = 20):
+        self.path = idx_path.with_suffix('.pack')
+        self.hash_size = hash_size
+        self._idx = self._map(idx_path)
+        self._pack = self._map(self.path)
+        self._view = memoryview(self._pack)
+        if self._idx[:8] != b'\377tOc\0\0\0\2':
+            self.close()
+            raise UnsupportedFormat(f'{idx_path} is not a version 2 pack index')
+        if self._pack[:4] != b'PACK' or unpack_from('>I', self._pack, 4)[0] not in (2, 3):
+            self.close()
+            raise UnsupportedFormat(f'{self.path} is not a version 2 or 3 pack')
+        self._fanout = unpack_from('>256I', self._idx, 8)
+        #: The number of objects in the pack.
+        self.count = self._fanout[255]
+        self._hashes = 8 + 256 * 4
+        self._offsets = self._hashes + self.count * (hash_size + 4)
+        self._large_offsets = self._offsets + self.count * 4
+
+    @staticmethod
+    def _map(path: Path) -> mmap.mmap:
+        with open(path, 'rb') as source:
+            return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        """
+        Unmap the files.
+        """
+        self._view.release()
+        self._pack.close()
+        self._idx.close()
+
+    def find(self, hash: bytes) -> Optional[int]:
+        """
+        Return the offset in the pack of the object with the binary hash
+        supplied, or ``None`` if it isn't in this pack.
+        """
+        first = hash[0]
+        low = self._fanout[first - 1] if first else 0
+        high = self._fanout[first]
+        size = self.hash_size
+        idx = self._idx
+        while low < high:
+            middle = (low + high) // 2
+            start = self._hashes + middle * size
+            candidate = idx[start:start + size]
+            if candidate < hash:
+                low = middle + 1
+            elif candidate > hash:
+                high = middle
+            else:
+                offset, = unpack_from('>I', idx, self._offsets + middle * 4)
+                if offset & 0x80000000:
+                    index = offset & 0x7fffffff
+                    offset, = unpack_from('>Q', idx, self._large_offsets + index * 8)
+                return offset
+        return None
+
+    def header(self, offset: int) -> Tuple[int, int, int]:
+        """
+        Return the type number and size of the entry at the offset supplied,
+        along with the offset of what follows its header.
+        """
+        data = self._pack
+        byte = data[offset]
+        offset += 1
+        kind = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = data[offset]
+            offset += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        return kind, size, offset
+
+    def delta_base(self, kind: int, offset: int, position: int) -> Tuple[object, int]:
+        """
+        Return the base of the delta entry at the offset supplied, either as
+        an offset in this pack or a binary hash, along with the position of
+        the compressed delta.
+        """
+        data = self._pack
+        if kind == REF_DELTA:
+            end = position + self.hash_size
+            return data[position:end], end
+        byte = data[position]
+        position += 1
+        distance = byte & 0x7f
+        while byte & 0x80:
+            byte = data[position]
+            position += 1
+            distance = ((distance + 1) << 7) | (byte & 0x7f)
+        return offset - distance, position
+
+    def inflate(self, position: int, size: int) -> bytes:
+        """
+        Return the decompressed data, which should be ``size`` bytes, that
+        starts at the position supplied.
+        """
+        decompressor = zlib.decompressobj()
+        # Compressed objects are rarely bigger than this, so one go is usually enough:
+        content = decompressor.decompress(self._view[position:position + size + 64])
+        if not decompressor.eof:
+            parts = [content]
+            position += size + 64
+            while not decompressor.eof:
+                chunk = self._view[position:position + CHUNK]
+                if not chunk:
+                    raise UnsupportedFormat(f'{self.path} is truncated')
+                parts.append(decompressor.decompress(chunk))
+                position += CHUNK
+            content = b''.join(parts)
+        if len(content) != size:
+            raise UnsupportedFormat(f'Expected {size} bytes in {self.path}, got {len(content)}')
+        return content
+
+    def inflate_start(self, position: int, size: int) -> bytes:
+        """
+        Return up to ``size`` bytes from the start of the decompressed data
+        that starts at the position supplied.
+        """
+        return zlib.decompressobj().decompress(self._view[position:position + size + 64], size)
+
+
+class ObjectStore:
+    """
+    Reads objects from a repo's loose object files and pack files, without
+    running git. Packs are memory-mapped, and the directory of packs is only
+    scanned again when an object can't be found. Alternate object
+    directories are also searched.
+
+    Objects made from deltas are rebuilt by applying each delta in turn to its
+    base. The bases are kept in a least-recently-used cache, as several
+    objects are often made from the same base.
+
+    :param objects: The path to the repo's objects directory.
+    :param hash_size: The size, in bytes, of the repo's object hashes.
+    :param delta_cache_size: The maximum total size, in bytes, of the delta
+      bases to keep in the cache.
+    """
+
+    def __init__(
+            self,
+            objects: Path,
+            hash_size: int = 20,
+            delta_cache_size: int = 32 * 1024 * 1024,
+            _depth: int = 0,
+    ):
+        self.objects = objects
+        self.hash_size = hash_size
+        self.delta_cache_size = delta_cache_size
+        self._depth = _depth
+        self._packs: Dict[Path, Pack] = {}
+        self._packs_signature: Optional[Tuple[str, ...]] = None
+        self._alternates: Optional[List[ObjectStore]] = None
+        self._lock = Lock()
+        self._cache: 'OrderedDict[Hashable, Tuple[str, bytes]]' = OrderedDict()
+        self._cache_bytes = 0
+
+    @classmethod
+    def for_path(cls, path: Path, **options) -> Optional['ObjectStore']:
+        """
+        Return a store for the work tree or bare repo at the path specified,
+        or ``None`` if its objects can't be read directly.
+        """
+        if 'GIT_OBJECT_DIRECTORY' in os.environ or 'GIT_ALTERNATE_OBJECT_DIRECTORIES' in os.environ:
+            return None
+        dirs = find_git_dirs(path)
+        if dirs is None:
+            return None
+        common_dir = dirs[1]
+        try:
+            config = (common_dir / 'config').read_text()
+        except (OSError, UnicodeDecodeError):
+            return None
+        match = OBJECT_FORMAT.search(config)
+        hash_size = HASH_SIZES.get(match.group(1).lower() if match else 'sha1')
+        if hash_size is None:
+            return None
+        return cls(common_dir / 'objects', hash_size, **options)
+
+    def close(self) -> None:
+        """
+        Unmap any packs and empty the cache. They will be opened again if needed.
+        """
+        with self._lock:
+            packs, self._packs, self._packs_signature = self._packs, {}, None
+            alternates, self._alternates = self._alternates, None
+            self._cache.clear()
+            self._cache_bytes = 0
+        for pack in packs.values():
+            pack.close()
+        for store in alternates or ():
+            store.close()
+
+    def _scan_packs(self) -> bool:
+        # Returns True if the packs have changed since they were last scanned.
+        try:
+            names = tuple(sorted(
+                entry.name for entry in os.scandir(self.objects / 'pack')
+                if entry.name.endswith('.idx')
+            ))
+        except FileNotFoundError:
+            names = ()
+        with self._lock:
+            if names == self._packs_signature:
+                return False
+            packs = {}
+            for name in names:
+                path = self.objects / 'pack' / name
+                pack = self._packs.get(path)
+                if pack is None:
+                    try:
+                        pack = Pack(path, self.hash_size)
+                    except (FileNotFoundError, ValueError):
+                        # Removed since being listed, or empty as it's being written:
+                        continue
+                packs[path] = pack
+            # Packs that have gone are left to be unmapped when no longer in use:
+            self._packs, self._packs_signature = packs, names
+        return True
+
+    def _find_packed(self, hash: bytes) -> Optional[Tuple[Pack, int]]:
+        for pack in list(self._packs.values()):
+            offset = pack.find(hash)
+            if offset is not None:
+                return pack, offset
+        return None
+
+    def _locate(self, hash: bytes) -> Optional[Tuple[Pack, int]]:
+        # Where an object is packed, rescanning the packs if it's not found:
+        if self._packs_signature is None:
+            self._scan_packs()
+        found = self._find_packed(hash)
+        if found is None and self._scan_packs():
+            found = self._find_packed(hash)
+        return found
+
+    def _loose(self, hash: bytes, limit: int = None) -> Optional[Tuple[str, int, bytes]]:
+        hex = hash.hex()
+        try:
+            data = (self.objects / hex[:2] / hex[2:]).read_bytes()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if limit is None:
+            content = zlib.decompress(data)
+        else:
+            content = zlib.decompressobj().decompress(data, limit)
+        header, _, body = content.partition(b'\0')
+        type_, size = header.decode().split()
+        return type_, int(size), body
+
+    def _get_alternates(self) -> List['ObjectStore']:
+        if self._alternates is None:
+            alternates = []
+            if self._depth < MAX_ALTERNATE_DEPTH:
+                try:
+                    lines = (self.objects / 'info' / 'alternates').read_text().splitlines()
+                except FileNotFoundError:
+                    lines = []
+                for line in lines:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        alternates.append(ObjectStore(
+                            self.objects / line, self.hash_size, self.delta_cache_size,
+                            self._depth + 1
+                        ))
+            self._alternates = alternates
+        return self._alternates
+
+    def _remember(self, key: Hashable, value: Tuple[str, bytes]) -> None:
+        size = len(value[1])
+        if size > self.delta_cache_size:
+            return
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return
+            self._cache[key] = value
+            self._cache_bytes += size
+            while self._cache_bytes > self.delta_cache_size:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def _cached(self, key: Hashable) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def _unpack(self, pack: Pack, offset: int) -> Tuple[str, bytes]:
+        deltas = []
+        key: Optional[Hashable] = (pack, offset)
+        while True:
+            value = self._cached(key)
+            if value is not None:
+                break
+            kind, size, position = pack.header(offset)
+            if kind in TYPES:
+                value = TYPES[kind], pack.inflate(position, size)
+                break
+            if kind not in (OFS_DELTA, REF_DELTA):
+                raise UnsupportedFormat(f'Unknown object type {kind} in {pack.path}')
+            base, position = pack.delta_base(kind, offset, position)
+            deltas.append((key, pack, position, size))
+            if kind == REF_DELTA:
+                found = self._locate(base)
+                if found is None:
+                    value = self._read(base)
+                    if value is None:
+                        raise UnsupportedFormat(f'Delta base {base.hex()} is missing')
+                    key = None
+                    break
+                pack, base = found
+            offset = base
+            key = (pack, offset)
+        type_, content = value
+        for delta_key, delta_pack, position, size in reversed(deltas):
+            if key is not None:
+                self._remember(key, value)
+            content = apply_delta(content, delta_pack.inflate(position, size))
+            key = delta_key
+            value = type_, content
+        return value
+
+    def _read(self, hash: bytes) -> Optional[Tuple[str, bytes]]:
+        found = self._locate(hash)
+        if found is not None:
+            return self._unpack(*found)
+        loose = self._loose(hash)
+        if loose is not None:
+            type_, _, content = loose
+            return type_, content
+        # it may have been packed since the packs were scanned:
+        found = self._locate(hash)
+        if found is not None:
+            return self._unpack(*found)
+        for store in self._get_alternates():
+            value = store._read(hash)
+            if value is not None:
+                return value
+        return None
+
+    def _binary(self, hash: str) -> Optional[bytes]:
+        try:
+            binary = bytes.fromhex(hash)
+        except ValueError:
+            return None
+        if len(binary) != self.hash_size:
+            return None
+        return binary
+
+    def read(self, hash: str) -> Optional[Object]:
+        """
+        Return the :class:`~giterator.objects.Object` with the full hash
+        supplied, or ``None`` if it can't be found.
+        """
+        binary = self._binary(hash)
+        if binary is None:
+            return None
+        value = self._read(binary)
+        if value is None:
+            return None
+        type_, content = value
+        return Object(hash.lower(), type_, len(content), content)
+
+    def info(self, hash: str) -> Optional[ObjectInfo]:
+        """
+        Return the :class:`~giterator.objects.ObjectInfo` for the object with
+        the full hash supplied, or ``None`` if it can't be found. This avoids
+        decompressing the object where possible.
+        """
+        binary = self._binary(hash)
+        if binary is None:
+            return None
+        value = self._info(binary)
+        if value is None:
+            return None
+        type_, size = value
+        return ObjectInfo(hash.lower(), type_, size)
+
+    def _info(self, hash: bytes) -> Optional[Tuple[str, int]]:
+        found = self._locate(hash)
+        if found is None:
+            loose = self._loose(hash, limit=64)
+            if loose is not None:
+                return loose[:2]
+            found = self._locate(hash)
+        if found is None:
+            for store in self._get_alternates():
+                value = store._info(hash)
+                if value is not None:
+                    return value
+            return None
+        pack, offset = found
+        kind, size, position = pack.header(offset)
+        if kind in (OFS_DELTA, REF_DELTA):
+            # The size of the result is at the start of the delta, but the
+            # type is that of the object at the end of the chain:
+            base, position = pack.delta_base(kind, offset, position)
+            start = pack.inflate_start(position, 20)
+            _, size_position = _varint(start, 0)
+            size, _ = _varint(start, size_position)
+            while True:
+                if kind == REF_DELTA:
+                    found = self._locate(base)
+                    if found is None:
+                        value = self._info(base)
+                        return value and (value[0], size)
+                    pack, base = found
+                offset = base
+                kind, _, position = pack.header(offset)
+                if kind not in (OFS_DELTA, REF_DELTA):
+                    break
+                base, position = pack.delta_base(kind, offset, position)
+        if kind not in TYPES:
+            raise UnsupportedFormat(f'Unknown object type {kind} in {pack.path}')
+        return TYPES[kind], size
@@ -0,0 +1,107 @@
+from concurrent.futures import (
+    Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+)
+from os import cpu_count
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from .git import Git, GitError
+
+
+class Result:
+    """
+    The outcome of calling a function on one :class:`~giterator.Git` instance
+    in a :class:`GitPool`.
+    """
+
+    __slots__ = ('git', 'value', 'error')
+
+    def __init__(self, git: Git, value: Any = None, error: Optional[GitError] = None):
+        #: The instance the function was called on.
+        self.git = git
+        #: The value returned by the function, if it succeeded.
+        self.value = value
+        #: The :class:`~giterator.git.GitError` raised by the function, if it failed.
+        self.error = error
+
+    def __repr__(self):
+        outcome = f'error={self.error!r}' if self.error else f'value={self.value!r}'
+        return f'<Result: {self.git.path} {outcome}>'
+
+
+class GitPool:
+    """
+    Calls a function on many :class:`~giterator.Git` instances at once using
+    a bounded pool of threads or processes.
+
+    Threads are usually enough, since the time is spent waiting for git. When
+    using processes, the function must be picklable, such as a module-level
+    function or :func:`operator.methodcaller`.
+
+    :param workers: The maximum number of calls in progress at once.
+      Defaults to the number of CPUs.
+    :param processes: Use a process pool rather than a thread pool.
+    """
+
+    def __init__(self, workers: int = None, processes: bool = False):
+        self.workers = workers or cpu_count() or 1
+        executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self._executor: Executor = executor_class(max_workers=self.workers)
+
+    def __enter__(self) -> 'GitPool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shut down the pool, waiting for any calls in progress to finish.
+        """
+        self._executor.shutdown()
+
+    def map(self, func: Callable[[Git], Any], repos: Iterable[Git]) -> Iterator[Result]:
+        """
+        Call the function with each of the repos, yielding a :class:`Result`
+        for each as soon as it finishes. A :class:`~giterator.git.GitError`
+        raised for one repo is recorded in its :class:`Result` rather than
+        stopping the others; any other exception is raised.
+
+        Repos are only taken from the iterable as workers become free, so it
+        can be a generator.
+        """
+        repos = iter(repos)
+        pending: Dict[Future, Git] = {}
+        try:
+            while True:
+                for git in repos:
+                    pending[self._executor.submit(func, git)] = git
+                    if len(pending) >= self.workers * 2:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    git = pending.pop(future)
+                    try:
+                        result = Result(git, value=future.result())
+                    except GitError as e:
+                        result = Result(git, error=e)
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def map_repos(
+        func: Callable[[Git], Any],
+        repos: Iterable[Git],
+        workers: int = None,
+        processes: bool = False,
+) -> Iterator[Result]:
+    """
+    Call the function with each of the repos using a new :class:`GitPool`,
+    yielding a :class:`Result` for each as soon as it finishes.
+    See :meth:`GitPool.map` for details.
+    """
+    with GitPool(workers, processes) as pool:
+        yield from pool.map(func, repos)
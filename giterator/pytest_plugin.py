@@ -0,0 +1,41 @@
+"""
+A pytest plugin providing fixtures for tests that need git repos.
+Enable it by adding this to a ``conftest.py``:
+
+.. code-block:: python
+
+    pytest_plugins = ['giterator.pytest_plugin']
+"""
+from typing import Callable, Iterator
+
+import pytest
+
+from .testing import Repo, RepoCache
+
+
+@pytest.fixture(scope='session')
+def repo_cache(tmp_path_factory) -> RepoCache:
+    """
+    A :class:`~giterator.testing.RepoCache` shared by the whole test session.
+    """
+    return RepoCache(tmp_path_factory.mktemp('giterator-repo-cache'))
+
+
+@pytest.fixture()
+def cached_repo(repo_cache: RepoCache, tmp_path_factory) -> Iterator[Callable[..., Repo]]:
+    """
+    A function that takes a builder, and optionally a key, and returns a
+    :class:`~giterator.testing.Repo` for this test that is a copy of the
+    one the builder makes. Builders are only called once per session.
+    """
+    repos = []
+
+    def cached_repo(builder: Callable[[Repo], None], key: str = None) -> Repo:
+        path = tmp_path_factory.mktemp('repo', numbered=True)
+        path.rmdir()
+        repos.append(repo_cache.repo(path, builder, key))
+        return repos[-1]
+
+    yield cached_repo
+    for repo in repos:
+        repo.close()
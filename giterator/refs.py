@@ -0,0 +1,281 @@
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Tuple, List, Hashable
+
+from .objects import Ref
+
+Signature = Tuple[int, int, int]
+
+MAX_SYMREF_DEPTH = 5
+
+# The places git looks for a ref, in order, when resolving a name:
+REF_RULES = (
+    '{}', 'refs/{}', 'refs/tags/{}', 'refs/heads/{}', 'refs/remotes/{}', 'refs/remotes/{}/HEAD'
+)
+FULL_HASH = re.compile('[0-9a-f]{40}([0-9a-f]{24})?')
+
+
+class UnsupportedLayout(Exception):
+    """
+    The refs in a repo are not stored in a way that :class:`RefReader` can read.
+    """
+
+
+def _signature(stat: os.stat_result) -> Signature:
+    # git replaces ref files by renaming, so the inode changes on each update
+    # even if the modification time is too coarse to notice:
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _path_signature(path: Path) -> Optional[Signature]:
+    try:
+        return _signature(path.stat())
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def find_git_dirs(path: Path) -> Optional[Tuple[Path, Path]]:
+    """
+    Return the git directory and common git directory for the work tree or
+    bare repo at the path specified, or ``None`` if this can't be worked out
+    without asking git.
+    """
+    if 'GIT_DIR' in os.environ or 'GIT_COMMON_DIR' in os.environ:
+        return None
+    dot_git = path / '.git'
+    if dot_git.is_dir():
+        git_dir = dot_git
+    elif dot_git.is_file():
+        content = dot_git.read_text().strip()
+        if not content.startswith('gitdir: '):
+            return None
+        git_dir = path / content[len('gitdir: '):]
+    elif (path / 'HEAD').is_file() and (path / 'objects').is_dir():
+        git_dir = path
+    else:
+        return None
+    common_dir = git_dir
+    commondir = git_dir / 'commondir'
+    if commondir.is_file():
+        common_dir = git_dir / commondir.read_text().strip()
+    return git_dir, common_dir
+
+
+class RefReader:
+    """
+    Reads the refs of a repo directly from its ``packed-refs`` and loose ref
+    files, without running git. Parsed files are cached and only read again
+    when they change.
+
+    :param common_dir: The common git directory of the repo, which is usually
+      the ``.git`` directory.
+    """
+
+    def __init__(self, common_dir: Path):
+        self.common_dir = common_dir
+        self._packed_signature: Optional[Signature] = None
+        self._packed: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._loose: Dict[str, Tuple[Signature, str]] = {}
+
+    @classmethod
+    def for_path(cls, path: Path) -> Optional['RefReader']:
+        """
+        Return a reader for the work tree or bare repo at the path specified,
+        or ``None`` if its refs can't be read directly.
+        """
+        dirs = find_git_dirs(path)
+        if dirs is None:
+            return None
+        git_dir, common_dir = dirs
+        if (common_dir / 'reftable').exists():
+            return None
+        return cls(common_dir)
+
+    def _read_packed(self) -> Dict[str, Tuple[str, Optional[str]]]:
+        path = self.common_dir / 'packed-refs'
+        try:
+            signature = _signature(path.stat())
+        except FileNotFoundError:
+            self._packed_signature, self._packed = None, {}
+            return self._packed
+        if signature != self._packed_signature:
+            packed = {}
+            name = None
+            with path.open() as source:
+                for line in source:
+                    if line.startswith('#'):
+                        continue
+                    if line.startswith('^'):
+                        if name is None:
+                            raise UnsupportedLayout(f'Unexpected peeled line in {path}')
+                        packed[name] = packed[name][0], line[1:].strip()
+                        continue
+                    hash, name = line.rstrip('\n').split(' ', 1)
+                    packed[name] = hash, None
+            self._packed_signature, self._packed = signature, packed
+        return self._packed
+
+    def _scan_loose(self, directory: Path, name: str, seen: Dict[str, str]) -> None:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            entry_name = f'{name}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                self._scan_loose(Path(entry.path), entry_name, seen)
+            elif entry.name.endswith('.lock'):
+                continue
+            else:
+                signature = _signature(entry.stat(follow_symlinks=False))
+                cached = self._loose.get(entry_name)
+                if cached is None or cached[0] != signature:
+                    with open(entry.path) as source:
+                        cached = self._loose[entry_name] = signature, source.read().strip()
+                seen[entry_name] = cached[1]
+
+    def refs(self, prefix: str = 'refs/') -> List[Ref]:
+        """
+        Return a list of :class:`~giterator.objects.Ref` instances, sorted by
+        name, for the references whose full names start with the prefix
+        supplied. Peeled hashes are only available for tags recorded in
+        ``packed-refs``, and dates are never available.
+        """
+        loose: Dict[str, str] = {}
+        self._scan_loose(self.common_dir / 'refs', 'refs', loose)
+        for name in set(self._loose) - set(loose):
+            del self._loose[name]
+        packed = self._read_packed()
+
+        def resolve(value: str, depth: int = 0) -> Optional[str]:
+            if not value.startswith('ref: '):
+                if len(value) not in (40, 64):
+                    raise UnsupportedLayout(f'Unexpected ref content: {value!r}')
+                return value
+            if depth > MAX_SYMREF_DEPTH:
+                return None
+            target = value[len('ref: '):]
+            if target in loose:
+                return resolve(loose[target], depth + 1)
+            if target in packed:
+                return packed[target][0]
+            return None
+
+        refs = []
+        for name in sorted(set(packed) | set(loose)):
+            if not name.startswith(prefix):
+                continue
+            if name in loose:
+                hash = resolve(loose[name])
+                if hash is None:
+                    # a dangling symbolic ref, which git ignores
+                    continue
+                packed_hash, peeled = packed.get(name, (None, None))
+                if packed_hash != hash:
+                    peeled = None
+            else:
+                hash, peeled = packed[name]
+            refs.append(Ref(name, hash, peeled))
+        return refs
+
+
+Dependencies = Tuple[Tuple[Path, Optional[Signature]], ...]
+
+
+class LabelCache:
+    """
+    A least-recently-used cache of what labels, such as ``HEAD`` or
+    ``v1.0~2``, resolve to. An entry is discarded when any of the files
+    that could have changed what its label resolves to, such as ``HEAD``,
+    ``packed-refs`` or a loose ref, have changed since it was stored.
+    Entries for labels that are based on a full hash never go stale.
+
+    :param size: The maximum number of entries to keep.
+    :param path: The path to the work tree or bare repo.
+    """
+
+    def __init__(self, size: int, path: Path):
+        self.size = size
+        dirs = find_git_dirs(path)
+        if dirs is not None and (dirs[1] / 'reftable').exists():
+            dirs = None
+        self._dirs = dirs
+        self._entries: 'OrderedDict[Hashable, Tuple[Dependencies, str]]' = OrderedDict()
+        self._lock = Lock()
+
+    def _ref_path(self, name: str) -> Path:
+        git_dir, common_dir = self._dirs
+        return (common_dir if name.startswith('refs/') else git_dir) / name
+
+    def dependencies(self, label: str) -> Optional[Dependencies]:
+        """
+        Return the files, and their current signatures, that could change what
+        the label supplied resolves to, or ``None`` if the label can't be cached.
+        This must be called before the label is resolved.
+        """
+        if label.startswith(':') or '@{' in label:
+            # the index, commit messages or reflogs are involved:
+            return None
+        base = re.split('[~^:]', label, 1)[0]
+        if base == '@':
+            base = 'HEAD'
+        if FULL_HASH.fullmatch(base):
+            return ()
+        if not base or self._dirs is None:
+            return None
+        paths = [self._dirs[1] / 'packed-refs']
+        for rule in REF_RULES:
+            path = self._ref_path(rule.format(base))
+            paths.append(path)
+            for _ in range(MAX_SYMREF_DEPTH):
+                try:
+                    content = path.read_text().strip()
+                except (OSError, UnicodeDecodeError):
+                    break
+                if not content.startswith('ref: '):
+                    break
+                path = self._ref_path(content[len('ref: '):])
+                paths.append(path)
+        return tuple((path, _path_signature(path)) for path in paths)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """
+        Return the value stored for the key, or ``None`` if there isn't one
+        or the files it depends on have changed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        dependencies, value = entry
+        for path, signature in dependencies:
+            if _path_signature(path) != signature:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                return None
+        return value
+
+    def set(self, key: Hashable, dependencies: Dependencies, value: str) -> None:
+        """
+        Store the value for the key, along with the dependencies returned
+        by :meth:`dependencies` before it was resolved.
+        """
+        with self._lock:
+            self._entries[key] = dependencies, value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """
+        Discard all entries except those that can never go stale.
+        """
+        with self._lock:
+            for key, (dependencies, _) in list(self._entries.items()):
+                if dependencies:
+                    del self._entries[key]
@@ -0,0 +1,185 @@
+"""
+Snapshots of a repo, including its refs, objects and work tree, in a single
+compressed archive that can be streamed.
+
+An archive is a gzip-compressed tar stream containing:
+
+- ``repo.json``: whether the repo is bare, and what ``HEAD`` points at.
+- ``config``: the repo's ``config`` file, of which only the settings
+  matching :data:`CONFIG_KEYS` are restored, since others, such as
+  ``core.hooksPath``, can cause commands to be run.
+- ``bundle``: a ``git bundle`` of all refs, if there are any.
+- ``worktree/...``: the files in the work tree that git is not ignoring,
+  whether or not they are committed.
+
+The gzip stream is made of independently compressed members so that
+compression can be spread across several CPUs.
+
+Unpacking needs :func:`tarfile.data_filter`, which was added in
+Python 3.9.17, so that an archive can't write outside the new repo.
+"""
+import gzip
+import json
+import os
+import re
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from io import BytesIO
+from os import cpu_count
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import BinaryIO, Deque, Union
+
+from .git import Git, GitError
+
+CHUNK_SIZE = 1024 * 1024
+WORKTREE = 'worktree/'
+
+#: The settings restored from the ``config`` in an archive.
+CONFIG_KEYS = re.compile(
+    r'user\.(name|email)'
+    r'|remote\..+\.(url|pushurl|fetch|push)'
+    r'|branch\..+\.(remote|merge|rebase)'
+)
+
+
+class ParallelGzipWriter:
+    """
+    A file-like object that gzip-compresses what is written to it in
+    chunks, using several threads, writing the compressed chunks in order
+    to the underlying file as they are ready.
+    """
+
+    def __init__(self, fileobj: BinaryIO, workers: int = None, chunk_size: int = CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.workers = workers or cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._pending: Deque[Future] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.chunk_size:
+            self._submit(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def _submit(self, chunk: bytes) -> None:
+        self._pending.append(self._executor.submit(gzip.compress, chunk))
+        # bound the memory used by chunks waiting to be written:
+        while len(self._pending) > self.workers * 2:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def close(self) -> None:
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self.fileobj.write(self._pending.popleft().result())
+        self._executor.shutdown()
+        self.fileobj.flush()
+
+
+def _add_bytes(archive: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    archive.addfile(info, BytesIO(data))
+
+
+def pack(git: Git, output: BinaryIO, workers: int = None, chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Write a snapshot of the repo to the output supplied.
+
+    :param workers: The number of threads to use for compression.
+      Defaults to the number of CPUs.
+    :param chunk_size: The number of bytes compressed as each gzip member.
+    """
+    bare = git('rev-parse', '--is-bare-repository').strip() == 'true'
+    try:
+        head = {'symbolic': git('symbolic-ref', '-q', 'HEAD').strip()}
+    except GitError:
+        head = {'detached': git.rev_parse('HEAD', short=False)}
+    config = Path(git.path, git('rev-parse', '--git-path', 'config').strip())
+    compressed = ParallelGzipWriter(output, workers, chunk_size)
+    with TemporaryDirectory() as tmp, tarfile.open(fileobj=compressed, mode='w|') as archive:
+        _add_bytes(archive, 'repo.json', json.dumps({'bare': bare, 'head': head}).encode())
+        archive.add(config, 'config')
+        if git('for-each-ref', '--count=1').strip():
+            bundle = Path(tmp) / 'bundle'
+            git('bundle', 'create', '--quiet', str(bundle), '--all')
+            archive.add(bundle, 'bundle')
+        if not bare:
+            command = ('ls-files', '-z', '--cached', '--others', '--exclude-standard')
+            for name in dict.fromkeys(git.stream(*command, sep='\0')):
+                path = git.path / name
+                if path.is_symlink() or path.is_file():
+                    archive.add(path, WORKTREE + name, recursive=False)
+    compressed.close()
+
+
+def _extract(archive: tarfile.TarFile, member: tarfile.TarInfo, path: Path) -> None:
+    if not member.issym():
+        archive.extract(member, path, filter='data')
+        return
+    # Git allows links to absolute paths, which the data filter refuses.
+    # The link is never followed here, but where it is written must still be
+    # within the path:
+    checked = tarfile.data_filter(tarfile.TarInfo(member.name), str(path))
+    target = path / checked.name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.symlink(member.linkname, target)
+
+
+def _restore_config(git: Git, archived: Path) -> None:
+    listing = git('config', '--file', str(archived), '--list', '-z')
+    for entry in listing.split('\0'):
+        key, _, value = entry.partition('\n')
+        if CONFIG_KEYS.fullmatch(key):
+            git('config', '--add', key, value)
+
+
+def unpack(input: BinaryIO, path: Union[Path, str]) -> Git:
+    """
+    Restore a snapshot written by :func:`pack` from the input supplied into a
+    new repo at the path specified. The index will match ``HEAD``, so any
+    changes in the work tree will show as not yet staged.
+
+    Only settings matching :data:`CONFIG_KEYS` are restored from the
+    archived config.
+    """
+    if not hasattr(tarfile, 'data_filter'):
+        raise RuntimeError('unpack needs tarfile.data_filter, added in Python 3.9.17')
+    git = Git(path)
+    git.path.mkdir(parents=True, exist_ok=True)
+    head = None
+    bare = False
+    # tarfile's own decompression stops at the end of the first gzip member:
+    with TemporaryDirectory() as tmp, gzip.GzipFile(fileobj=input, mode='rb') as decompressed, \
+            tarfile.open(fileobj=decompressed, mode='r|') as archive:
+        for member in archive:
+            if member.name == 'repo.json':
+                metadata = json.loads(archive.extractfile(member).read())
+                bare, head = metadata['bare'], metadata['head']
+                git('init', '--quiet', *(['--bare'] if bare else []))
+            elif member.name == 'config':
+                archived = Path(tmp) / 'config'
+                archived.write_bytes(archive.extractfile(member).read())
+                _restore_config(git, archived)
+            elif member.name == 'bundle':
+                _extract(archive, member, Path(tmp))
+                git('fetch', '--quiet', '--update-head-ok', str(Path(tmp) / 'bundle'),
+                    'refs/*:refs/*')
+            elif member.name.startswith(WORKTREE):
+                member.name = member.name[len(WORKTREE):]
+                _extract(archive, member, git.path)
+    if head is None:
+        raise GitError('Not a giterator snapshot: repo.json is missing')
+    if 'symbolic' in head:
+        git('symbolic-ref', 'HEAD', head['symbolic'])
+    else:
+        git('update-ref', '--no-deref', 'HEAD', head['detached'])
+    if not bare and git('for-each-ref', '--count=1').strip():
+        git('reset', '--quiet')
+    return git
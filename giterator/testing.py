@@ -1,9 +1,14 @@
+import os
+import shutil
+from copy import deepcopy
 from datetime import datetime
+from hashlib import sha1
 from pathlib import Path
-from typing import Union
+from threading import Lock
+from typing import Union, Iterable, List, Callable, Dict
 
 from .clock import Clock
-from .git import Git, User
+from .git import Git, User, CommitSpec
 from .typing import Date
 
 
@@ -12,17 +17,18 @@ class Repo(Git):
     A repo for use in automated tests.
     """
 
-    def __init__(self, path: Union[Path, str]):
-        super().__init__(path)
+    def __init__(self, path: Union[Path, str], **kw):
+        super().__init__(path, **kw)
         self._clock = Clock()
 
     @classmethod
-    def make(cls, path: Union[Path, str], user: User = None):
+    def make(cls, path: Union[Path, str], user: User = None, **kw):
         """
         Make a repo at the path specified and ensure a user is configured
         in the repo. The user can be specified.
+        Other keyword parameters are passed to :class:`~giterator.Git`.
         """
-        repo = cls(path)
+        repo = cls(path, **kw)
         repo.init(user or User(name='Giterator', email='giterator@example.com'))
         return repo
 
@@ -32,8 +38,9 @@ class Repo(Git):
         author_date: Date = None,
         commit_date: Date = None,
         short: bool = True,
+        **kw
     ) -> str:
-        return super().commit(msg, author_date, commit_date or author_date, short=short)
+        return super().commit(msg, author_date, commit_date or author_date, short=short, **kw)
 
     def commit_content(
         self,
@@ -56,3 +63,101 @@ class Repo(Git):
         if tag:
             self.tag(tag)
         return commit
+
+    def content(
+        self,
+        prefix: str,
+        dt: datetime = None,
+        *,
+        tag: str = None,
+        branch: str = None,
+    ) -> CommitSpec:
+        """
+        Return a :class:`~giterator.git.CommitSpec` for passing to
+        :meth:`import_commits` that makes the same commit as
+        :meth:`commit_content` would with these parameters.
+        """
+        return CommitSpec('a commit', {prefix: f'{prefix} content'}, dt, tag=tag, branch=branch)
+
+    def import_commits(self, commits: Iterable[CommitSpec], short: bool = True) -> List[str]:
+        """
+        Make the commits described, as :meth:`Git.import_commits` does, except
+        that commits without an author date are dated using the same sequence
+        of increasing datetimes as :meth:`commit_content`.
+        """
+        def dated():
+            for spec in commits:
+                author_date = spec.author_date or self._clock.now()
+                yield CommitSpec(
+                    spec.msg,
+                    spec.files,
+                    author_date,
+                    spec.commit_date or author_date,
+                    tag=spec.tag,
+                    branch=spec.branch,
+                )
+        return super().import_commits(dated(), short)
+
+
+def _copy_file(source: str, dest: str) -> None:
+    # Objects are never changed once written, so the copy can share them:
+    if f'{os.sep}.git{os.sep}objects{os.sep}' in source:
+        try:
+            os.link(source, dest)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, dest)
+
+
+class RepoCache:
+    """
+    Builds repos for use in automated tests once and then hands out cheap
+    copies of them. The objects of a copy are hard links to those in the
+    original, where the file system allows, while everything else is copied.
+
+    :param directory: The directory in which to keep the repos that are built.
+    """
+
+    def __init__(self, directory: Union[Path, str]):
+        self.directory = Path(directory)
+        self._templates: Dict[str, Repo] = {}
+        self._lock = Lock()
+
+    def _template(self, builder: Callable[[Repo], None], key: str) -> Repo:
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                path = self.directory / sha1(key.encode()).hexdigest()
+                with Repo.make(path) as template:
+                    builder(template)
+                self._templates[key] = template
+            return template
+
+    def repo(
+            self, path: Union[Path, str], builder: Callable[[Repo], None], key: str = None
+    ) -> Repo:
+        """
+        Return a copy, at the path specified, of the repo built by the builder.
+        The builder is called with a new :class:`Repo` the first time it, or
+        the key if given, is seen by this cache.
+
+        :param key: The key identifying the history built. Defaults to the
+          builder's module and qualified name, so must be supplied for
+          builders that don't have a unique one, such as lambdas, functions
+          defined within other functions and :func:`functools.partial` objects.
+        """
+        if key is None:
+            qualname = getattr(builder, '__qualname__', None)
+            # Lambdas and functions made by calling another function, such
+            # as closures from a factory, have names like 'make.<locals>.build':
+            if qualname is None or '<' in qualname:
+                raise TypeError(f'A key must be supplied for {builder!r}')
+            key = f'{builder.__module__}.{qualname}'
+        template = self._template(builder, key)
+        shutil.copytree(template.path, path, symlinks=True, copy_function=_copy_file)
+        repo = Repo(path)
+        repo._user = template._user
+        # carry on the sequence of datetimes from where the template left off:
+        repo._clock = deepcopy(template._clock)
+        return repo
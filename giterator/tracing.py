@@ -0,0 +1,199 @@
+"""
+Hooks for seeing which git commands are run, and how long they take.
+
+Tracers are callables that are passed a :class:`Call` each time a git
+command finishes. When no tracers are installed, the cost to each git
+command is a single check of a module-level tuple. Exceptions raised by
+tracers are logged rather than affecting the git command that was traced.
+"""
+import logging
+from contextlib import contextmanager
+from math import ceil
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+Tracer = Callable[['Call'], None]
+
+#: The installed tracers. Use :func:`add_tracer`, :func:`remove_tracer` or
+#: :func:`trace` rather than changing this directly.
+tracers: Tuple[Tracer, ...] = ()
+_lock = Lock()
+logger = logging.getLogger(__name__)
+
+
+class Call:
+    """
+    A record of a git command that has been run.
+    """
+
+    __slots__ = ('command', 'cwd', 'duration', 'returncode', 'output_size')
+
+    def __init__(
+            self,
+            command: Sequence[str],
+            cwd: Path,
+            duration: float,
+            returncode: Optional[int],
+            output_size: int,
+    ):
+        #: The command run, starting with ``git``.
+        self.command = tuple(command)
+        #: The directory the command was run in.
+        self.cwd = cwd
+        #: How long the command took, in seconds.
+        self.duration = duration
+        #: The return code of the command, or ``None`` for a request answered by
+        #: a long-running process that is still running.
+        self.returncode = returncode
+        #: The number of bytes of output the command produced.
+        self.output_size = output_size
+
+    @property
+    def subcommand(self) -> str:
+        """
+        The git subcommand run, such as ``rev-parse``, skipping any global options.
+        """
+        args = iter(self.command[1:])
+        for arg in args:
+            if arg in ('-c', '-C'):
+                next(args, None)
+            elif not arg.startswith('-'):
+                return arg
+        return ''
+
+    def __repr__(self):
+        return f'<Call: {" ".join(self.command)!r} {self.duration:.6f}s>'
+
+
+def add_tracer(tracer: Tracer) -> None:
+    """
+    Install a tracer, which will be called with a :class:`Call` each time a
+    git command finishes, in whichever thread ran it.
+    """
+    global tracers
+    with _lock:
+        tracers = tracers + (tracer,)
+
+
+def remove_tracer(tracer: Tracer) -> None:
+    """
+    Remove a tracer installed with :func:`add_tracer`.
+    """
+    global tracers
+    with _lock:
+        remaining = list(tracers)
+        remaining.remove(tracer)
+        tracers = tuple(remaining)
+
+
+@contextmanager
+def trace(tracer: Tracer = None) -> Iterator[Tracer]:
+    """
+    A context manager that installs the tracer supplied, or a new
+    :class:`Stats` if none is, for the duration of the ``with`` block.
+    """
+    if tracer is None:
+        tracer = Stats()
+    add_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        remove_tracer(tracer)
+
+
+def record(
+        command: Sequence[str],
+        cwd: Union[Path, str],
+        start: float,
+        returncode: Optional[int],
+        output_size: int,
+) -> None:
+    """
+    Pass a :class:`Call` to each installed tracer. This is used by the code
+    that runs git commands, and should only be called if :data:`tracers`
+    is not empty.
+    """
+    call = Call(command, Path(cwd), perf_counter() - start, returncode, output_size)
+    for tracer in tracers:
+        try:
+            tracer(call)
+        except Exception:
+            logger.exception('Tracer %r failed on %r', tracer, call)
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    # nearest-rank method
+    return ordered[max(ceil(len(ordered) * percent / 100), 1) - 1]
+
+
+class Summary:
+    """
+    Statistics for calls to one git subcommand, as returned by :meth:`Stats.report`.
+    """
+
+    __slots__ = ('calls', 'total', 'p50', 'p99', 'output_size')
+
+    def __init__(self, calls: int, total: float, p50: float, p99: float, output_size: int):
+        #: The number of calls made.
+        self.calls = calls
+        #: The total time taken by all the calls, in seconds.
+        self.total = total
+        #: The median time taken by a call, in seconds.
+        self.p50 = p50
+        #: The 99th percentile of the time taken by a call, in seconds.
+        self.p99 = p99
+        #: The total number of bytes of output produced.
+        self.output_size = output_size
+
+    def __repr__(self):
+        return (
+            f'<Summary: calls={self.calls} total={self.total:.6f} '
+            f'p50={self.p50:.6f} p99={self.p99:.6f}>'
+        )
+
+
+class Stats:
+    """
+    A tracer that aggregates calls by git subcommand.
+    """
+
+    def __init__(self):
+        #: All the calls recorded, in the order they finished.
+        self.calls: List[Call] = []
+        self._lock = Lock()
+
+    def __call__(self, call: Call) -> None:
+        with self._lock:
+            self.calls.append(call)
+
+    def report(self) -> Dict[str, Summary]:
+        """
+        Return a mapping of git subcommand to a :class:`Summary` of the calls
+        made to it.
+        """
+        by_subcommand: Dict[str, List[Call]] = {}
+        with self._lock:
+            for call in self.calls:
+                by_subcommand.setdefault(call.subcommand, []).append(call)
+        report = {}
+        for subcommand, calls in sorted(by_subcommand.items()):
+            durations = sorted(call.duration for call in calls)
+            report[subcommand] = Summary(
+                calls=len(calls),
+                total=sum(durations),
+                p50=_percentile(durations, 50),
+                p99=_percentile(durations, 99),
+                output_size=sum(call.output_size for call in calls),
+            )
+        return report
+
+    def __str__(self):
+        lines = [f'{"subcommand":<20} {"calls":>8} {"total":>10} {"p50":>10} {"p99":>10}']
+        for subcommand, summary in self.report().items():
+            lines.append(
+                f'{subcommand:<20} {summary.calls:>8} {summary.total:>10.4f} '
+                f'{summary.p50:>10.4f} {summary.p99:>10.4f}'
+            )
+        return '\n'.join(lines)
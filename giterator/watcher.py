@@ -0,0 +1,382 @@
+"""
+Watching the references of many repos for changes, using inotify on Linux
+and checking modification times elsewhere.
+"""
+import ctypes
+import ctypes.util
+import os
+import sys
+from pathlib import Path
+from select import select
+from struct import calcsize, unpack_from
+from time import monotonic, sleep
+from typing import Dict, List, Optional, Set, Tuple
+
+from .git import Git, GitError
+from .refs import RefReader, Signature, UnsupportedLayout, _path_signature, find_git_dirs
+
+# From <sys/inotify.h>:
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+)
+EVENT_HEADER = 'iIII'
+EVENT_HEADER_SIZE = calcsize(EVENT_HEADER)
+READ_SIZE = 64 * 1024
+
+# The only files outside refs/ whose changes matter:
+GIT_DIR_FILES = frozenset(('HEAD', 'packed-refs'))
+
+Refs = Dict[str, str]
+
+
+class RefChange:
+    """
+    A change to a reference in a repo watched by a :class:`RepoWatcher`.
+    """
+
+    __slots__ = ('name', 'old', 'new')
+
+    def __init__(self, name: str, old: Optional[str], new: Optional[str]):
+        #: The full name of the reference, such as ``refs/heads/main``, or ``HEAD``.
+        self.name = name
+        #: The full hash the reference pointed to, or ``None`` if it has been added.
+        self.old = old
+        #: The full hash the reference now points to, or ``None`` if it has been removed.
+        self.new = new
+
+    def __repr__(self):
+        return f'<{type(self).__name__}: {self.name} {self.old} -> {self.new}>'
+
+
+def diff(old: Refs, new: Refs) -> List[RefChange]:
+    """
+    Return the changes, sorted by reference name, needed to turn one mapping
+    of reference name to hash into another.
+    """
+    return [
+        RefChange(name, old.get(name), new.get(name))
+        for name in sorted(old.keys() | new.keys())
+        if old.get(name) != new.get(name)
+    ]
+
+
+class _Inotify:
+    # A minimal wrapper around Linux's inotify API, using ctypes.
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    @classmethod
+    def create(cls) -> Optional['_Inotify']:
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            return cls()
+        except (OSError, AttributeError):
+            return None
+
+    def add(self, path: str) -> Optional[int]:
+        # Returns None if the path can't be watched, such as when it's gone
+        # or the limit on the number of watches has been reached.
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        return None if wd < 0 else wd
+
+    def remove(self, wd: int) -> None:
+        self._rm_watch(self.fd, wd)
+
+    def read(self) -> List[Tuple[int, int, str]]:
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            position = 0
+            while position < len(data):
+                wd, mask, _, length = unpack_from(EVENT_HEADER, data, position)
+                position += EVENT_HEADER_SIZE
+                name = data[position:position + length].rstrip(b'\0')
+                position += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _Watched:
+    # The state kept for each repo being watched.
+
+    __slots__ = (
+        'git', 'git_dir', 'common_dir', 'reader', 'refs',
+        'polled', 'ref_dirs', 'signatures', 'wds', 'git_dir_wds', 'dirty',
+    )
+
+    def __init__(self, git: Git):
+        self.git = git
+        dirs = find_git_dirs(git.path)
+        self.reader = None if dirs is None else RefReader.for_path(git.path)
+        self.git_dir, self.common_dir = dirs if self.reader is not None else (None, None)
+        self.refs: Refs = {}
+        self.polled = False
+        self.ref_dirs: List[str] = []
+        self.signatures: List[Optional[Signature]] = []
+        self.wds: Set[int] = set()
+        self.git_dir_wds: Set[int] = set()
+        self.dirty = False
+
+    def paths(self) -> Tuple[List[str], List[str]]:
+        # The directories containing HEAD and packed-refs, and the
+        # directories under refs/:
+        git_dirs = sorted({str(self.git_dir), str(self.common_dir)})
+        ref_dirs = []
+        pending = [str(self.common_dir / 'refs')]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            ref_dirs.append(directory)
+            pending.extend(e.path for e in entries if e.is_dir(follow_symlinks=False))
+        return git_dirs, ref_dirs
+
+    def poll_signatures(self) -> List[Optional[Signature]]:
+        # Loose refs are replaced by renaming, which changes the modification
+        # time of the directory containing them, as does adding a directory:
+        paths = [self.git_dir / 'HEAD', self.common_dir / 'packed-refs']
+        paths.extend(Path(directory) for directory in self.ref_dirs)
+        return [_path_signature(path) for path in paths]
+
+    def read(self) -> Refs:
+        if self.reader is not None:
+            try:
+                refs = {ref.name: ref.hash for ref in self.reader.refs()}
+                head = (self.git_dir / 'HEAD').read_text().strip()
+            except (UnsupportedLayout, OSError):
+                pass
+            else:
+                if head.startswith('ref: '):
+                    head = refs.get(head[len('ref: '):])
+                if head:
+                    refs['HEAD'] = head
+                return refs
+        refs = {ref.name: ref.hash for ref in self.git.refs(short=False)}
+        try:
+            refs['HEAD'] = self.git('rev-parse', '--verify', '--quiet', 'HEAD').strip()
+        except GitError:
+            pass
+        return refs
+
+
+class RepoWatcher:
+    """
+    Watches the references of many repos for changes, from a single thread,
+    reporting only what has changed.
+
+    On Linux, inotify is used to be told when ``HEAD``, ``packed-refs`` or
+    anything under ``refs/`` changes, so idle repos cost nothing. Elsewhere,
+    or when the system's limit on inotify watches is reached, the
+    modification times of those files and the directories under ``refs/``
+    are checked instead, which is much cheaper than reading the refs.
+    Repos whose refs can't be read directly, such as those using reftables,
+    are asked for their refs using git on every check.
+
+    :param interval: How often, in seconds, to check repos that are polled.
+    :param inotify: Whether to use inotify where it is available.
+    """
+
+    def __init__(self, interval: float = 1.0, inotify: bool = True):
+        self.interval = interval
+        self._inotify = _Inotify.create() if inotify else None
+        self._watched: Dict[int, _Watched] = {}
+        self._by_wd: Dict[int, Set[int]] = {}
+
+    def __enter__(self) -> 'RepoWatcher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def uses_inotify(self) -> bool:
+        """
+        Whether inotify is being used.
+        """
+        return self._inotify is not None
+
+    def add(self, git: Git) -> None:
+        """
+        Start watching the repo of the :class:`~giterator.Git` instance
+        supplied. Changes are reported relative to its refs as they are now.
+        """
+        if id(git) in self._watched:
+            return
+        watched = self._watched[id(git)] = _Watched(git)
+        self._refresh(watched)
+
+    def remove(self, git: Git) -> None:
+        """
+        Stop watching the repo of the :class:`~giterator.Git` instance supplied.
+        """
+        watched = self._watched.pop(id(git))
+        for wd in watched.wds:
+            self._unwatch(id(git), wd)
+
+    def refs(self, git: Git) -> Refs:
+        """
+        Return the full hashes of the refs of a watched repo, keyed by full
+        reference name, as of the last time changes were reported.
+        """
+        return dict(self._watched[id(git)].refs)
+
+    def _unwatch(self, key: int, wd: int) -> None:
+        keys = self._by_wd.get(wd)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self._by_wd[wd]
+            self._inotify.remove(wd)
+
+    def _watch(self, key: int, watched: _Watched) -> bool:
+        # Returns False if the repo could not be completely watched.
+        git_dirs, ref_dirs = watched.paths()
+        wds = set()
+        git_dir_wds = set()
+        for path in git_dirs + ref_dirs:
+            wd = self._inotify.add(path)
+            if wd is None:
+                if os.path.isdir(path):
+                    for wd in wds - watched.wds:
+                        self._unwatch(key, wd)
+                    return False
+                # It was removed after being listed, which will be noticed later:
+                continue
+            wds.add(wd)
+            if path in git_dirs:
+                git_dir_wds.add(wd)
+            self._by_wd.setdefault(wd, set()).add(key)
+        for wd in watched.wds - wds:
+            self._unwatch(key, wd)
+        watched.wds = wds
+        watched.git_dir_wds = git_dir_wds
+        return True
+
+    def _refresh(self, watched: _Watched) -> List[RefChange]:
+        # What is read must be watched first, so that no change can be missed:
+        if watched.reader is not None:
+            if not watched.polled:
+                watched.polled = (
+                    self._inotify is None or not self._watch(id(watched.git), watched)
+                )
+                if watched.polled:
+                    for wd in watched.wds:
+                        self._unwatch(id(watched.git), wd)
+                    watched.wds = watched.git_dir_wds = set()
+            if watched.polled:
+                watched.ref_dirs = watched.paths()[1]
+                watched.signatures = watched.poll_signatures()
+        watched.dirty = False
+        refs = watched.read()
+        changes = diff(watched.refs, refs)
+        watched.refs = refs
+        return changes
+
+    def _handle_events(self) -> None:
+        for wd, mask, name in self._inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so anything may have changed:
+                for watched in self._watched.values():
+                    watched.dirty = True
+                continue
+            if mask & IN_IGNORED:
+                # The directory was removed, so its watch has gone:
+                for key in self._by_wd.pop(wd, ()):
+                    watched = self._watched[key]
+                    watched.wds.discard(wd)
+                    watched.dirty = True
+                continue
+            if name.endswith('.lock'):
+                continue
+            for key in self._by_wd.get(wd, ()):
+                watched = self._watched[key]
+                if name in GIT_DIR_FILES or wd not in watched.git_dir_wds:
+                    watched.dirty = True
+
+    def _changed(self, watched: _Watched) -> bool:
+        if watched.reader is None:
+            return True
+        if watched.polled:
+            return watched.poll_signatures() != watched.signatures
+        return watched.dirty
+
+    def check(self) -> List[Tuple[Git, List[RefChange]]]:
+        """
+        Return the changes to each watched repo whose refs have changed since
+        they were last checked, without waiting. See :meth:`poll`.
+        """
+        if self._inotify is not None:
+            self._handle_events()
+        results = []
+        for watched in list(self._watched.values()):
+            if self._changed(watched):
+                changes = self._refresh(watched)
+                if changes:
+                    results.append((watched.git, changes))
+        return results
+
+    def poll(self, timeout: float = None) -> List[Tuple[Git, List[RefChange]]]:
+        """
+        Wait until the refs of at least one watched repo have changed, and
+        return the changes to each repo that has, as pairs of the
+        :class:`~giterator.Git` instance and a list of :class:`RefChange`
+        instances sorted by reference name.
+
+        :param timeout: The longest time to wait, in seconds. If it passes
+          with no changes, an empty list is returned.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            results = self.check()
+            if results:
+                return results
+            wait = None
+            if self._inotify is None or any(
+                    watched.polled or watched.reader is None for watched in self._watched.values()
+            ):
+                wait = self.interval
+            if deadline is not None:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return results
+                wait = remaining if wait is None else min(wait, remaining)
+            if self._inotify is not None:
+                select([self._inotify.fd], [], [], wait)
+            else:
+                sleep(wait)
+
+    def close(self) -> None:
+        """
+        Stop watching all repos.
+        """
+        self._watched = {}
+        self._by_wd = {}
+        inotify, self._inotify = self._inotify, None
+        if inotify is not None:
+            inotify.close()
@@ -0,0 +1,156 @@
+"""
+A pool of checkouts of one repo, made with ``git worktree``, that share its
+object store and are reused rather than being made afresh for each job.
+"""
+import shutil
+from contextlib import contextmanager
+from itertools import count
+from pathlib import Path
+from threading import Condition, Lock
+from typing import Dict, Iterator, List, Union
+
+from .git import Git, GitError
+
+
+class WorktreePool:
+    """
+    Keeps up to ``size`` work trees of a repo, made with ``git worktree add``,
+    which are leased out at a particular revision and then returned to the
+    pool once cleaned. Leasing from a pool is thread-safe.
+
+    Each work tree has a detached ``HEAD``. The :class:`~giterator.Git` leased
+    should not be closed by the caller, as its long-running processes are
+    reused by whoever leases it next.
+
+    :param git: The repo whose object store the work trees share.
+    :param directory: The directory in which to create the work trees.
+    :param size: The maximum number of work trees.
+    """
+
+    def __init__(self, git: Git, directory: Union[Path, str], size: int = 4):
+        self.git = git
+        self.directory = Path(directory).absolute()
+        self.size = size
+        self._condition = Condition()
+        self._idle: List[Git] = []
+        self._leased: Dict[int, Git] = {}
+        self._adding = 0
+        self._names = count()
+        # Adding and removing work trees both change the repo's worktree metadata:
+        self._worktree_lock = Lock()
+
+    def __enter__(self) -> 'WorktreePool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def lease(self, revision: str = 'HEAD', timeout: float = None) -> Git:
+        """
+        Return a :class:`~giterator.Git` for a clean work tree with the
+        revision supplied checked out. If all the work trees are leased,
+        wait for one to be returned.
+
+        :param revision: Anything understood by ``git rev-parse`` that refers
+          to a commit, resolved in the pool's repo.
+        :param timeout: The maximum time, in seconds, to wait for a work tree.
+          :class:`TimeoutError` is raised if none becomes free in time.
+        """
+        commit = self.git.rev_parse(f'{revision}^{{commit}}', short=False)
+        with self._condition:
+            if not self._condition.wait_for(self._available, timeout):
+                raise TimeoutError(f'No work tree available after {timeout}s')
+            if self._idle:
+                worktree = self._idle.pop()
+                self._leased[id(worktree)] = worktree
+            else:
+                worktree = None
+                self._adding += 1
+        try:
+            if worktree is None:
+                added = self._add(commit)
+            else:
+                worktree('checkout', '--quiet', '--detach', '--force', commit)
+        except BaseException:
+            with self._condition:
+                if worktree is None:
+                    self._adding -= 1
+                else:
+                    del self._leased[id(worktree)]
+                self._condition.notify()
+            if worktree is not None:
+                self._remove(worktree)
+            raise
+        if worktree is None:
+            worktree = added
+            with self._condition:
+                self._adding -= 1
+                self._leased[id(worktree)] = worktree
+        return worktree
+
+    def _available(self) -> bool:
+        total = len(self._idle) + len(self._leased) + self._adding
+        return bool(self._idle) or total < self.size
+
+    def _add(self, commit: str) -> Git:
+        with self._worktree_lock:
+            while True:
+                path = self.directory / f'worktree-{next(self._names)}'
+                if not path.exists():
+                    break
+            self.git('worktree', 'add', '--quiet', '--detach', str(path), commit)
+        return Git(path)
+
+    def _remove(self, worktree: Git) -> None:
+        worktree.close()
+        with self._worktree_lock:
+            try:
+                self.git('worktree', 'remove', '--force', str(worktree.path))
+            except GitError:
+                shutil.rmtree(worktree.path, ignore_errors=True)
+                self.git('worktree', 'prune')
+
+    def release(self, worktree: Git) -> None:
+        """
+        Return a work tree leased from this pool. Any changes made to it,
+        including untracked and ignored files, are thrown away. If that
+        fails, the work tree is removed rather than reused.
+        """
+        with self._condition:
+            if self._leased.get(id(worktree)) is not worktree:
+                raise ValueError(f'{worktree.path} is not leased from this pool')
+        clean = False
+        try:
+            worktree('reset', '--quiet', '--hard')
+            worktree('clean', '--quiet', '-ffdx')
+            clean = True
+        except GitError:
+            self._remove(worktree)
+        finally:
+            # The slot is given back even if removing the work tree fails:
+            with self._condition:
+                del self._leased[id(worktree)]
+                if clean:
+                    self._idle.append(worktree)
+                self._condition.notify()
+
+    @contextmanager
+    def leased(self, revision: str = 'HEAD', timeout: float = None) -> Iterator[Git]:
+        """
+        A context manager that leases a work tree, as :meth:`lease` does, and
+        releases it at the end of the ``with`` block.
+        """
+        worktree = self.lease(revision, timeout)
+        try:
+            yield worktree
+        finally:
+            self.release(worktree)
+
+    def close(self) -> None:
+        """
+        Remove the work trees that are not currently leased.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for worktree in idle:
+            self._remove(worktree)
@@ -34,6 +34,7 @@ setup(
             'sybil',
             'testfixtures',
         ],
+        benchmark=['pytest', 'pytest-benchmark'],
         build=['furo', 'sphinx', 'setuptools-git', 'twine', 'wheel']
     ),
     entry_points={
@@ -8,6 +8,9 @@ from giterator import Git, User
 from giterator.testing import Repo
 
 
+pytest_plugins = ['giterator.pytest_plugin']
+
+
 # Enable coverage for subprocesses (CLI tests)
 os.environ.setdefault('COVERAGE_PROCESS_START', str(Path(__file__).parent.parent / '.coveragerc'))
 
@@ -20,11 +23,12 @@ def tmpdir():
 
 @pytest.fixture()
 def git(tmpdir: TempDirectory):
-    git_ = Git(Path(tmpdir.path) / 'git')
-    git_.init(User(name='Giterator', email='giterator@example.com'))
-    return git_
+    with Git(Path(tmpdir.path) / 'git') as git_:
+        git_.init(User(name='Giterator', email='giterator@example.com'))
+        yield git_
 
 
 @pytest.fixture()
 def repo(tmpdir: TempDirectory):
-    return Repo.make(Path(tmpdir.path) / 'repo')
+    with Repo.make(Path(tmpdir.path) / 'repo') as repo_:
+        yield repo_
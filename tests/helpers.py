@@ -0,0 +1,36 @@
+from typing import Dict
+
+from giterator.testing import Repo
+
+
+def merge(repo: Repo, *branches: str) -> str:
+    repo('merge', '--quiet', '--no-edit', '--no-ff', *branches)
+    return repo.rev_parse('HEAD', short=False)
+
+
+def make_history(repo: Repo) -> Dict[str, str]:
+    """
+    Make a criss-cross merge, an octopus merge and an unrelated root,
+    returning the full hashes of the commits by name.
+    """
+    commits = {'a': repo.commit_content('a', short=False)}
+    repo.branch('side')
+    commits['c'] = repo.commit_content('c', short=False)
+    repo('checkout', '--quiet', 'master')
+    commits['b'] = repo.commit_content('b', short=False)
+    commits['m1'] = merge(repo, commits['c'])
+    repo('checkout', '--quiet', 'side')
+    commits['m2'] = merge(repo, commits['b'])
+    commits['e'] = repo.commit_content('e', short=False)
+    repo('checkout', '--quiet', 'master')
+    commits['d'] = repo.commit_content('d', short=False)
+    for name in 'xyz':
+        repo('checkout', '--quiet', '-b', name, commits['d'])
+        commits[name] = repo.commit_content(name, short=False)
+    repo('checkout', '--quiet', 'master')
+    commits['octopus'] = merge(repo, 'x', 'y', 'z')
+    repo('checkout', '--quiet', '--orphan', 'unrelated')
+    repo('rm', '-r', '--quiet', '--cached', '.')
+    commits['root'] = repo.commit_content('root', short=False)
+    repo('checkout', '--quiet', '--force', 'master')
+    return commits
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime
+
+from testfixtures import compare, ShouldRaise, TempDirectory, Replacer
+
+from giterator import User
+from giterator.aio import AsyncGit
+from giterator.git import GitError
+from giterator.testing import Repo
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestAsyncGit:
+
+    def test_bad_command(self, repo: Repo):
+        with ShouldRaise(GitError) as s:
+            run(AsyncGit(repo.path)('wut'))
+        assert str(s.raised).startswith("'git wut' gave return code 1:")
+        assert "git: 'wut' is not a git command" in str(s.raised)
+
+    def test_init_with_user(self, tmpdir: TempDirectory):
+        run(AsyncGit(tmpdir.getpath('foo/bar')).init(User(name='Foo Bar', email='foo@example.com')))
+        config = tmpdir.read('foo/bar/.git/config')
+        assert b'name = Foo Bar' in config
+        assert b'email = foo@example.com' in config
+
+    def test_clone(self, repo: Repo, tmpdir: TempDirectory):
+        hash = repo.commit_content('a')
+
+        async def clone():
+            git = await AsyncGit.clone(repo, tmpdir.getpath('clone'))
+            return await git.rev_parse('HEAD'), await git('config', 'user.name')
+
+        compare(run(clone()), expected=(hash, 'Giterator\n'))
+
+    def test_clone_options(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        hash = repo.commit_content('b')
+
+        async def clone():
+            git = await AsyncGit.clone(repo, tmpdir.getpath('clone'), depth=1, filter='blob:none')
+            return (
+                await git('log', '--format=%h'),
+                await git('config', 'remote.origin.partialclonefilter'),
+                await git('config', 'user.name'),
+            )
+
+        compare(run(clone()), expected=(f'{hash}\n', 'blob:none\n', 'Giterator\n'))
+
+    def test_commit(self, repo: Repo):
+        git = AsyncGit(repo.path)
+        (repo.path / 'a').write_text('a content')
+
+        async def commit():
+            return await git.commit('a commit', datetime(2001, 1, 1, 10), datetime(2001, 1, 1, 10))
+
+        compare(run(commit()), expected='5ee580a')
+        compare(repo.rev_parse('HEAD'), expected='5ee580a')
+
+    def test_rev_parse(self, repo: Repo):
+        repo.commit_content('a', datetime(2001, 1, 1, 10))
+        git = AsyncGit(repo.path)
+        compare(run(git.rev_parse('HEAD')), expected='5ee580a')
+        compare(run(git.rev_parse('HEAD', short=False)),
+                expected='5ee580aba98816af22cfa4e76ddf96bb3994964b')
+
+    def test_tags_and_branches(self, repo: Repo):
+        git = AsyncGit(repo.path)
+
+        async def make():
+            (repo.path / 'a').write_text('content')
+            a = await git.commit('a')
+            await git.tag('a-tag')
+            await git.branch('b-branch')
+            return a
+
+        a = run(make())
+        compare(run(git.tags()), expected=['a-tag'])
+        compare(run(git.branches()), expected=['b-branch', 'master'])
+        compare(run(git.tag_hashes()), expected={'a-tag': a})
+        compare(run(git.branch_hashes()), expected={'b-branch': a, 'master': a})
+        compare([r.name for r in run(git.refs('refs/tags/'))], expected=['refs/tags/a-tag'])
+
+    def test_concurrency_limit(self, repo: Repo):
+        repo.commit_content('a')
+        running = 0
+        most = 0
+        create_subprocess_exec = asyncio.create_subprocess_exec
+
+        async def counting(*args, **kw):
+            nonlocal running, most
+            running += 1
+            most = max(most, running)
+            await asyncio.sleep(0.01)
+            process = await create_subprocess_exec(*args, **kw)
+            communicate = process.communicate
+
+            async def done():
+                nonlocal running
+                result = await communicate()
+                running -= 1
+                return result
+
+            process.communicate = done
+            return process
+
+        async def many():
+            semaphore = asyncio.Semaphore(3)
+            gits = [AsyncGit(repo.path, semaphore=semaphore) for _ in range(10)]
+            return await asyncio.gather(*(git.rev_parse('HEAD') for git in gits))
+
+        with Replacer() as replace:
+            replace('asyncio.create_subprocess_exec', counting)
+            results = run(many())
+        compare(len(set(results)), expected=1)
+        compare(most, expected=3)
+
+    def test_default_limit(self, repo: Repo):
+        repo.commit_content('a')
+
+        async def check():
+            git = AsyncGit(repo.path)
+            semaphore = git._get_semaphore()
+            assert AsyncGit(repo.path)._get_semaphore() is semaphore
+            await git.rev_parse('HEAD')
+            return semaphore._value
+
+        compare(run(check()), expected=AsyncGit.default_limit)
@@ -0,0 +1,173 @@
+import json
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+
+from testfixtures import compare, ShouldRaise, Replacer
+
+from giterator import Git, User
+from giterator.batch import jsonable, run_batch
+from giterator.objects import Ref
+from giterator.testing import Repo
+
+
+def batch(*operations, jobs=None):
+    lines = [op if isinstance(op, str) else json.dumps(op) for op in operations]
+    output = StringIO()
+    failed = run_batch(lines, output, jobs)
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    return failed, sorted(results, key=lambda result: str(result['id']))
+
+
+class CountingGit(Git):
+
+    instances = []
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.instances.append(self)
+        self.closed = 0
+
+    def close(self) -> None:
+        self.closed += 1
+        super().close()
+
+
+class TestRunBatch:
+
+    def setup_method(self):
+        CountingGit.instances = []
+
+    def test_results(self, repo: Repo):
+        hash = repo.commit_content('a', tag='a-tag')
+        path = str(repo.path)
+        failed, results = batch(
+            {'repo': path, 'method': 'rev_parse', 'args': ['HEAD']},
+            {'repo': path, 'method': 'rev_parse', 'args': ['HEAD'], 'kwargs': {'short': False}},
+            {'repo': path, 'method': 'tag_hashes'},
+            {'repo': path, 'method': 'git', 'args': ['ls-files']},
+        )
+        compare(failed, expected=0)
+        compare(results, expected=[
+            {'id': 1, 'result': hash},
+            {'id': 2, 'result': repo.rev_parse('HEAD', short=False)},
+            {'id': 3, 'result': {'a-tag': hash}},
+            {'id': 4, 'result': 'a\n'},
+        ])
+
+    def test_same_repo_in_order(self, repo: Repo):
+        repo.commit_content('a')
+        path = str(repo.path)
+        operations = []
+        for i in range(10):
+            operations.append({'id': f'tag-{i}', 'repo': path, 'method': 'tag', 'args': [f't{i}']})
+            operations.append({'id': f'tags-{i}', 'repo': path, 'method': 'tags'})
+        failed, results = batch(*operations, jobs=4)
+        compare(failed, expected=0)
+        tags = {result['id']: result['result'] for result in results}
+        for i in range(10):
+            compare(len(tags[f'tags-{i}']), expected=i + 1)
+
+    def test_many_repos_one_git_each(self, tmpdir):
+        repos = [Repo.make(Path(tmpdir.getpath(f'repo{i}'))) for i in range(3)]
+        hashes = [repo.commit_content('a') for repo in repos]
+        operations = [
+            {'id': [i, j], 'repo': str(repo.path), 'method': 'rev_parse', 'args': ['HEAD']}
+            for j in range(5) for i, repo in enumerate(repos)
+        ]
+        with Replacer() as replace:
+            replace('giterator.batch.Git', CountingGit)
+            failed, results = batch(*operations, jobs=2)
+        compare(failed, expected=0)
+        compare(len(results), expected=15)
+        for result in results:
+            compare(result['result'], expected=hashes[result['id'][0]])
+        compare(sorted(git.path for git in CountingGit.instances),
+                expected=[repo.path for repo in repos])
+        for repo in repos:
+            repo.close()
+
+    def test_paths_normalised(self, repo: Repo):
+        hash = repo.commit_content('a')
+        paths = [str(repo.path), f'{repo.path}/', f'{repo.path}/../{repo.path.name}']
+        with Replacer() as replace:
+            replace('giterator.batch.Git', CountingGit)
+            failed, results = batch(
+                *({'repo': path, 'method': 'rev_parse', 'args': ['HEAD']} for path in paths)
+            )
+        compare(failed, expected=0)
+        compare([result['result'] for result in results], expected=[hash] * 3)
+        compare([(git.path, git.closed) for git in CountingGit.instances],
+                expected=[(repo.path, 1)])
+
+    def test_clone(self, repo: Repo, tmpdir):
+        repo.commit_content('a')
+        with Replacer() as replace:
+            replace('giterator.batch.Git', CountingGit)
+            failed, results = batch(
+                {'repo': str(repo.path), 'method': 'clone',
+                 'args': [str(repo.path), tmpdir.getpath('clone')]},
+                {'repo': str(repo.path), 'method': 'ref_transaction'},
+            )
+        compare(failed, expected=1)
+        compare(results[0], expected={'id': 1, 'result': tmpdir.getpath('clone')})
+        # Private state isn't written out:
+        error = results[1]['error']
+        assert error.startswith('TypeError: Cannot convert <giterator.git.RefTransaction'), error
+        compare([git.closed for git in CountingGit.instances], expected=[1, 1])
+
+    def test_errors(self, repo: Repo):
+        repo.commit_content('a')
+        path = str(repo.path)
+        failed, results = batch(
+            'not json',
+            '[]',
+            '',
+            {'id': 'no-method', 'repo': path},
+            {'id': 'bad-args', 'repo': path, 'method': 'tags', 'args': 'x'},
+            {'id': 'private', 'repo': path, 'method': '_processes'},
+            {'id': 'missing', 'repo': path, 'method': 'nope'},
+            {'id': 'git', 'repo': path, 'method': 'rev_parse', 'args': ['nothere']},
+            {'id': 'type', 'repo': path, 'method': 'tags', 'args': [1]},
+            {'id': 'ok', 'repo': path, 'method': 'tags'},
+        )
+        compare(failed, expected=8)
+        outcomes = {result['id']: result.get('error', result.get('result')) for result in results}
+        assert outcomes.pop('type').startswith('TypeError: '), outcomes
+        compare(outcomes, expected={
+            1: 'Invalid JSON: Expecting value: line 1 column 1 (char 0)',
+            2: 'Operation must be a JSON object',
+            'no-method': "'method' must be a string",
+            'bad-args': "'args' must be a list and 'kwargs' an object",
+            'private': "ValueError: '_processes' is not a method that can be called",
+            'missing': "ValueError: 'nope' is not a method that can be called",
+            'git': "Could not resolve 'nothere'",
+            'ok': [],
+        })
+
+
+class TestJsonable:
+
+    def test_scalars(self):
+        compare(jsonable(None), expected=None)
+        compare(jsonable(1), expected=1)
+        compare(jsonable(b'\xffa'), expected='�a')
+        compare(jsonable(Path('a/b')), expected='a/b')
+        compare(jsonable(datetime(2001, 1, 1, tzinfo=timezone.utc)),
+                expected='2001-01-01T00:00:00+00:00')
+
+    def test_containers(self):
+        compare(jsonable({1: (b'a', iter([Path('b')]))}), expected={'1': ['a', ['b']]})
+
+    def test_objects(self):
+        compare(jsonable(Ref('refs/tags/a', 'abc')),
+                expected={'name': 'refs/tags/a', 'hash': 'abc', 'peeled': None, 'date': None})
+        compare(jsonable(User('Foo', 'foo@example.com')),
+                expected={'name': 'Foo', 'email': 'foo@example.com'})
+
+    def test_git(self, repo: Repo):
+        compare(jsonable(repo), expected=str(repo.path))
+
+    def test_not_convertible(self):
+        with ShouldRaise(TypeError('Cannot convert 1j to JSON')):
+            jsonable(1j)
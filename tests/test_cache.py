@@ -0,0 +1,207 @@
+import sqlite3
+import sys
+from pathlib import Path
+from subprocess import Popen, PIPE
+
+from testfixtures import compare, Replacer, ShouldRaise, TempDirectory
+
+from giterator.cache import CommandCache, DIRECTORY, cacheable
+from giterator.git import GitError
+from giterator.testing import Repo
+from giterator.tracing import trace
+
+A = 'a' * 40
+B = 'b' * 40
+
+
+class TestCacheable:
+
+    def test_cacheable(self):
+        for command in (
+            ('ls-tree', '-r', A),
+            ('ls-tree', A, 'some/path'),
+            ('show', '--no-notes', f'{A}:some/path'),
+            ('show', '--no-notes', '--stat', A),
+            ('diff', A, B),
+            ('diff', f'{A}..{B}', '--', 'path'),
+            ('diff', '--stat', A, B, '--', 'path'),
+            ('diff-tree', '-r', A),
+            ('cat-file', '-p', A),
+            ('cat-file', 'blob', A),
+            ('show', '--no-notes', 'c' * 64),
+        ):
+            assert cacheable(command), command
+
+    def test_not_cacheable(self):
+        for command in (
+            (),
+            ('log', A),
+            ('show', 'HEAD'),
+            ('show', A[:7]),
+            ('show', A, 'path'),
+            ('ls-tree', 'master'),
+            ('diff', A),
+            ('diff', A, '--', 'path'),
+            ('diff', '--cached', A, B),
+            ('diff', '--no-index', A, B),
+            ('show', '--output=file', A),
+            ('diff', f'{A}..HEAD'),
+            ('cat-file', 'something', A),
+            ('cat-file', '--batch'),
+            ('show', Path(A)),
+            ('show', A),
+            ('show', '--no-notes', '--notes=other', A),
+            ('diff', '--show-notes', A, B),
+        ):
+            assert not cacheable(command), command
+
+
+class TestCommandCache:
+
+    def test_round_trip(self, tmpdir: TempDirectory):
+        path = Path(tmpdir.getpath('cache/commands.sqlite'))
+        cache = CommandCache(path, max_size=1000)
+        compare(cache.get(('show', A)), expected=None)
+        cache.set(('show', A), 'output')
+        compare(cache.get(('show', A)), expected='output')
+        compare(cache.size(), expected=len(f'show\0{A}output'))
+        cache.close()
+        # It persists:
+        cache = CommandCache(path, max_size=1000)
+        compare(cache.get(('show', A)), expected='output')
+        cache.set(('show', A), 'output')
+        compare(cache.size(), expected=len(f'show\0{A}output'))
+        cache.clear()
+        compare(cache.get(('show', A)), expected=None)
+        compare(cache.size(), expected=0)
+
+    def test_least_recently_used_evicted(self, tmpdir: TempDirectory):
+        cache = CommandCache(Path(tmpdir.getpath('commands.sqlite')), max_size=200)
+        with Replacer() as replace:
+            replace('giterator.cache.time', lambda: 1000)
+            for i in range(3):
+                cache.set(('show', f'{i}' * 40), 'x' * 10)
+            replace('giterator.cache.time', lambda: 2000)
+            # This is used, so it is kept:
+            compare(cache.get(('show', '0' * 40)), expected='x' * 10)
+            cache.set(('show', '3' * 40), 'x' * 10)
+        # Entries are evicted until there's room for some more:
+        compare(cache.size(), expected=55 * 2)
+        compare(cache.get(('show', '0' * 40)), expected='x' * 10)
+        compare(cache.get(('show', '1' * 40)), expected=None)
+        compare(cache.get(('show', '2' * 40)), expected=None)
+        compare(cache.get(('show', '3' * 40)), expected='x' * 10)
+        # Too big to store at all:
+        cache.set(('show', '4' * 40), 'x' * 200)
+        compare(cache.get(('show', '4' * 40)), expected=None)
+
+    def test_shared_between_processes(self, tmpdir: TempDirectory):
+        path = Path(tmpdir.getpath('commands.sqlite'))
+        cache = CommandCache(path, max_size=1_000_000)
+        script = (
+            'import sys\n'
+            'from pathlib import Path\n'
+            'from giterator.cache import CommandCache\n'
+            'cache = CommandCache(Path(sys.argv[1]), 1_000_000)\n'
+            'for i in range(100):\n'
+            '    cache.set(("show", sys.argv[2] + str(i)), "output")\n'
+        )
+        processes = [
+            Popen([sys.executable, '-c', script, str(path), name], stderr=PIPE) for name in 'abcd'
+        ]
+        for process in processes:
+            compare(process.communicate()[1], expected=b'')
+        connection = sqlite3.connect(str(path))
+        count, = connection.execute('SELECT COUNT(*) FROM outputs').fetchone()
+        compare(count, expected=400)
+        compare(cache.size(), expected=sum(
+            len(f'show\0{name}{i}output') for name in 'abcd' for i in range(100)
+        ))
+
+    def test_for_path(self, repo: Repo, tmpdir: TempDirectory):
+        cache = CommandCache.for_path(repo.path, 1000)
+        compare(cache.path, expected=repo.path / '.git' / DIRECTORY / 'commands.sqlite')
+        compare(CommandCache.for_path(Path(tmpdir.getpath('nothing')), 1000), expected=None)
+
+    def test_unusable(self, tmpdir: TempDirectory):
+        tmpdir.write('commands.sqlite', b'not a database' * 100)
+        compare(CommandCache.for_path(Path(tmpdir.path), 1000), expected=None)
+        with Replacer() as replace:
+            replace.in_environ('GIT_DIR', tmpdir.path)
+            compare(CommandCache.for_path(Path(tmpdir.path), 1000), expected=None)
+        cache = CommandCache(Path(tmpdir.getpath('ok.sqlite')), 1000)
+        cache.set(('show', A), 'output')
+        # Another process holding the lock doesn't cause failures:
+        blocker = sqlite3.connect(tmpdir.getpath('ok.sqlite'), isolation_level=None)
+        blocker.execute('BEGIN EXCLUSIVE')
+        with Replacer() as replace:
+            replace('giterator.cache.time', lambda: 10 ** 10)
+            compare(cache.get(('show', A)), expected=None)
+            cache.set(('show', B), 'output')
+        blocker.execute('ROLLBACK')
+        compare(cache.get(('show', B)), expected=None)
+
+
+class TestGitCommandCache:
+
+    def test_hits_run_no_git(self, repo: Repo):
+        commit = repo.commit_content('a', short=False)
+        with Repo(repo.path, command_cache=1_000_000) as cached:
+            expected = repo('ls-tree', '-r', commit)
+            compare(cached('ls-tree', '-r', commit), expected=expected)
+            with trace() as stats:
+                compare(cached('ls-tree', '-r', commit), expected=expected)
+            compare(stats.calls, expected=[])
+        # Another instance, such as in a later job, uses what was cached:
+        with Repo(repo.path, command_cache=1_000_000) as cached:
+            with trace() as stats:
+                compare(cached('ls-tree', '-r', commit), expected=expected)
+            compare(stats.calls, expected=[])
+        assert (repo.path / '.git' / DIRECTORY / 'commands.sqlite').exists()
+
+    def test_mutable_commands_not_cached(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        with Repo(repo.path, command_cache=1_000_000) as cached:
+            compare(cached('show', '--format=%H', '-s', 'HEAD'), expected=f'{a}\n')
+            b = repo.commit_content('b', short=False)
+            compare(cached('show', '--format=%H', '-s', 'HEAD'), expected=f'{b}\n')
+        assert not (repo.path / '.git' / DIRECTORY).exists()
+
+    def test_failures_not_cached(self, repo: Repo):
+        commit = repo.commit_content('a', short=False)
+        with Repo(repo.path, command_cache=1_000_000) as cached:
+            for _ in range(2):
+                with trace() as stats:
+                    with ShouldRaise(GitError):
+                        cached('show', f'{commit}:missing')
+                compare(len(stats.calls), expected=1)
+
+    def test_notes(self, repo: Repo):
+        commit = repo.commit_content('a', short=False)
+        with Repo(repo.path, command_cache=1_000_000) as cached:
+            compare(cached('show', '-s', '--format=%N', commit), expected='\n')
+            repo('notes', 'add', '-m', 'A NOTE', commit)
+            compare(cached('show', '-s', '--format=%N', commit), expected='A NOTE\n\n')
+
+    def test_replace_refs(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        b = repo.commit_content('b', short=False)
+        with Repo(repo.path, command_cache=1_000_000) as cached:
+            original = cached('cat-file', '-p', a)
+            compare(cached('cat-file', '-p', a), expected=original)
+            repo('replace', a, b)
+            replaced = repo('cat-file', '-p', b)
+            for _ in range(2):
+                with trace() as stats:
+                    compare(cached('cat-file', '-p', a), expected=replaced)
+                compare(len(stats.calls), expected=1)
+            # Still the case when the replace ref is packed:
+            repo('pack-refs', '--all')
+            with trace() as stats:
+                compare(cached('cat-file', '-p', a), expected=replaced)
+            compare(len(stats.calls), expected=1)
+
+    def test_not_enabled(self, repo: Repo):
+        commit = repo.commit_content('a', short=False)
+        repo('ls-tree', commit)
+        assert not (repo.path / '.git' / DIRECTORY).exists()
@@ -1,8 +1,12 @@
+import json
 import subprocess
 import sys
 
 import pytest
-from testfixtures import compare
+from testfixtures import compare, TempDirectory
+
+from giterator import Git
+from giterator.testing import Repo
 
 
 @pytest.fixture()
@@ -24,14 +28,91 @@ class TestCLI:
         compare(result.returncode, expected=2, suffix=result.stdout)
         assert 'error: the following arguments are required: command' in result.stdout
 
-    def test_pack(self, run):
-        # stub for coverage
+    def test_pack_requires_args(self, run):
         result = run('pack')
+        compare(result.returncode, expected=2, suffix=result.stdout)
+        assert 'error: the following arguments are required: repo, archive' in result.stdout
+
+    def test_pack_and_unpack(self, run, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a', tag='a-tag')
+        (repo.path / 'a').write_text('changed')
+        archive = tmpdir.getpath('repo.tgz')
+        result = run(f'pack {repo.path} {archive} --jobs 2')
         compare(result.returncode, expected=0, suffix=result.stdout)
         assert not result.stdout
-
-    def test_unpack(self, run):
-        # stub for coverage
-        result = run('pack')
+        result = run(f'unpack {archive} {tmpdir.getpath("copy")}')
         compare(result.returncode, expected=0, suffix=result.stdout)
         assert not result.stdout
+        copy = Git(tmpdir.getpath('copy'))
+        compare(copy.tag_hashes(), expected=repo.tag_hashes())
+        compare(copy('status', '--porcelain'), expected=' M a\n')
+        copy.close()
+
+    def test_pack_and_unpack_through_pipe(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        packer = subprocess.Popen(
+            [sys.executable, '-m', 'giterator', 'pack', str(repo.path), '-'],
+            stdout=subprocess.PIPE
+        )
+        unpacker = subprocess.run(
+            [sys.executable, '-m', 'giterator', 'unpack', '-', tmpdir.getpath('copy')],
+            stdin=packer.stdout
+        )
+        packer.stdout.close()
+        compare(packer.wait(), expected=0)
+        compare(unpacker.returncode, expected=0)
+        compare(Git(tmpdir.getpath('copy')).rev_parse('HEAD'), expected=repo.rev_parse('HEAD'))
+
+    def test_unpack_not_a_snapshot(self, run, tmpdir: TempDirectory):
+        archive = tmpdir.write('bad.tgz', b'')
+        result = run(f'unpack {archive} {tmpdir.getpath("copy")}')
+        compare(result.returncode, expected=1, suffix=result.stdout)
+
+    def test_help_lists_commands(self, run):
+        result = run('--help')
+        compare(result.returncode, expected=0, suffix=result.stdout)
+        usage = 'usage: giterator [-h] {pack,unpack,batch} ...'
+        assert result.stdout.startswith(usage), result.stdout
+
+    def test_batch(self, repo: Repo):
+        hash = repo.commit_content('a')
+        operations = '\n'.join([
+            json.dumps({'repo': str(repo.path), 'method': 'rev_parse', 'args': ['HEAD']}),
+            json.dumps({'repo': str(repo.path), 'method': 'rev_parse', 'args': ['nothere']}),
+        ])
+        result = subprocess.run(
+            [sys.executable, '-m', 'giterator', 'batch', '--jobs', '2'],
+            input=operations, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        compare(result.returncode, expected=1, suffix=result.stdout)
+        compare(sorted(result.stdout.splitlines()), expected=[
+            '{"id": 1, "result": "%s"}' % hash,
+            '{"id": 2, "error": "Could not resolve \'nothere\'"}',
+        ])
+
+
+# The total time, in microseconds, that `giterator --help` may spend
+# importing giterator's own modules, including what they import:
+IMPORT_BUDGET = 30_000
+
+
+class TestStartup:
+
+    def test_help_import_time(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-m', 'giterator', '--help'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, errors='replace'
+        )
+        compare(result.returncode, expected=0, suffix=result.stderr)
+        imported = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and not line.endswith('package'):
+                _, cumulative, name = line[len('import time:'):].split('|')
+                if not name.startswith('  '):
+                    imported[name.strip()] = int(cumulative)
+        compare(
+            [name for name in imported if name.startswith('giterator')],
+            expected=['giterator', 'giterator.cli'],
+        )
+        total = sum(time for name, time in imported.items() if name.startswith('giterator'))
+        assert total < IMPORT_BUDGET, f'{total}us spent importing giterator'
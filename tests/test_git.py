@@ -1,11 +1,17 @@
 import os
+from collections import Counter
 from datetime import datetime, timezone
+from subprocess import Popen, check_output
+from unittest.mock import Mock
 
-from testfixtures import TempDirectory, compare, ShouldRaise
+from testfixtures import TempDirectory, compare, ShouldRaise, Replacer
 
 from giterator import Git, User
-from giterator.git import GitError
+from giterator.git import GitError, CommitSpec, _approximate_object_count
+from giterator.objects import ObjectInfo, Ref, Commit
 from giterator.testing import Repo
+from giterator.tracing import trace
+from .helpers import make_history
 
 
 class TestCall:
@@ -72,6 +78,85 @@ class TestClone:
             ' 1 file changed, 1 insertion(+)\n'
         ))
 
+    def test_depth(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        b = repo.commit_content('b')
+        with Git.clone(repo, tmpdir.getpath('clone'), depth=1) as git:
+            compare(git('rev-parse', '--is-shallow-repository'), expected='true\n')
+            compare(git('log', '--format=%h').split(), expected=[b])
+            compare(git('config', 'user.name'), expected='Giterator\n')
+
+    def test_depth_all_branches(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        repo.commit_content('b', branch='other')
+        with Git.clone(repo, tmpdir.getpath('clone'), depth=1, single_branch=False) as git:
+            compare(git('branch', '-r', '--format=%(refname:short)').split(),
+                    expected=['origin/HEAD', 'origin/master', 'origin/other'])
+
+    def test_filter(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        (repo.path / 'a').write_text('new content')
+        repo.commit('b')
+        with Git.clone(repo, tmpdir.getpath('clone'), filter='blob:none') as git:
+            compare(git('config', 'remote.origin.promisor'), expected='true\n')
+            missing = git('rev-list', '--objects', '--all', '--missing=print').split()
+            # the old content of a, which is not checked out, was not fetched:
+            compare([m for m in missing if m.startswith('?')],
+                    expected=['?' + repo.object_info('HEAD~:a').hash])
+            # missing objects can be fetched:
+            compare(git('show', 'HEAD~:a'), expected='a content')
+            compare(git('config', 'user.name'), expected='Giterator\n')
+
+    def test_single_branch(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        b = repo.commit_content('b', branch='other')
+        repo('checkout', '--quiet', 'master')
+        with Git.clone(repo, tmpdir.getpath('clone'), single_branch=True, branch='other') as git:
+            compare(git('branch', '-r', '--format=%(refname:short)').split(),
+                    expected=['origin/other'])
+            compare(git.rev_parse('HEAD'), expected=b)
+
+    def test_reference(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        cache = Git.clone(repo, tmpdir.getpath('cache'))
+        with Git.clone(repo, tmpdir.getpath('clone'), reference=cache) as git:
+            compare((git.path / '.git' / 'objects' / 'info' / 'alternates').read_text(),
+                    expected=f"{cache.path / '.git' / 'objects'}\n")
+            compare(git('config', 'user.name'), expected='Giterator\n')
+
+    def test_reference_dissociate(self, repo: Repo, tmpdir: TempDirectory):
+        a = repo.commit_content('a')
+        cache = Git.clone(repo, tmpdir.getpath('cache'))
+        with Git.clone(repo, 'clone', reference=cache.path, dissociate=True) as git:
+            assert not (git.path / '.git' / 'objects' / 'info' / 'alternates').exists()
+            compare(git.rev_parse('HEAD'), expected=a)
+
+    def test_shared(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        with Git.clone(repo, tmpdir.getpath('clone'), shared=True) as git:
+            compare((git.path / '.git' / 'objects' / 'info' / 'alternates').read_text(),
+                    expected=f"{repo.path / '.git' / 'objects'}\n")
+            compare(git('config', 'user.name'), expected='Giterator\n')
+
+    def test_shared_with_other_options(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        b = repo.commit_content('b', short=False)
+        objects = repo.path / '.git' / 'objects'
+        with Git.clone(repo, tmpdir.getpath('reference')) as reference:
+            for name, options in (
+                ('depth', dict(depth=1)),
+                ('filter', dict(filter='blob:none')),
+                ('reference', dict(reference=reference)),
+            ):
+                with Git.clone(repo, f'clone-{name}', shared=True, **options) as git:
+                    alternates = (git.path / '.git' / 'objects' / 'info' / 'alternates')
+                    assert f'{objects}\n' in alternates.read_text(), name
+                    # No objects were copied:
+                    compare(git('count-objects', '-v').split('\n')[2], expected='in-pack: 0')
+                    compare(git.rev_parse('HEAD', short=False), expected=b)
+                    if name == 'depth':
+                        compare(git('rev-list', 'HEAD'), expected=f'{b}\n')
+
 
 class TestCommit:
 
@@ -145,6 +230,263 @@ class TestCommit:
                 expected='2001-01-01T10:00:00+00:00 2001-01-01T10:00:00+00:00\n')
 
 
+def files_changed(git: Git, label: str = 'HEAD') -> str:
+    return git('show', '--format=%s', '--name-status', label)
+
+
+def commit_file(repo: Repo, path: str) -> None:
+    (repo.path / path).parent.mkdir(parents=True, exist_ok=True)
+    repo.commit_content(path)
+
+
+class TestCommitPaths:
+
+    def test_paths(self, git: Git):
+        (git.path / 'a').write_text('a content')
+        (git.path / 'b').write_text('b content')
+        git.commit('commit 1', paths=['a'])
+        compare(files_changed(git), expected='commit 1\n\nA\ta\n')
+        compare(git('status', '--short'), expected='?? b\n')
+
+    def test_includes_staged(self, git: Git):
+        (git.path / 'a').write_text('a content')
+        (git.path / 'b').write_text('b content')
+        git('add', 'b')
+        git.commit('commit 1', paths=['a'])
+        compare(files_changed(git), expected='commit 1\n\nA\ta\nA\tb\n')
+
+    def test_deleted_and_special_characters(self, repo: Repo):
+        repo.commit_content('*')
+        repo.commit_content('a')
+        (repo.path / '*').unlink()
+        repo.commit('commit', paths=['*'])
+        compare(files_changed(repo), expected='commit\n\nD\t*\n')
+        compare(repo('status', '--short'), expected='')
+
+    def test_dates(self, git: Git):
+        (git.path / 'a').write_text('content')
+        git.commit('commit', datetime(2000, 1, 1), datetime(2000, 1, 2), paths=['a'])
+        compare(git('log', '--format=%ad|%cd'),
+                expected='Sat Jan 1 00:00:00 2000 +0000|Sun Jan 2 00:00:00 2000 +0000\n')
+
+    def test_hash_returned(self, repo: Repo):
+        (repo.path / 'a').write_text('content')
+        compare(repo.commit('commit', paths=['a']), expected=repo.rev_parse('HEAD'))
+        (repo.path / 'a').write_text('new content')
+        compare(repo.commit('commit', paths=['a'], short=False),
+                expected=repo.rev_parse('HEAD', short=False))
+
+    def test_reflog(self, repo: Repo):
+        repo.commit_content('a')
+        (repo.path / 'a').write_text('new content')
+        repo.commit('a message', paths=['a'])
+        compare(repo('reflog', '-1', '--format=%gs'), expected='commit: a message\n')
+
+    def test_nothing_to_commit(self, repo: Repo):
+        repo.commit_content('a')
+        with ShouldRaise(GitError('nothing to commit')):
+            repo.commit('commit', paths=['a'])
+
+    def test_index_needs_paths(self, repo: Repo):
+        with ShouldRaise(ValueError('paths must be supplied when index is False')):
+            repo.commit('commit', index=False)
+
+
+class TestCommitWithoutIndex:
+
+    def test_from_empty(self, git: Git):
+        (git.path / 'a').write_text('content')
+        git.commit('a commit', paths=['a'], index=False)
+        compare(files_changed(git), expected='a commit\n\nA\ta\n')
+        compare(git('status', '--short'), expected='')
+
+    def test_changes(self, repo: Repo):
+        repo.commit_content('a')
+        commit_file(repo, 'dir/b')
+        commit_file(repo, 'dir/sub/c')
+        (repo.path / 'a').write_text('new content')
+        (repo.path / 'dir' / 'b').unlink()
+        (repo.path / 'dir' / 'new').write_text('new content')
+        (repo.path / 'other').mkdir()
+        (repo.path / 'other' / 'd').write_text('d content')
+        repo.commit('commit', paths=['a', 'dir/b', 'dir/new', 'other/d'], index=False)
+        compare(files_changed(repo), expected=(
+            'commit\n\nM\ta\nD\tdir/b\nA\tdir/new\nA\tother/d\n'
+        ))
+        compare(repo('status', '--short'), expected='')
+
+    def test_tree_removed(self, repo: Repo):
+        repo.commit_content('a')
+        commit_file(repo, 'dir/sub/b')
+        (repo.path / 'dir' / 'sub' / 'b').unlink()
+        repo.commit('commit', paths=['dir/sub/b'], index=False)
+        compare(repo('ls-tree', '-r', '-t', '--name-only', 'HEAD'), expected='a\n')
+        compare(repo('status', '--short'), expected='')
+
+    def test_directory_removed(self, repo: Repo):
+        repo.commit_content('a')
+        commit_file(repo, 'dir/b')
+        commit_file(repo, 'dir/c')
+        (repo.path / 'dir' / 'b').unlink()
+        (repo.path / 'dir' / 'c').unlink()
+        (repo.path / 'dir').rmdir()
+        repo.commit('commit', paths=['dir'], index=False)
+        compare(files_changed(repo), expected='commit\n\nD\tdir/b\nD\tdir/c\n')
+        compare(repo('status', '--short'), expected='')
+
+    def test_file_replaces_directory(self, repo: Repo):
+        commit_file(repo, 'a/b')
+        (repo.path / 'a' / 'b').unlink()
+        (repo.path / 'a').rmdir()
+        (repo.path / 'a').write_text('a content')
+        repo.commit('commit', paths=['a/b', 'a'], index=False)
+        compare(files_changed(repo), expected='commit\n\nA\ta\nD\ta/b\n')
+
+    def test_modes(self, repo: Repo):
+        repo.commit_content('a')
+        script = repo.path / 'script'
+        script.write_text('#!/bin/sh\n')
+        script.chmod(0o755)
+        (repo.path / 'link').symlink_to('a')
+        repo.commit('commit', paths=['script', 'link'], index=False)
+        compare(repo('ls-tree', 'HEAD', 'script', 'link').split('\n'), expected=[
+            f"120000 blob {repo.object_info('HEAD:link').hash}\tlink",
+            f"100755 blob {repo.object_info('HEAD:script').hash}\tscript",
+            '',
+        ])
+        compare(repo.read_object('HEAD:link').content, expected=b'a')
+        compare(repo('status', '--short'), expected='')
+
+    def test_staged_changes_left_alone(self, repo: Repo):
+        repo.commit_content('a')
+        (repo.path / 'a').write_text('new content')
+        (repo.path / 'b').write_text('b content')
+        repo('add', 'b')
+        repo.commit('commit', paths=['a'], index=False)
+        compare(files_changed(repo), expected='commit\n\nM\ta\n')
+        compare(repo('status', '--short'), expected='A  b\n')
+
+    def test_no_work_tree_scan(self, repo: Repo):
+        repo.commit_content('a')
+        (repo.path / 'a').write_text('new content')
+        with trace() as stats:
+            repo.commit('commit', paths=['a'], index=False)
+        assert not {'add', 'commit', 'status', 'write-tree'} & {
+            call.subcommand for call in stats.calls
+        }, stats.calls
+
+    def test_dates(self, git: Git):
+        (git.path / 'a').write_text('content')
+        git.commit('commit', datetime(2000, 1, 1), datetime(2000, 1, 2), paths=['a'], index=False)
+        compare(git('log', '--format=%ad|%cd'),
+                expected='Sat Jan 1 00:00:00 2000 +0000|Sun Jan 2 00:00:00 2000 +0000\n')
+
+    def test_same_as_index(self, tmpdir: TempDirectory):
+        hashes = []
+        for index in True, False:
+            with Repo.make(tmpdir.getpath(str(index))) as repo:
+                repo.commit_content('a')
+                commit_file(repo, 'dir/b')
+                (repo.path / 'dir' / 'b').write_text('new content')
+                (repo.path / 'dir' / 'c').write_text('c content')
+                hashes.append(repo.commit(
+                    'commit', repo._clock.now(), paths=['dir/b', 'dir/c'], index=index
+                ))
+        compare(hashes[1], expected=hashes[0])
+
+    def test_not_a_file(self, repo: Repo):
+        repo.commit_content('a')
+        (repo.path / 'dir').mkdir()
+        with ShouldRaise(GitError("'dir' is not a file")):
+            repo.commit('commit', paths=['dir'], index=False)
+
+    def test_nothing_to_commit(self, repo: Repo):
+        repo.commit_content('a')
+        with ShouldRaise(GitError('nothing to commit')):
+            repo.commit('commit', paths=['a', 'missing'], index=False)
+
+
+class TestWriteCommit:
+
+    def test_bare(self, tmpdir: TempDirectory):
+        with Git(tmpdir.getpath('bare')) as git:
+            git.init(User(name='Giterator', email='giterator@example.com'))
+            git('config', 'core.bare', 'true')
+            git.write_commit('first', {'a': 'a content', 'dir/b': b'b content'})
+            git.write_commit('second', {'a': None, 'dir/c': 'c content'})
+            compare(git('log', '--format=%s', '--name-status'), expected=(
+                'second\n\nD\ta\nA\tdir/c\n'
+                'first\n\nA\ta\nA\tdir/b\n'
+            ))
+            compare(git.read_object('HEAD:dir/b').content, expected=b'b content')
+
+    def test_work_tree_untouched(self, repo: Repo):
+        a = repo.commit_content('a')
+        b = repo.write_commit('commit', {'b': 'b content'})
+        compare(repo.rev_parse('HEAD'), expected=b)
+        compare(repo.rev_parse('HEAD^'), expected=a)
+        assert not (repo.path / 'b').exists()
+        compare(repo('status', '--short'), expected='D  b\n')
+
+    def test_same_as_commit(self, tmpdir: TempDirectory):
+        dt = datetime(2001, 1, 1, 10)
+        with Repo.make(tmpdir.getpath('commit')) as repo:
+            repo.commit_content('a', dt)
+            expected = repo.commit_content('b', dt)
+        with Repo.make(tmpdir.getpath('write')) as repo:
+            repo.write_commit('a commit', {'a': 'a content'}, dt, dt)
+            actual = repo.write_commit('a commit', {'b': 'b content'}, dt, dt)
+        compare(actual, expected=expected)
+
+    def test_binary_content_not_filtered(self, repo: Repo):
+        (repo.path / '.gitattributes').write_text('* text=auto eol=crlf\n')
+        repo.write_commit('commit', {'a': b'line\r\n\0'})
+        compare(repo.read_object('HEAD:a').content, expected=b'line\r\n\0')
+
+    def test_dates(self, repo: Repo):
+        repo.write_commit('commit', {'a': ''}, datetime(2000, 1, 1), datetime(2000, 1, 2))
+        compare(repo('log', '--format=%ad|%cd'),
+                expected='Sat Jan 1 00:00:00 2000 +0000|Sun Jan 2 00:00:00 2000 +0000\n')
+
+    def test_other_ref(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        b = repo.write_commit('b', {'b': 'b'}, parents=['HEAD'], ref='refs/heads/other',
+                              short=False)
+        compare(repo.branch_hashes(short=False), expected={'master': a, 'other': b})
+        c = repo.write_commit('c', {'c': 'c'}, ref='refs/heads/other', short=False)
+        compare(repo.rev_parse('other^', short=False), expected=b)
+        compare(repo.rev_parse('other', short=False), expected=c)
+
+    def test_merge(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        b = repo.write_commit('b', {'b': 'b'}, ref='refs/heads/b', short=False)
+        merge = repo.write_commit('merge', {'b': 'b'}, parents=['HEAD', 'b'], short=False)
+        compare(next(repo.log()).parents, expected=[a, b])
+        compare(repo.rev_parse('HEAD', short=False), expected=merge)
+
+    def test_root_commit(self, repo: Repo):
+        repo.commit_content('a')
+        repo.write_commit('root', {'b': 'b'}, parents=[], ref='refs/heads/root')
+        compare(repo('ls-tree', '--name-only', 'root'), expected='b\n')
+        compare(repo('rev-list', '--count', 'root'), expected='1\n')
+
+    def test_no_ref(self, repo: Repo):
+        a = repo.commit_content('a')
+        b = repo.write_commit('commit', {'b': 'b'}, ref=None, short=False)
+        compare(repo.rev_parse('HEAD'), expected=a)
+        compare(repo.rev_parse(b + '^'), expected=a)
+
+    def test_empty_tree(self, repo: Repo):
+        repo.commit_content('a')
+        repo.write_commit('commit', {'a': None})
+        compare(repo.object_info('HEAD^{tree}').hash,
+                expected='4b825dc642cb6eb9a060e54bf8d69288fbee4904')
+
+    def test_bad_parent(self, repo: Repo):
+        with ShouldRaise(GitError("Could not resolve 'nope^{commit}'")):
+            repo.write_commit('commit', {'a': 'a'}, parents=['nope'])
+
+
 class TestLabels:
 
     def test_rev_parse(self, repo: Repo):
@@ -191,3 +533,516 @@ class TestLabels:
         compare(repo.branch_hashes(),
                 expected={'a-branch': repo.rev_parse('a-branch'),
                           'b-branch': repo.rev_parse('b-branch')})
+
+    def test_branch_hashes_full(self, repo: Repo):
+        repo.commit_content('a', branch='a-branch')
+        compare(repo.branch_hashes(short=False),
+                expected={'a-branch': repo.rev_parse('a-branch', short=False)})
+
+    def test_tag_hashes_full(self, repo: Repo):
+        repo.commit_content('a', tag='a-tag')
+        compare(repo.tag_hashes(short=False),
+                expected={'a-tag': repo.rev_parse('a-tag', short=False)})
+
+    def test_rev_parse_missing(self, repo: Repo):
+        with ShouldRaise(GitError("Could not resolve 'nope'")):
+            repo.rev_parse('nope')
+
+    def test_rev_parse_uses_one_process(self, repo: Repo):
+        for name in 'abcde':
+            repo.commit_content(name, tag=f'{name}-tag')
+        repo.close()
+        popen = Mock(wraps=Popen)
+        check_output_ = Mock(wraps=check_output)
+        with Replacer() as replace:
+            replace('giterator.git.Popen', popen)
+            replace('giterator.git.check_output', check_output_)
+            hashes = [repo.rev_parse(tag) for tag in repo.tags()]
+        compare(hashes[0], expected=repo('rev-parse', '--short', 'a-tag').strip())
+        # listing the tags and one long-running cat-file process:
+        compare(popen.call_count, expected=2)
+        # once only, finding the abbreviation length:
+        compare(check_output_.call_count, expected=2)
+
+    def test_rev_parse_short_extends_ambiguous(self, repo: Repo, tmpdir: TempDirectory):
+        repo('config', 'core.abbrev', '4')
+        paths = [tmpdir.write(f'blobs/{i}', f'blob {i}\n') for i in range(600)]
+        hashes = repo('hash-object', '-w', *paths).split()
+        prefixes = Counter(h[:4] for h in hashes)
+        ambiguous = [h for h in hashes if prefixes[h[:4]] > 1]
+        assert ambiguous
+        for hash in ambiguous:
+            compare(repo.rev_parse(hash), expected=repo('rev-parse', '--short', hash).strip())
+            assert len(repo.rev_parse(hash)) > 4
+
+    def test_approximate_object_count(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        repo('repack', '-adq')
+        clone = Repo.clone(repo, tmpdir.getpath('clone'), shared=True)
+        clone.commit_content('b')
+        clone('repack', '-dq')
+        objects = clone.path / '.git' / 'objects'
+        # Loose objects aren't counted, but those in alternates are:
+        (clone.path / 'c').write_text('c')
+        clone('add', 'c')
+        compare(_approximate_object_count(objects), expected=6)
+        # Packs in a multi-pack-index are only counted once:
+        repo('multi-pack-index', 'write')
+        compare(_approximate_object_count(objects), expected=6)
+        repo.commit_content('d')
+        repo('repack', '-dq')
+        compare(_approximate_object_count(objects), expected=9)
+        clone.close()
+
+
+class TestAncestry:
+
+    def test_with_graph(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        criss_cross = repo('merge-base', commits['d'], commits['e']).strip()
+        with trace() as stats:
+            assert repo.is_ancestor(commits['a'], commits['octopus'])
+            assert not repo.is_ancestor(commits['e'], commits['octopus'])
+            compare(repo.merge_base(commits['d'], commits['e'], short=False),
+                    expected=criss_cross)
+            compare(repo.merge_base(commits['root'], commits['d']), expected=None)
+        compare(stats.calls, expected=[])
+        compare(repo.merge_base('x', 'y'), expected=repo.rev_parse(commits['d']))
+
+    def test_without_graph(self, repo: Repo):
+        commits = make_history(repo)
+        with trace() as stats:
+            assert repo.is_ancestor('master~1', 'master')
+            assert not repo.is_ancestor('side', 'master')
+            compare(repo.merge_base('x', 'y', short=False), expected=commits['d'])
+            compare(repo.merge_base('unrelated', 'master'), expected=None)
+        compare({call.subcommand for call in stats.calls}, expected={'merge-base', 'cat-file'})
+
+    def test_errors_not_hidden(self, repo: Repo):
+        commits = make_history(repo)
+        missing = 'f' * 40
+        for call in (lambda: repo.is_ancestor(missing, commits['d']),
+                     lambda: repo.merge_base(commits['d'], missing)):
+            with ShouldRaise(GitError) as s:
+                call()
+            compare(s.raised.returncode, expected=128)
+        # An object the history walked needs is missing:
+        a = commits['a']
+        (repo.path / '.git' / 'objects' / a[:2] / a[2:]).unlink()
+        with ShouldRaise(GitError):
+            repo.is_ancestor(commits['root'], commits['d'])
+        with ShouldRaise(GitError):
+            repo.merge_base(commits['root'], commits['d'])
+
+    def test_commits_newer_than_graph(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        new = repo.commit_content('new', short=False)
+        assert repo.is_ancestor(commits['octopus'], new)
+        compare(repo.merge_base(new, 'side~2', short=False), expected=commits['c'])
+
+    def test_graph_rewritten(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        assert repo.is_ancestor(commits['a'], 'master')
+        new = repo.commit_content('new', short=False)
+        repo('commit-graph', 'write', '--reachable')
+        with trace() as stats:
+            assert repo.is_ancestor(commits['a'], new)
+        compare(stats.calls, expected=[])
+
+    def test_branches_containing(self, repo: Repo):
+        commits = make_history(repo)
+        expected = repo('branch', '--contains', commits['d'], '--format=%(refname:short)').split()
+        compare(repo.branches_containing(commits['d']), expected=expected)
+        repo('commit-graph', 'write', '--reachable')
+        compare(repo.branches_containing(commits['d']), expected=expected)
+        compare(repo.branches_containing('side~2'), expected=['master', 'side', 'x', 'y', 'z'])
+
+    def test_branches_containing_mapping(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        branches = repo.branch_hashes()
+        compare(repo.branches_containing(commits['x'], {'x': branches['x'], 'y': branches['y']}),
+                expected=['x'])
+        with trace() as stats:
+            compare(repo.branches_containing(commits['a'], repo.branch_hashes(short=False)),
+                    expected=['master', 'side', 'x', 'y', 'z'])
+        compare({call.subcommand for call in stats.calls}, expected={'for-each-ref'})
+
+    def test_bad_label(self, repo: Repo):
+        repo.commit_content('a')
+        with ShouldRaise(GitError("Could not resolve 'nope^{commit}'")):
+            repo.is_ancestor('nope', 'HEAD')
+
+
+class TestRefs:
+
+    def test_empty(self, repo: Repo):
+        compare(repo.refs(), expected=[])
+
+    def test_refs(self, repo: Repo):
+        a = repo.commit_content('a', datetime(2001, 1, 1, 10), tag='a-tag', short=False)
+        b = repo.commit_content('b', datetime(2001, 1, 2, 10), branch='b-branch', short=False)
+        repo('tag', '-a', 'annotated', '-m', 'msg', a, env={
+            'GIT_COMMITTER_DATE': '2001-01-03T10:00:00+00:00', 'HOME': os.environ.get('HOME', '')
+        })
+        annotated = repo.rev_parse('annotated', short=False)
+        utc = timezone.utc
+        compare(repo.refs(short=False), expected=[
+            Ref('refs/heads/b-branch', b, None, datetime(2001, 1, 2, 10, tzinfo=utc)),
+            Ref('refs/heads/master', a, None, datetime(2001, 1, 1, 10, tzinfo=utc)),
+            Ref('refs/tags/a-tag', a, None, datetime(2001, 1, 1, 10, tzinfo=utc)),
+            Ref('refs/tags/annotated', annotated, a, datetime(2001, 1, 3, 10, tzinfo=utc)),
+        ])
+
+    def test_short(self, repo: Repo):
+        a = repo.commit_content('a', tag='a-tag')
+        repo('tag', '-a', 'annotated', '-m', 'msg', a)
+        compare([(r.name, r.hash, r.peeled) for r in repo.refs('refs/tags/')], expected=[
+            ('refs/tags/a-tag', a, None),
+            ('refs/tags/annotated', repo.rev_parse('annotated'), a),
+        ])
+
+    def test_patterns(self, repo: Repo):
+        repo.commit_content('a', tag='a-tag', branch='a-branch')
+        compare([r.name for r in repo.refs('refs/heads/', 'refs/tags/a-*')], expected=[
+            'refs/heads/a-branch', 'refs/tags/a-tag',
+        ])
+
+    def test_tag_and_branch_with_same_name(self, repo: Repo):
+        tag = repo.commit_content('a', tag='same')
+        branch = repo.commit_content('b', branch='same')
+        compare(repo.tag_hashes(), expected={'same': tag})
+        compare(repo.branch_hashes(), expected={'master': tag, 'same': branch})
+
+
+class TestRefTransaction:
+
+    def test_many_refs_one_process(self, repo: Repo):
+        commits = repo.import_commits(
+            [CommitSpec(f'commit {i}', {'file': str(i)}) for i in range(100)], short=False
+        )
+        with trace() as stats:
+            with repo.ref_transaction() as refs:
+                for i, commit in enumerate(commits):
+                    refs.create(f'refs/tags/release-{i}', commit)
+                refs.create('refs/heads/latest', commits[-1])
+        compare([call.command[:2] for call in stats.calls], expected=[('git', 'update-ref')])
+        compare(repo.tag_hashes(short=False), expected={
+            f'release-{i}': commit for i, commit in enumerate(commits)
+        })
+        compare(repo.branch_hashes(short=False),
+                expected={'master': commits[-1], 'latest': commits[-1]})
+
+    def test_update_and_delete(self, repo: Repo):
+        a = repo.commit_content('a', tag='old', short=False)
+        b = repo.commit_content('b', branch='other', short=False)
+        with repo.ref_transaction() as refs:
+            refs.update('refs/heads/other', a, old=b)
+            refs.update('refs/heads/new', b)
+            refs.delete('refs/tags/old', old=a)
+            refs.verify('refs/heads/master', a)
+            refs.verify('refs/tags/missing')
+        compare(repo.branch_hashes(short=False), expected={'master': a, 'new': b, 'other': a})
+        compare(repo.tags(), expected=[])
+
+    def test_old_value_mismatch(self, repo: Repo):
+        a = repo.commit_content('a', tag='a', short=False)
+        b = repo.commit_content('b', short=False)
+        with ShouldRaise(GitError) as s:
+            with repo.ref_transaction() as refs:
+                refs.create('refs/tags/b', b)
+                refs.update('refs/tags/a', b, old=b)
+        assert "'git update-ref --stdin -z' gave return code 128" in str(s.raised), s.raised
+        # Nothing was changed:
+        compare(repo.tag_hashes(short=False), expected={'a': a})
+
+    def test_create_existing(self, repo: Repo):
+        a = repo.commit_content('a', tag='a', short=False)
+        b = repo.commit_content('b', short=False)
+        refs = repo.ref_transaction()
+        refs.create('refs/tags/b', b)
+        refs.create('refs/tags/a', b)
+        with ShouldRaise(GitError):
+            refs.commit()
+        compare(repo.tag_hashes(short=False), expected={'a': a})
+        compare(len(refs), expected=0)
+
+    def test_exception_aborts(self, repo: Repo):
+        a = repo.commit_content('a')
+        with trace() as stats:
+            with ShouldRaise(ValueError('boom')):
+                with repo.ref_transaction() as refs:
+                    refs.create('refs/tags/a', a)
+                    raise ValueError('boom')
+        compare(stats.calls, expected=[])
+        compare(repo.tags(), expected=[])
+
+    def test_empty(self, repo: Repo):
+        with trace() as stats:
+            with repo.ref_transaction():
+                pass
+        compare(stats.calls, expected=[])
+
+    def test_rev_parse_cache_sees_changes(self, git: Git):
+        repo = Repo(git.path, rev_parse_cache=10)
+        a = repo.commit_content('a', tag='moving', short=False)
+        b = repo.commit_content('b', short=False)
+        compare(repo.rev_parse('moving', short=False), expected=a)
+        with repo.ref_transaction() as refs:
+            refs.update('refs/tags/moving', b, old=a)
+        compare(repo.rev_parse('moving', short=False), expected=b)
+
+
+class TestObjects:
+
+    def test_object_info(self, repo: Repo):
+        commit = repo.commit_content('a', short=False)
+        info = repo.object_info('HEAD')
+        compare(info, expected=ObjectInfo(commit, 'commit', info.size))
+
+    def test_read_object(self, repo: Repo):
+        repo.commit_content('a')
+        obj = repo.read_object('HEAD:a')
+        compare(obj.type, expected='blob')
+        compare(obj.content, expected=b'a content')
+        compare(obj.size, expected=9)
+        compare(obj.hash, expected=repo.rev_parse('HEAD:a', short=False))
+
+    def test_read_object_missing(self, repo: Repo):
+        with ShouldRaise(GitError("Could not resolve 'HEAD:nope'")):
+            repo.read_object('HEAD:nope')
+
+    def test_label_with_newline(self, repo: Repo):
+        repo.commit_content('a')
+        with ShouldRaise(GitError("Could not resolve 'HEAD\\nHEAD'")):
+            repo.object_info('HEAD\nHEAD')
+        compare(repo.object_info('HEAD').type, expected='commit')
+
+    def test_close_and_restart(self, repo: Repo):
+        repo.commit_content('a')
+        first = repo.rev_parse('HEAD')
+        repo.close()
+        compare(repo.rev_parse('HEAD'), expected=first)
+
+    def test_sees_new_commits(self, repo: Repo):
+        first = repo.commit_content('a')
+        compare(repo.rev_parse('HEAD'), expected=first)
+        second = repo.commit_content('b')
+        compare(repo.rev_parse('HEAD'), expected=second)
+
+    def test_process_not_a_repo(self, tmpdir: TempDirectory):
+        git = Git(tmpdir.path)
+        with ShouldRaise(GitError) as s:
+            git.object_info('HEAD')
+        assert str(s.raised).startswith("'git cat-file --batch-check' gave return code 128:")
+        assert 'not a git repository' in str(s.raised)
+
+    def test_native_objects(self, repo: Repo):
+        repo.commit_content('a')
+        repo('gc', '--quiet')
+        hash = repo.rev_parse('HEAD:a', short=False)
+        git = Git(repo.path, native_objects=True)
+        with trace() as stats:
+            obj = git.read_object(hash)
+            info = git.object_info(hash)
+        compare(stats.calls, expected=[])
+        compare((obj.type, obj.content), expected=('blob', b'a content'))
+        compare(info, expected=ObjectInfo(hash, 'blob', 9))
+        git.close()
+        compare(git._object_store, expected=None)
+
+    def test_native_objects_falls_back_to_git(self, repo: Repo):
+        repo.commit_content('a')
+        git = Git(repo.path, native_objects=True)
+        with trace() as stats:
+            compare(git.read_object('HEAD:a').content, expected=b'a content')
+            with ShouldRaise(GitError(f"Could not resolve '{'0' * 40}'")):
+                git.object_info('0' * 40)
+        compare([call.subcommand for call in stats.calls], expected=['cat-file', 'cat-file'])
+        git.close()
+
+
+class TestStream:
+
+    def test_lines(self, repo: Repo):
+        repo.commit_content('a')
+        repo.commit_content('b')
+        compare(list(repo.stream('ls-files')), expected=['a', 'b'])
+
+    def test_nul_separated(self, repo: Repo):
+        (repo.path / 'with\nnewline').write_text('content')
+        repo.commit('a commit')
+        compare(list(repo.stream('ls-files', '-z', sep='\0')), expected=['with\nnewline'])
+
+    def test_no_trailing_separator(self, repo: Repo):
+        repo.commit_content('a', datetime(2001, 1, 1, 10))
+        compare(list(repo.stream('log', '--format=%h', '--no-walk', '-n1', 'HEAD', sep=',')),
+                expected=['5ee580a\n'])
+
+    def test_empty(self, repo: Repo):
+        compare(list(repo.stream('tag')), expected=[])
+
+    def test_records_span_chunks(self, repo: Repo, tmpdir: TempDirectory):
+        with Replacer() as replace:
+            replace('giterator.git.STREAM_CHUNK_SIZE', 3)
+            repo.commit_content('a')
+            repo.commit_content('bbbbbbbb')
+            compare(list(repo.stream('ls-files')), expected=['a', 'bbbbbbbb'])
+
+    def test_error(self, repo: Repo):
+        output = repo.stream('log')
+        with ShouldRaise(GitError) as s:
+            next(output)
+        assert str(s.raised).startswith("'git log' gave return code 128:")
+        assert 'does not have any commits yet' in str(s.raised)
+
+    def test_stderr_not_in_records(self, repo: Repo):
+        repo.commit_content('a', branch='a-branch')
+        (repo.path / '.git' / 'refs' / 'heads' / 'broken').write_text('not a hash\n')
+        compare(repo.branches(), expected=['a-branch'])
+
+    def test_abandoned(self, repo: Repo):
+        processes = []
+
+        def popen(*args, **kw):
+            processes.append(Popen(*args, **kw))
+            return processes[-1]
+
+        for i in range(3):
+            repo.commit_content(str(i))
+        with Replacer() as replace:
+            replace('giterator.git.Popen', popen)
+            output = repo.stream('log', '--format=%H')
+            next(output)
+            output.close()
+        process, = processes
+        assert process.poll() is not None
+
+
+class TestLog:
+
+    def test_log(self, repo: Repo):
+        a = repo.commit_content('a', datetime(2001, 1, 1, 10), short=False)
+        b = repo.commit_content('b', datetime(2001, 1, 2, 10), short=False)
+
+        def user():
+            return User('Giterator', 'giterator@example.com')
+
+        utc = timezone.utc
+        compare(list(repo.log()), expected=[
+            Commit(b, [a], user(), datetime(2001, 1, 2, 10, tzinfo=utc),
+                   user(), datetime(2001, 1, 2, 10, tzinfo=utc), 'a commit'),
+            Commit(a, [], user(), datetime(2001, 1, 1, 10, tzinfo=utc),
+                   user(), datetime(2001, 1, 1, 10, tzinfo=utc), 'a commit'),
+        ])
+
+    def test_range(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        b = repo.commit_content('b', branch='feature', short=False)
+        c = repo.commit_content('c', short=False)
+        compare([c.hash for c in repo.log('master..feature')], expected=[c, b])
+        compare([c.hash for c in repo.log('master')], expected=[a])
+
+    def test_paths(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        repo.commit_content('b')
+        compare([c.hash for c in repo.log(paths=['a'])], expected=[a])
+
+    def test_max_count(self, repo: Repo):
+        repo.commit_content('a')
+        b = repo.commit_content('b', short=False)
+        compare([c.hash for c in repo.log(max_count=1)], expected=[b])
+
+    def test_merge_and_multi_line_message(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        b = repo.commit_content('b', branch='feature', short=False)
+        repo('checkout', 'master')
+        c = repo.commit_content('c', short=False)
+        repo('merge', '--no-ff', '-m', 'merge\n\nbody\nmore body', 'feature')
+        merge, *_ = repo.log()
+        compare(merge.parents, expected=[c, b])
+        compare(merge.subject, expected='merge')
+        compare([commit.parents for commit in repo.log('feature')], expected=[[a], []])
+        compare(len(list(repo.log())), expected=4)
+
+    def test_empty_repo(self, repo: Repo):
+        with ShouldRaise(GitError):
+            list(repo.log())
+
+
+class TestImportCommits:
+
+    def test_onto_existing(self, git: Git):
+        (git.path / 'a').write_text('a content')
+        first = git.commit('first', datetime(2001, 1, 1, 10))
+        hashes = git.import_commits([
+            CommitSpec('second', {'b': 'b content', 'sub/c': b'c content'},
+                       datetime(2001, 1, 2, 10)),
+            CommitSpec('third', {'a': None}, '2001-01-03T10:00:00+01:00',
+                       datetime(2001, 1, 4, 10), tag='third-tag'),
+        ], short=False)
+        compare([c.hash for c in git.log()],
+                expected=hashes[::-1] + [git.rev_parse(first, short=False)])
+        show = git('show', '--pretty=format:%s %aI %cI', '--stat', hashes[1])
+        compare(show.replace('Z', '+00:00'), expected=(
+            'third 2001-01-03T10:00:00+01:00 2001-01-04T10:00:00+00:00\n'
+            ' a | 1 -\n'
+            ' 1 file changed, 1 deletion(-)\n'
+        ))
+        compare(git.tag_hashes(short=False), expected={'third-tag': hashes[1]})
+        compare(sorted(p.name for p in git.path.iterdir()), expected=['.git', 'b', 'sub'])
+        compare(git('status', '--porcelain'), expected='')
+
+    def test_awkward_paths(self, git: Git):
+        paths = ['"q"', 'new\nline', 'back\\slash', 'tab\there', 'caf\u00e9']
+        first, second = git.import_commits([
+            CommitSpec('first', {path: path for path in paths}),
+            CommitSpec('second', {path: None for path in paths[:2]}),
+        ], short=False)
+        compare(git('ls-tree', '-z', '--name-only', first).split('\0')[:-1], expected=sorted(paths))
+        compare(git('ls-tree', '-z', '--name-only', second).split('\0')[:-1],
+                expected=sorted(paths[2:]))
+        compare(git('show', f'{first}:new\nline'), expected='new\nline')
+
+    def test_keeps_local_changes(self, git: Git):
+        (git.path / 'a').write_text('a content')
+        git.commit('first')
+        (git.path / 'a').write_text('changed')
+        (git.path / 'untracked').write_text('untracked')
+        git.import_commits([CommitSpec('second', {'b': 'b content'})])
+        compare((git.path / 'a').read_text(), expected='changed')
+        compare(git('status', '--porcelain'), expected=' M a\n?? untracked\n')
+
+    def test_bare(self, tmpdir: TempDirectory):
+        bare = Git(tmpdir.getpath('bare'))
+        bare.init(User('Foo', 'foo@example.com'))
+        bare('config', 'core.bare', 'true')
+        hash, = bare.import_commits([CommitSpec('first', {'a': 'a content'})])
+        compare(bare.rev_parse('HEAD'), expected=hash)
+        compare(next(bare.log()).author.name, expected='Foo')
+        bare.close()
+
+    def test_empty(self, git: Git):
+        compare(git.import_commits([]), expected=[])
+
+    def test_detached(self, git: Git):
+        (git.path / 'a').write_text('a content')
+        git.commit('first')
+        git('checkout', '-q', '--detach')
+        with ShouldRaise(GitError('HEAD is detached, so commits cannot be imported')):
+            git.import_commits([CommitSpec('second', {'b': 'b'})])
+
+    def test_one_fast_import_process(self, git: Git):
+        popen = Mock(wraps=Popen)
+        check_output_ = Mock(wraps=check_output)
+        with Replacer() as replace:
+            replace('giterator.git.Popen', popen)
+            replace('giterator.git.check_output', check_output_)
+            git.import_commits(
+                CommitSpec(f'commit {i}', {'file': str(i)}) for i in range(100)
+            )
+        compare(len(list(git.log())), expected=100)
+        compare(popen.call_count + check_output_.call_count < 10, expected=True)
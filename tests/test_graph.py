@@ -0,0 +1,127 @@
+from itertools import product
+from pathlib import Path
+
+from testfixtures import compare, ShouldRaise, TempDirectory
+
+from giterator.git import GitError
+from giterator.graph import CommitGraph, UnsupportedGraph
+from giterator.testing import Repo
+from .helpers import make_history, merge
+
+
+def git_is_ancestor(repo: Repo, first: str, second: str) -> bool:
+    try:
+        repo('merge-base', '--is-ancestor', first, second)
+    except GitError:
+        return False
+    return True
+
+
+def git_merge_bases(repo: Repo, first: str, second: str):
+    try:
+        return set(repo('merge-base', '--all', first, second).split())
+    except GitError:
+        return set()
+
+
+class TestCommitGraph:
+
+    def test_matches_git(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        graph = CommitGraph.for_path(repo.path)
+        compare(graph.count, expected=len(commits))
+        positions = {name: graph.position(hash) for name, hash in commits.items()}
+        for name, position in positions.items():
+            compare(graph.hash(position), expected=commits[name])
+        compare(len(graph.parents(positions['octopus'])), expected=4)
+        compare(graph.parents(positions['root']), expected=())
+        for first, second in product(commits, repeat=2):
+            compare(
+                graph.is_ancestor(positions[first], positions[second]),
+                expected=git_is_ancestor(repo, commits[first], commits[second]),
+                prefix=f'{first} in {second}'
+            )
+            compare(
+                {graph.hash(p) for p in graph.merge_bases(positions[first], positions[second])},
+                expected=git_merge_bases(repo, commits[first], commits[second]),
+                prefix=f'{first} and {second}'
+            )
+        graph.close()
+
+    def test_criss_cross(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        graph = CommitGraph.for_path(repo.path)
+        bases = graph.merge_bases(graph.position(commits['d']), graph.position(commits['e']))
+        compare([graph.hash(p) for p in bases], expected=[commits['b'], commits['c']])
+
+    def test_generations(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        graph = CommitGraph.for_path(repo.path)
+        compare(graph.generation(graph.position(commits['a'])), expected=1)
+        compare(graph.generation(graph.position(commits['m1'])), expected=3)
+        compare(graph.generation(graph.position(commits['octopus'])), expected=6)
+        commit_time = graph.commit_time(graph.position(commits['a']))
+        compare(commit_time, expected=int(repo('log', '-1', '--format=%ct', commits['a'])))
+
+    def test_contains(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable')
+        graph = CommitGraph.for_path(repo.path)
+        tips = [graph.position(commits[name]) for name in ('e', 'octopus', 'root', 'x', 'c')]
+        compare(graph.contains(graph.position(commits['c']), tips),
+                expected=[True, True, False, True, True])
+        compare(graph.contains(graph.position(commits['x']), tips),
+                expected=[False, True, False, True, False])
+
+    def test_split(self, repo: Repo):
+        commits = make_history(repo)
+        repo('commit-graph', 'write', '--reachable', '--split')
+        repo('checkout', '--quiet', 'side')
+        commits['f'] = repo.commit_content('f', short=False)
+        commits['m3'] = merge(repo, commits['octopus'])
+        repo('commit-graph', 'write', '--reachable', '--split=no-merge')
+        chain = repo.path / '.git' / 'objects' / 'info' / 'commit-graphs' / 'commit-graph-chain'
+        compare(len(chain.read_text().split()), expected=2)
+        graph = CommitGraph.for_path(repo.path)
+        compare(graph.count, expected=len(commits))
+        positions = {name: graph.position(hash) for name, hash in commits.items()}
+        for first, second in product(commits, repeat=2):
+            compare(
+                graph.is_ancestor(positions[first], positions[second]),
+                expected=git_is_ancestor(repo, commits[first], commits[second]),
+                prefix=f'{first} in {second}'
+            )
+
+    def test_missing_commit(self, repo: Repo):
+        repo.commit_content('a')
+        repo('commit-graph', 'write', '--reachable')
+        new = repo.commit_content('b', short=False)
+        graph = CommitGraph.for_path(repo.path)
+        compare(graph.position(new), expected=None)
+        compare(graph.position('not a hash'), expected=None)
+        compare(graph.position('ab'), expected=None)
+
+    def test_no_graph(self, repo: Repo):
+        repo.commit_content('a')
+        compare(CommitGraph.for_path(repo.path), expected=None)
+
+    def test_not_used_with_replace_refs(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        b = repo.commit_content('b', short=False)
+        repo('commit-graph', 'write', '--reachable')
+        repo('replace', a, b)
+        compare(CommitGraph.signature(repo.path), expected=None)
+        compare(CommitGraph.for_path(repo.path), expected=None)
+        repo('pack-refs', '--all')
+        compare(CommitGraph.for_path(repo.path), expected=None)
+
+    def test_not_a_repo(self, tmpdir: TempDirectory):
+        compare(CommitGraph.for_path(Path(tmpdir.path)), expected=None)
+
+    def test_bad_file(self, tmpdir: TempDirectory):
+        path = tmpdir.write('commit-graph', b'CGPH\2\1\0\0' + b'\0' * 24)
+        with ShouldRaise(UnsupportedGraph(f'{path} is not a version 1 commit-graph')):
+            CommitGraph([Path(path)])
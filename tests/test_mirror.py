@@ -0,0 +1,152 @@
+import fcntl
+from pathlib import Path
+
+from testfixtures import compare, ShouldRaise, TempDirectory, Replacer
+
+from giterator import Git, User
+from giterator.git import GitError
+from giterator.mirror import MirrorCache
+from giterator.testing import Repo
+from giterator.tracing import trace
+
+
+def alternates(git: Git) -> str:
+    return (git.path / '.git' / 'objects' / 'info' / 'alternates').read_text()
+
+
+def mirrors(cache: MirrorCache):
+    return sorted(path.name for path in cache.directory.glob('*.git'))
+
+
+class TestMirrorCache:
+
+    def test_clone(self, repo: Repo, tmpdir: TempDirectory):
+        hash = repo.commit_content('a')
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        with cache.clone(repo, tmpdir.getpath('clone')) as git:
+            compare(git.rev_parse('HEAD'), expected=hash)
+            compare(git('remote', 'get-url', 'origin'), expected=f'{repo.path}\n')
+            mirror = cache.mirror(repo, refresh=False)
+            compare(alternates(git), expected=f"{mirror.path / 'objects'}\n")
+            compare(git('config', 'user.name'), expected='Giterator\n')
+            compare(git('status', '--short'), expected='')
+            # no objects were copied:
+            compare(git('count-objects').split()[0], expected='0')
+
+    def test_mirror_reused_and_refreshed(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        cache.clone(repo, tmpdir.getpath('clone1')).close()
+        hash = repo.commit_content('b', tag='b-tag')
+        with cache.clone(repo, tmpdir.getpath('clone2')) as git:
+            compare(git.rev_parse('HEAD'), expected=hash)
+            compare(git.tags(), expected=['b-tag'])
+        compare(len(mirrors(cache)), expected=1)
+
+    def test_no_refresh(self, repo: Repo, tmpdir: TempDirectory):
+        a = repo.commit_content('a')
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        cache.mirror(repo)
+        repo.commit_content('b')
+        with trace() as stats:
+            mirror = cache.mirror(repo, refresh=False)
+        compare(stats.calls, expected=[])
+        compare(mirror.rev_parse('HEAD'), expected=a)
+
+    def test_single_fetch(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        cache.mirror(repo)
+        # As though another process fetched while this one waited for the lock:
+        with Replacer() as replace:
+            replace('giterator.mirror.time', lambda: 0)
+            with trace() as stats:
+                cache.mirror(repo)
+        compare(stats.calls, expected=[])
+        with trace() as stats:
+            cache.mirror(repo)
+        compare([call.subcommand for call in stats.calls], expected=['fetch'])
+
+    def test_source_as_url(self, repo: Repo, tmpdir: TempDirectory):
+        hash = repo.commit_content('a')
+        url = repo.path.as_uri()
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        with cache.clone(url, tmpdir.getpath('clone'), User('Foo', 'foo@example.com')) as git:
+            compare(git.rev_parse('HEAD'), expected=hash)
+            compare(git('remote', 'get-url', 'origin'), expected=f'{url}\n')
+            compare(git('config', 'user.name'), expected='Foo\n')
+
+    def test_options(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        hash = repo.commit_content('b', branch='other')
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        path = tmpdir.getpath('clone')
+        with cache.clone(repo, path, branch='other', dissociate=True) as git:
+            compare(git.rev_parse('HEAD'), expected=hash)
+            assert not (git.path / '.git' / 'objects' / 'info' / 'alternates').exists()
+
+    def test_reference_not_allowed(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        with ShouldRaise(TypeError('reference cannot be supplied, as the mirror is used')):
+            cache.clone(repo, tmpdir.getpath('clone'), reference=repo)
+
+    def test_bad_source(self, tmpdir: TempDirectory):
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        with ShouldRaise(GitError):
+            cache.mirror(tmpdir.makedir('not-a-repo'))
+        compare(mirrors(cache), expected=[])
+
+    def test_evict_by_count(self, tmpdir: TempDirectory):
+        cache = MirrorCache(tmpdir.getpath('cache'), max_mirrors=2)
+        sources = []
+        for name in 'abc':
+            with Repo.make(tmpdir.getpath(name)) as source:
+                source.commit_content(name)
+            sources.append(source)
+            cache.mirror(source)
+        compare(mirrors(cache), expected=sorted(
+            cache._paths(str(source.path))[0].name for source in sources[1:]
+        ))
+
+    def test_evict_by_size(self, tmpdir: TempDirectory):
+        cache = MirrorCache(tmpdir.getpath('cache'), max_size=1)
+        for name in 'ab':
+            with Repo.make(tmpdir.getpath(name)) as source:
+                source.commit_content(name)
+            path = cache.mirror(source).path
+        # the mirror just used is always kept:
+        compare(mirrors(cache), expected=[path.name])
+
+    def test_in_use_not_evicted(self, tmpdir: TempDirectory):
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        with Repo.make(tmpdir.getpath('a')) as a:
+            a.commit_content('a')
+        with Repo.make(tmpdir.getpath('b')) as b:
+            b.commit_content('b')
+        cache.mirror(a)
+        cache.mirror(b)
+        cache.max_mirrors = 1
+        _, lock = cache._paths(str(a.path))
+        with open(lock) as handle:
+            fcntl.flock(handle, fcntl.LOCK_SH)
+            compare(cache.evict(), expected=[])
+        compare(cache.evict(), expected=[cache._paths(str(a.path))[0]])
+        compare(len(mirrors(cache)), expected=1)
+
+    def test_already_removed(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        cache = MirrorCache(tmpdir.getpath('cache'))
+        cache.mirror(repo)
+        path, lock = cache._paths(cache._key(repo))
+        # As another process evicting it would:
+        assert MirrorCache._remove(path, lock)
+        compare(mirrors(cache), expected=[])
+        assert MirrorCache._remove(path, lock)
+        assert not lock.exists()
+
+    def test_no_limits(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        cache = MirrorCache(Path(tmpdir.getpath('cache')))
+        cache.mirror(repo)
+        compare(cache.evict(), expected=[])
@@ -0,0 +1,188 @@
+from pathlib import Path
+from subprocess import DEVNULL, run
+
+from testfixtures import compare, ShouldRaise, Replacer, TempDirectory
+
+from giterator import Git
+from giterator.packs import ObjectStore, Pack, UnsupportedFormat, apply_delta
+from giterator.testing import Repo
+from giterator.tracing import trace
+
+
+def all_objects(git: Git):
+    return [line.split()[0] for line in git.stream(
+        'cat-file', '--batch-all-objects', '--batch-check', '--unordered'
+    )]
+
+
+def make_history(repo: Repo, commits: int = 30):
+    # A file that grows a little each time, so that packing makes deltas:
+    for i in range(commits):
+        (repo.path / 'file').write_text(''.join(f'line {j}\n' for j in range(i * 20)))
+        (repo.path / f'other{i % 3}').write_text(f'{i}\n')
+        repo.commit(f'commit {i}')
+
+
+def deltas(git: Git) -> int:
+    output = git('verify-pack', '-v', *(str(p) for p in git.path.glob('.git/objects/pack/*.idx')))
+    return sum(1 for line in output.splitlines() if len(line.split()) >= 7)
+
+
+def check_all(git: Git, store: ObjectStore):
+    hashes = all_objects(git)
+    assert hashes
+    for hash in hashes:
+        expected = git.read_object(hash)
+        actual = store.read(hash)
+        compare(actual.type, expected=expected.type)
+        compare(actual.size, expected=expected.size)
+        compare(actual.content, expected=expected.content)
+        info = store.info(hash)
+        compare((info.hash, info.type, info.size), expected=(hash, expected.type, expected.size))
+    return hashes
+
+
+class TestObjectStore:
+
+    def test_loose(self, repo: Repo):
+        repo.commit_content('a')
+        store = ObjectStore.for_path(repo.path)
+        check_all(repo, store)
+        compare(store._packs, expected={})
+
+    def test_packed_with_ofs_deltas(self, repo: Repo):
+        make_history(repo)
+        repo('repack', '-a', '-d', '-f', '--window=50', '--depth=50', '--quiet')
+        assert deltas(repo)
+        assert not list(repo.path.glob('.git/objects/??/*'))
+        store = ObjectStore.for_path(repo.path)
+        check_all(repo, store)
+        store.close()
+
+    def test_packed_with_ref_deltas(self, repo: Repo):
+        make_history(repo)
+        repo('-c', 'repack.useDeltaBaseOffset=false', 'repack', '-a', '-d', '-f', '--quiet')
+        assert deltas(repo)
+        store = ObjectStore.for_path(repo.path)
+        check_all(repo, store)
+
+    def test_large_offsets(self, repo: Repo):
+        make_history(repo, commits=5)
+        objects = repo('rev-list', '--objects', '--all')
+        # Every object after the first is given a 64-bit offset:
+        run(
+            ['git', 'pack-objects', '--quiet', '--index-version=2,12', '.git/objects/pack/pack'],
+            cwd=repo.path, input=objects, text=True, stdout=DEVNULL, check=True
+        )
+        repo('prune-packed')
+        assert not list(repo.path.glob('.git/objects/??/*'))
+        idx, = repo.path.glob('.git/objects/pack/*.idx')
+        count = Pack(idx).count
+        compare(idx.stat().st_size, expected=8 + 1024 + count * 28 + (count - 1) * 8 + 40)
+        check_all(repo, ObjectStore.for_path(repo.path))
+
+    def test_pack_made_after_first_read(self, repo: Repo):
+        first = repo.commit_content('a', short=False)
+        store = ObjectStore.for_path(repo.path)
+        compare(store.read(first).type, expected='commit')
+        second = repo.commit_content('b', short=False)
+        repo('repack', '-a', '-d', '--quiet')
+        repo('prune-packed')
+        compare(store.read(second).type, expected='commit')
+        compare(store.info(first).type, expected='commit')
+
+    def test_alternates(self, repo: Repo, tmpdir: TempDirectory):
+        make_history(repo, commits=3)
+        repo('repack', '-a', '-d', '--quiet')
+        with Git.clone(repo, tmpdir.getpath('clone'), shared=True) as clone:
+            (clone.path / 'new').write_text('new')
+            clone.commit('new')
+            store = ObjectStore.for_path(clone.path)
+            hashes = check_all(clone, store)
+            assert len(store._get_alternates()) == 1
+            compare(len(hashes), expected=len(all_objects(repo)) + 3)
+
+    def test_missing(self, repo: Repo):
+        repo.commit_content('a')
+        repo('repack', '-a', '-d', '--quiet')
+        store = ObjectStore.for_path(repo.path)
+        compare(store.read('0' * 40), expected=None)
+        compare(store.info('0' * 40), expected=None)
+        compare(store.read('abc'), expected=None)
+        compare(store.read('not hex' * 6), expected=None)
+
+    def test_delta_cache_bounded(self, repo: Repo):
+        make_history(repo)
+        repo('repack', '-a', '-d', '-f', '--window=50', '--depth=50', '--quiet')
+        store = ObjectStore.for_path(repo.path, delta_cache_size=2000)
+        check_all(repo, store)
+        assert 0 < store._cache_bytes <= 2000, store._cache_bytes
+        compare(store._cache_bytes, expected=sum(len(c) for _, c in store._cache.values()))
+
+    def test_no_git_processes(self, repo: Repo):
+        make_history(repo, commits=5)
+        repo('gc', '--quiet')
+        hashes = all_objects(repo)
+        store = ObjectStore.for_path(repo.path)
+        with trace() as stats:
+            for hash in hashes:
+                store.read(hash)
+        compare(stats.calls, expected=[])
+
+    def test_sha256(self, tmpdir: TempDirectory):
+        path = Path(tmpdir.path)
+        git = Repo(path)
+        git('init', '--quiet', '--object-format=sha256', cwd=path)
+        git('config', 'user.name', 'Giterator')
+        git('config', 'user.email', 'giterator@example.com')
+        make_history(git, commits=3)
+        git('repack', '-a', '-d', '--quiet')
+        store = ObjectStore.for_path(path)
+        compare(store.hash_size, expected=32)
+        check_all(git, store)
+
+    def test_unknown_object_format(self, repo: Repo):
+        repo('config', 'extensions.objectFormat', 'sha512')
+        compare(ObjectStore.for_path(repo.path), expected=None)
+
+    def test_not_a_repo(self, tmpdir: TempDirectory):
+        compare(ObjectStore.for_path(Path(tmpdir.path)), expected=None)
+
+    def test_git_object_directory_env(self, repo: Repo):
+        with Replacer() as replace:
+            replace.in_environ('GIT_OBJECT_DIRECTORY', 'elsewhere')
+            compare(ObjectStore.for_path(repo.path), expected=None)
+
+
+class TestPack:
+
+    def test_bad_index(self, tmpdir: TempDirectory):
+        idx = tmpdir.write('pack-x.idx', b'\377tOc\0\0\0\1' + b'\0' * 1024)
+        tmpdir.write('pack-x.pack', b'PACK\0\0\0\2\0\0\0\0')
+        with ShouldRaise(UnsupportedFormat(f'{idx} is not a version 2 pack index')):
+            Pack(Path(idx))
+
+
+class TestApplyDelta:
+
+    def test_copy_and_insert(self):
+        base = b'hello world'
+        # base size, result size, copy 5 bytes from 0, insert ' there', copy 6 from 5
+        delta = bytes([11, 17, 0x90, 5, 6]) + b' there' + bytes([0x91, 5, 6])
+        compare(apply_delta(base, delta), expected=b'hello there world')
+
+    def test_copy_of_64k(self):
+        base = bytes(range(256)) * 256
+        compare(apply_delta(base, b'\x80\x80\x04\x80\x80\x04\x80'), expected=base)
+
+    def test_wrong_base(self):
+        with ShouldRaise(UnsupportedFormat('Delta is for a base of 3 bytes, not 2')):
+            apply_delta(b'ab', bytes([3, 1, 1]) + b'x')
+
+    def test_wrong_size(self):
+        with ShouldRaise(UnsupportedFormat('Delta made 1 bytes, not 2')):
+            apply_delta(b'ab', bytes([2, 2, 1]) + b'x')
+
+    def test_invalid_instruction(self):
+        with ShouldRaise(UnsupportedFormat('Invalid delta instruction')):
+            apply_delta(b'ab', bytes([2, 1, 0]))
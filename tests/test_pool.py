@@ -0,0 +1,112 @@
+import pickle
+from operator import methodcaller
+from pathlib import Path
+from threading import Event
+
+from testfixtures import compare, ShouldRaise, TempDirectory
+
+from giterator import Git
+from giterator.git import GitError
+from giterator.pool import GitPool, map_repos, Result
+from giterator.testing import Repo
+
+
+def make_repos(tmpdir: TempDirectory, count: int):
+    repos = []
+    for i in range(count):
+        repo = Repo.make(Path(tmpdir.path) / f'repo-{i}')
+        repo.commit_content(f'{i}', tag=f'tag-{i}')
+        repos.append(repo)
+    return repos
+
+
+def outcomes(results):
+    return sorted(
+        (result.git.path.name, result.value, type(result.error).__name__)
+        for result in results
+    )
+
+
+class TestMapRepos:
+
+    def test_threads(self, tmpdir: TempDirectory):
+        repos = make_repos(tmpdir, 3)
+        expected = sorted((r.path.name, r.tag_hashes(), 'NoneType') for r in repos)
+        compare(outcomes(map_repos(methodcaller('tag_hashes'), repos, workers=2)),
+                expected=expected)
+        for repo in repos:
+            repo.close()
+
+    def test_processes(self, tmpdir: TempDirectory):
+        repos = make_repos(tmpdir, 3)
+        expected = sorted((r.path.name, r.tag_hashes(), 'NoneType') for r in repos)
+        results = list(map_repos(methodcaller('tag_hashes'), repos, workers=2, processes=True))
+        compare(outcomes(results), expected=expected)
+        # the original instances are returned:
+        assert {id(r.git) for r in results} == {id(r) for r in repos}
+        for repo in repos:
+            repo.close()
+
+    def test_git_errors_collected(self, tmpdir: TempDirectory):
+        repo, = make_repos(tmpdir, 1)
+        not_a_repo = Git(tmpdir.makedir('not-a-repo'))
+        results = {r.git.path.name: r for r in map_repos(methodcaller('tags'), [repo, not_a_repo])}
+        compare(results['repo-0'].value, expected=['tag-0'])
+        compare(results['repo-0'].error, expected=None)
+        compare(results['not-a-repo'].value, expected=None)
+        assert isinstance(results['not-a-repo'].error, GitError)
+        assert 'not a git repository' in str(results['not-a-repo'].error)
+        repo.close()
+
+    def test_other_errors_raised(self, tmpdir: TempDirectory):
+        repos = make_repos(tmpdir, 2)
+
+        def fail(git):
+            raise ValueError(git.path.name)
+
+        with ShouldRaise(ValueError):
+            list(map_repos(fail, repos))
+
+    def test_streamed_as_completed(self, tmpdir: TempDirectory):
+        repos = make_repos(tmpdir, 2)
+        first_seen = Event()
+
+        def func(git):
+            if git is repos[0]:
+                # only finishes once the result for the second has been seen:
+                assert first_seen.wait(5)
+            return git.path.name
+
+        results = map_repos(func, repos, workers=2)
+        compare(next(results).value, expected='repo-1')
+        first_seen.set()
+        compare(next(results).value, expected='repo-0')
+
+    def test_lazy_iterable(self, tmpdir: TempDirectory):
+        taken = []
+
+        def repos():
+            for i in range(10):
+                taken.append(i)
+                yield Git(Path(tmpdir.path) / str(i))
+
+        with GitPool(workers=1) as pool:
+            results = pool.map(lambda git: git.path.name, repos())
+            next(results)
+            # at most two per worker are in flight:
+            assert len(taken) <= 3, taken
+            compare(len(list(results)), expected=9)
+
+    def test_result_repr(self):
+        compare(repr(Result(Git('/foo'), value=1)), expected='<Result: /foo value=1>')
+
+
+class TestPickle:
+
+    def test_git_without_processes(self, repo: Repo):
+        repo.commit_content('a')
+        copy = pickle.loads(pickle.dumps(repo))
+        compare(copy.path, expected=repo.path)
+        compare(copy._processes, expected={})
+        compare(copy.rev_parse('HEAD'), expected=repo.rev_parse('HEAD'))
+        copy.close()
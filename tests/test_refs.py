@@ -0,0 +1,299 @@
+from pathlib import Path
+from subprocess import Popen, check_output
+from unittest.mock import Mock
+
+from testfixtures import compare, Replacer, ShouldRaise, TempDirectory
+
+from giterator import Git
+from giterator.git import GitError
+from giterator.objects import Ref
+from giterator.refs import RefReader, LabelCache, find_git_dirs
+from giterator.testing import Repo
+from giterator.tracing import trace
+
+
+def reader(repo: Repo) -> RefReader:
+    return RefReader.for_path(repo.path)
+
+
+class TestFindGitDirs:
+
+    def test_work_tree(self, repo: Repo):
+        compare(find_git_dirs(repo.path), expected=(repo.path / '.git', repo.path / '.git'))
+
+    def test_bare(self, tmpdir: TempDirectory):
+        git = Git(tmpdir.getpath('bare'))
+        git.init()
+        git('config', 'core.bare', 'true')
+        bare = Path(tmpdir.getpath('bare.git'))
+        (git.path / '.git').rename(bare)
+        compare(find_git_dirs(bare), expected=(bare, bare))
+
+    def test_worktree(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        repo('worktree', 'add', tmpdir.getpath('wt'))
+        git_dir, common_dir = find_git_dirs(Path(tmpdir.getpath('wt')))
+        compare(git_dir, expected=repo.path / '.git' / 'worktrees' / 'wt')
+        compare(common_dir.resolve(), expected=(repo.path / '.git').resolve())
+
+    def test_not_a_repo(self, tmpdir: TempDirectory):
+        compare(find_git_dirs(Path(tmpdir.path)), expected=None)
+
+    def test_git_dir_in_environment(self, repo: Repo, monkeypatch):
+        monkeypatch.setenv('GIT_DIR', str(repo.path / '.git'))
+        compare(find_git_dirs(repo.path), expected=None)
+
+
+class TestRefReader:
+
+    def test_empty(self, repo: Repo):
+        compare(reader(repo).refs(), expected=[])
+
+    def test_loose(self, repo: Repo):
+        a = repo.commit_content('a', tag='a-tag', short=False)
+        b = repo.commit_content('b', branch='b-branch', short=False)
+        compare(reader(repo).refs(), expected=[
+            Ref('refs/heads/b-branch', b),
+            Ref('refs/heads/master', a),
+            Ref('refs/tags/a-tag', a),
+        ])
+
+    def test_prefix(self, repo: Repo):
+        a = repo.commit_content('a', tag='a-tag', short=False)
+        compare(reader(repo).refs('refs/tags/'), expected=[Ref('refs/tags/a-tag', a)])
+
+    def test_packed(self, repo: Repo):
+        a = repo.commit_content('a', tag='a-tag', short=False)
+        repo('tag', '-a', 'annotated', '-m', 'msg')
+        annotated = repo.rev_parse('annotated', short=False)
+        repo('pack-refs', '--all')
+        assert not (repo.path / '.git' / 'refs' / 'tags' / 'a-tag').exists()
+        compare(reader(repo).refs('refs/tags/'), expected=[
+            Ref('refs/tags/a-tag', a),
+            Ref('refs/tags/annotated', annotated, a),
+        ])
+
+    def test_loose_overrides_packed(self, repo: Repo):
+        repo.commit_content('a', branch='a-branch')
+        repo('pack-refs', '--all')
+        b = repo.commit_content('b', short=False)
+        compare(reader(repo).refs('refs/heads/'), expected=[Ref('refs/heads/a-branch', b)])
+
+    def test_symbolic(self, repo: Repo, tmpdir: TempDirectory):
+        a = repo.commit_content('a', short=False)
+        clone = Git.clone(repo, tmpdir.getpath('clone'))
+        compare(reader(clone).refs('refs/remotes/'), expected=[
+            Ref('refs/remotes/origin/HEAD', a),
+            Ref('refs/remotes/origin/master', a),
+        ])
+
+    def test_dangling_symbolic(self, repo: Repo):
+        repo.commit_content('a')
+        repo('symbolic-ref', 'refs/heads/dangling', 'refs/heads/nope')
+        compare([r.name for r in reader(repo).refs()], expected=['refs/heads/master'])
+
+    def test_changes_seen(self, repo: Repo):
+        refs = reader(repo)
+        a = repo.commit_content('a', short=False)
+        compare(refs.refs('refs/heads/'), expected=[Ref('refs/heads/master', a)])
+        b = repo.commit_content('b', short=False)
+        compare(refs.refs('refs/heads/'), expected=[Ref('refs/heads/master', b)])
+        repo('pack-refs', '--all')
+        compare(refs.refs('refs/heads/'), expected=[Ref('refs/heads/master', b)])
+        repo('update-ref', '-d', 'refs/heads/master')
+        compare(refs.refs('refs/heads/'), expected=[])
+
+    def test_unchanged_files_not_read(self, repo: Repo):
+        repo.commit_content('a', tag='a-tag')
+        refs = reader(repo)
+        expected = refs.refs()
+        open_ = Mock(side_effect=AssertionError('should not be called'))
+        with Replacer() as replace:
+            replace('giterator.refs.open', open_, strict=False)
+            compare(refs.refs(), expected=expected)
+
+    def test_reftable(self, repo: Repo):
+        (repo.path / '.git' / 'reftable').mkdir()
+        compare(RefReader.for_path(repo.path), expected=None)
+
+
+class TestNativeRefs:
+
+    def test_no_subprocesses(self, tmpdir: TempDirectory):
+        repo = Repo.make(tmpdir.getpath('repo'), native_refs=True)
+        a = repo.commit_content('a', tag='a-tag', short=False)
+        b = repo.commit_content('b', branch='b-branch', tag='b-tag', short=False)
+        repo('pack-refs', '--all')
+        repo.close()
+        popen = Mock(wraps=Popen)
+        check_output_ = Mock(wraps=check_output)
+        with Replacer() as replace:
+            replace('giterator.git.Popen', popen)
+            replace('giterator.git.check_output', check_output_)
+            compare(repo.tags(), expected=['a-tag', 'b-tag'])
+            compare(repo.branches(), expected=['b-branch', 'master'])
+            compare(repo.tag_hashes(short=False), expected={'a-tag': a, 'b-tag': b})
+            compare(repo.branch_hashes(short=False), expected={'b-branch': b, 'master': a})
+        compare(popen.call_count, expected=0)
+        compare(check_output_.call_count, expected=0)
+
+    def test_short(self, tmpdir: TempDirectory):
+        repo = Repo.make(tmpdir.getpath('repo'), native_refs=True)
+        a = repo.commit_content('a', tag='a-tag')
+        compare(repo.tag_hashes(), expected={'a-tag': a})
+        compare(repo.branch_hashes(), expected={'master': a})
+        repo.close()
+
+    def test_fallback(self, tmpdir: TempDirectory):
+        repo = Repo.make(tmpdir.getpath('repo'), native_refs=True)
+        a = repo.commit_content('a', tag='a-tag')
+        (repo.path / '.git' / 'reftable').mkdir()
+        repo._ref_reader = None
+        popen = Mock(wraps=Popen)
+        with Replacer() as replace:
+            replace('giterator.git.Popen', popen)
+            compare(repo.tag_hashes(), expected={'a-tag': a})
+            compare(repo.tags(), expected=['a-tag'])
+        compare(popen.call_count, expected=2)
+        repo.close()
+
+    def test_unsupported_content(self, tmpdir: TempDirectory):
+        repo = Repo.make(tmpdir.getpath('repo'), native_refs=True)
+        repo.commit_content('a')
+        (repo.path / '.git' / 'refs' / 'heads' / 'odd').write_text('not a hash\n')
+        compare(repo._read_refs('refs/heads/'), expected=None)
+        repo.close()
+
+
+class TestRevParseCache:
+
+    @staticmethod
+    def make(tmpdir: TempDirectory, size: int = 10) -> Repo:
+        return Repo.make(tmpdir.getpath('repo'), rev_parse_cache=size)
+
+    def test_off_by_default(self, repo: Repo):
+        repo.commit_content('a')
+        repo.rev_parse('HEAD')
+        compare(repo._label_cache, expected=None)
+
+    def test_cached(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            a = repo.commit_content('a', tag='a-tag')
+            compare(repo.rev_parse('a-tag'), expected=a)
+            compare(repo.rev_parse('HEAD'), expected=a)
+            with trace() as stats:
+                compare(repo.rev_parse('a-tag'), expected=a)
+                compare(repo.rev_parse('HEAD'), expected=a)
+            compare(stats.calls, expected=[])
+
+    def test_loose_ref_changed(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            a = repo.commit_content('a')
+            b = repo.commit_content('b')
+            compare(repo.rev_parse('HEAD'), expected=b)
+            # not using a method that invalidates the cache:
+            repo('update-ref', 'refs/heads/master', a)
+            compare(repo.rev_parse('HEAD'), expected=a)
+
+    def test_head_changed(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            a = repo.commit_content('a')
+            b = repo.commit_content('b', branch='other')
+            compare(repo.rev_parse('@'), expected=b)
+            repo('checkout', '--quiet', 'master')
+            compare(repo.rev_parse('@'), expected=a)
+
+    def test_packed_refs_changed(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            a = repo.commit_content('a', tag='a-tag')
+            b = repo.commit_content('b')
+            repo('pack-refs', '--all')
+            compare(repo.rev_parse('a-tag~0'), expected=a)
+            repo('tag', '--force', 'a-tag', b)
+            repo('pack-refs', '--all')
+            compare(repo.rev_parse('a-tag~0'), expected=b)
+
+    def test_new_ref_with_higher_priority(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            a = repo.commit_content('a', tag='name')
+            b = repo.commit_content('b')
+            compare(repo.rev_parse('name'), expected=a)
+            # refs/name is found before refs/tags/name:
+            repo('update-ref', 'refs/name', b)
+            compare(repo.rev_parse('name'), expected=b)
+
+    def test_invalidated_by_changes(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            repo.commit_content('a')
+            repo.rev_parse('HEAD')
+            repo.rev_parse('master')
+            compare(len(repo._label_cache._entries), expected=2)
+            repo.tag('a-tag')
+            compare(len(repo._label_cache._entries), expected=0)
+            repo.rev_parse('HEAD')
+            repo.branch('other')
+            compare(len(repo._label_cache._entries), expected=0)
+
+    def test_full_hash_cached_forever(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            a = repo.commit_content('a', short=False)
+            compare(repo.rev_parse(a + '^{tree}', short=False),
+                    expected=repo.object_info('HEAD^{tree}').hash)
+            repo.commit_content('b')
+            with trace() as stats:
+                repo.rev_parse(a + '^{tree}', short=False)
+            compare(stats.calls, expected=[])
+
+    def test_abbreviation_length_grows(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            a = repo.commit_content('a', short=False)
+            compare(repo.rev_parse(a), expected=a[:7])
+            with Replacer() as replace:
+                replace('giterator.git._approximate_object_count', lambda objects: 2 ** 20)
+                compare(repo.rev_parse(a), expected=a[:11])
+
+    def test_eviction(self, tmpdir: TempDirectory):
+        with self.make(tmpdir, size=2) as repo:
+            repo.commit_content('a')
+            repo.rev_parse('HEAD')
+            repo.rev_parse('master')
+            repo.rev_parse('HEAD')
+            repo.rev_parse('HEAD~0')
+            compare(list(repo._label_cache._entries), expected=[
+                ('HEAD', 7), ('HEAD~0', 7)
+            ])
+
+    def test_not_cached(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            repo.commit_content('a')
+            repo._label_cache.invalidate()
+            repo.rev_parse('HEAD@{0}')
+            repo.rev_parse(':a')
+            compare(repo._label_cache._entries, expected={})
+
+    def test_not_resolved(self, tmpdir: TempDirectory):
+        with self.make(tmpdir) as repo:
+            with ShouldRaise(GitError("Could not resolve 'HEAD'")):
+                repo.rev_parse('HEAD')
+            a = repo.commit_content('a')
+            compare(repo.rev_parse('HEAD'), expected=a)
+
+
+class TestLabelCache:
+
+    def test_no_repo(self, tmpdir: TempDirectory):
+        cache = LabelCache(10, Path(tmpdir.path))
+        compare(cache.dependencies('HEAD'), expected=None)
+        compare(cache.dependencies('a' * 40 + '~1'), expected=())
+
+    def test_reftable(self, repo: Repo):
+        (repo.path / '.git' / 'reftable').mkdir()
+        compare(LabelCache(10, repo.path).dependencies('HEAD'), expected=None)
+
+    def test_symbolic_ref_followed(self, repo: Repo):
+        repo.commit_content('a')
+        paths = [path for path, _ in LabelCache(10, repo.path).dependencies('HEAD')]
+        git_dir = repo.path / '.git'
+        compare(paths[:3], expected=[
+            git_dir / 'packed-refs', git_dir / 'HEAD', git_dir / 'refs' / 'heads' / 'master'
+        ])
@@ -0,0 +1,171 @@
+import gzip
+import json
+import tarfile
+from io import BytesIO
+from pathlib import Path
+
+from testfixtures import compare, not_there, Replacer, ShouldRaise, TempDirectory
+
+from giterator import Git
+from giterator.git import GitError
+from giterator.snapshot import pack, unpack, ParallelGzipWriter
+from giterator.testing import Repo
+
+
+def roundtrip(git: Git, path: str, workers: int = None, **kw) -> Git:
+    archive = BytesIO()
+    pack(git, archive, workers, **kw)
+    archive.seek(0)
+    return unpack(archive, path)
+
+
+def archive_of(*members: tarfile.TarInfo) -> BytesIO:
+    archive = BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        metadata = json.dumps({'bare': False, 'head': {'symbolic': 'refs/heads/master'}})
+        info = tarfile.TarInfo('repo.json')
+        info.size = len(metadata)
+        tar.addfile(info, BytesIO(metadata.encode()))
+        for member in members:
+            tar.addfile(member, BytesIO(b'x' * member.size))
+    archive.seek(0)
+    return archive
+
+
+def link(name: str, target: str) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.SYMTYPE
+    info.linkname = target
+    return info
+
+
+class TestParallelGzipWriter:
+
+    def test_roundtrip(self):
+        output = BytesIO()
+        writer = ParallelGzipWriter(output, workers=3, chunk_size=10)
+        data = b''.join(f'line {i}\n'.encode() for i in range(1000))
+        for i in range(0, len(data), 7):
+            writer.write(data[i:i+7])
+        writer.close()
+        compare(gzip.decompress(output.getvalue()), expected=data)
+
+    def test_empty(self):
+        output = BytesIO()
+        ParallelGzipWriter(output).close()
+        compare(gzip.decompress(output.getvalue()), expected=b'')
+
+
+class TestPackUnpack:
+
+    def test_roundtrip(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a', tag='a-tag')
+        repo.commit_content('b', branch='feature')
+        (repo.path / 'b').write_text('changed')
+        (repo.path / 'untracked').write_text('new')
+        (repo.path / 'a').unlink()
+        (repo.path / '.gitignore').write_text('ignored\n')
+        (repo.path / 'ignored').write_text('ignored')
+        copy = roundtrip(repo, tmpdir.getpath('copy'), workers=2)
+        compare(copy.tag_hashes(), expected=repo.tag_hashes())
+        compare(copy.branch_hashes(), expected=repo.branch_hashes())
+        compare(copy('symbolic-ref', 'HEAD'), expected='refs/heads/feature\n')
+        compare(copy('config', 'user.name'), expected='Giterator\n')
+        compare(copy('status', '--porcelain'), expected=repo('status', '--porcelain'))
+        compare((copy.path / 'b').read_text(), expected='changed')
+        assert not (copy.path / 'ignored').exists()
+        copy.close()
+
+    def test_many_gzip_members(self, repo: Repo, tmpdir: TempDirectory):
+        content = ''.join(f'line {i}\n' for i in range(10000))
+        (repo.path / 'big').write_text(content)
+        repo.commit('big')
+        (repo.path / 'big').write_text(content + 'changed\n')
+        copy = roundtrip(repo, tmpdir.getpath('copy'), workers=4, chunk_size=4096)
+        compare(copy.rev_parse('HEAD'), expected=repo.rev_parse('HEAD'))
+        compare((copy.path / 'big').read_text(), expected=content + 'changed\n')
+        copy.close()
+
+    def test_detached(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        repo('checkout', '-q', '--detach')
+        detached = repo.commit_content('b')
+        copy = roundtrip(repo, tmpdir.getpath('copy'))
+        compare(copy.rev_parse('HEAD'), expected=detached)
+        compare(copy('status', '--porcelain'), expected='')
+        copy.close()
+
+    def test_empty(self, repo: Repo, tmpdir: TempDirectory):
+        (repo.path / 'untracked').write_text('new')
+        copy = roundtrip(repo, tmpdir.getpath('copy'))
+        compare(copy.refs(), expected=[])
+        compare(copy('status', '--porcelain'), expected='?? untracked\n')
+
+    def test_bare(self, repo: Repo, tmpdir: TempDirectory):
+        a = repo.commit_content('a')
+        repo('clone', '--quiet', '--bare', str(repo.path), tmpdir.getpath('bare.git'))
+        copy = roundtrip(Git(tmpdir.getpath('bare.git')), tmpdir.getpath('copy.git'))
+        compare(copy('rev-parse', '--is-bare-repository'), expected='true\n')
+        compare(copy.rev_parse('HEAD'), expected=a)
+        copy.close()
+
+    def test_not_a_snapshot(self, tmpdir: TempDirectory):
+        archive = BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz'):
+            pass
+        archive.seek(0)
+        with ShouldRaise(GitError('Not a giterator snapshot: repo.json is missing')):
+            unpack(archive, tmpdir.getpath('copy'))
+
+    def test_symlink(self, repo: Repo, tmpdir: TempDirectory):
+        (repo.path / 'target').write_text('content')
+        (repo.path / 'link').symlink_to('target')
+        repo.commit('a commit')
+        copy = roundtrip(repo, tmpdir.getpath('copy'))
+        compare(Path(copy.path / 'link').readlink(), expected=Path('target'))
+        compare(copy('status', '--porcelain'), expected='')
+        copy.close()
+
+    def test_absolute_symlink(self, repo: Repo, tmpdir: TempDirectory):
+        target = tmpdir.write('outside', 'content')
+        (repo.path / 'link').symlink_to(target)
+        repo.commit('a commit')
+        copy = roundtrip(repo, tmpdir.getpath('copy'))
+        compare(Path(copy.path / 'link').readlink(), expected=Path(target))
+        compare(copy('status', '--porcelain'), expected='')
+        copy.close()
+
+    def test_writes_outside_refused(self, tmpdir: TempDirectory):
+        outside = tmpdir.makedir('outside')
+        with ShouldRaise(tarfile.OutsideDestinationError):
+            unpack(archive_of(link('worktree/../escape', outside)), tmpdir.getpath('one'))
+        file = tarfile.TarInfo('worktree/link/file')
+        file.size = 1
+        with ShouldRaise(tarfile.OutsideDestinationError):
+            unpack(archive_of(link('worktree/link', outside), file), tmpdir.getpath('two'))
+        compare(list(Path(outside).iterdir()), expected=[])
+        assert not Path(tmpdir.getpath('escape')).exists()
+
+    def test_only_some_config_restored(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        repo('remote', 'add', 'origin', 'https://example.com/repo.git')
+        repo('config', 'core.hooksPath', tmpdir.path)
+        repo('config', 'core.sshCommand', 'false')
+        copy = roundtrip(repo, tmpdir.getpath('copy'))
+        compare(copy('config', 'user.name'), expected='Giterator\n')
+        compare(copy('config', 'remote.origin.url'), expected='https://example.com/repo.git\n')
+        compare(copy('config', 'remote.origin.fetch'),
+                expected='+refs/heads/*:refs/remotes/origin/*\n')
+        for key in 'core.hooksPath', 'core.sshCommand':
+            with ShouldRaise(GitError):
+                copy('config', key)
+        copy.close()
+
+    def test_no_data_filter(self, tmpdir: TempDirectory):
+        with Replacer() as replace:
+            replace('tarfile.data_filter', not_there)
+            with ShouldRaise(RuntimeError(
+                'unpack needs tarfile.data_filter, added in Python 3.9.17'
+            )):
+                unpack(archive_of(), tmpdir.getpath('copy'))
+        assert not Path(tmpdir.getpath('copy')).exists()
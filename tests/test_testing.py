@@ -1,10 +1,11 @@
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
-from testfixtures import compare, TempDirectory
+from testfixtures import compare, ShouldRaise, TempDirectory
 
 from giterator import Git, User
-from giterator.testing import Repo
+from giterator.testing import Repo, RepoCache
 
 
 class TestRepo:
@@ -63,3 +64,125 @@ class TestRepo:
     def test_commit_content_full(self, repo: Repo):
         compare(repo.commit_content('a', datetime(2001, 1, 1, 10), short=False),
                 expected='5ee580aba98816af22cfa4e76ddf96bb3994964b')
+
+    def test_import_commits_matches_commit_content(self, tmpdir: TempDirectory):
+        one_at_a_time = Repo.make(tmpdir.getpath('one'))
+        expected = [
+            one_at_a_time.commit_content('a', tag='a-tag'),
+            one_at_a_time.commit_content('b', datetime(2001, 1, 1, 10)),
+            one_at_a_time.commit_content('c', branch='feature', tag='c-tag'),
+            one_at_a_time.commit_content('d'),
+        ]
+        batch = Repo.make(tmpdir.getpath('batch'))
+        actual = batch.import_commits([
+            batch.content('a', tag='a-tag'),
+            batch.content('b', datetime(2001, 1, 1, 10)),
+            batch.content('c', branch='feature', tag='c-tag'),
+            batch.content('d'),
+        ])
+        compare(actual, expected=expected)
+        compare(batch.tag_hashes(), expected=one_at_a_time.tag_hashes())
+        compare(batch.branch_hashes(), expected=one_at_a_time.branch_hashes())
+        compare(batch('symbolic-ref', 'HEAD'), expected='refs/heads/feature\n')
+        compare(batch('status', '--porcelain'), expected='')
+        compare(sorted(p.name for p in batch.path.iterdir()), expected=['.git', 'a', 'b', 'c', 'd'])
+        # the clock carries on from where the import left off:
+        compare(batch.commit_content('e'), expected=one_at_a_time.commit_content('e'))
+        one_at_a_time.close()
+        batch.close()
+
+
+def build_history(repo: Repo):
+    repo.commit_content('a', tag='a-tag')
+    repo.commit_content('b', branch='feature')
+
+
+class TestRepoCache:
+
+    def test_copies(self, tmpdir: TempDirectory):
+        cache = RepoCache(tmpdir.getpath('cache'))
+        first = cache.repo(tmpdir.getpath('first'), build_history)
+        second = cache.repo(tmpdir.getpath('second'), build_history)
+        compare(first.tag_hashes(), expected=second.tag_hashes())
+        compare(first.branch_hashes(), expected=second.branch_hashes())
+        compare(second('symbolic-ref', 'HEAD'), expected='refs/heads/feature\n')
+        compare(second('status', '--porcelain'), expected='')
+        compare(second('config', 'user.name'), expected='Giterator\n')
+        # copies are independent:
+        first.commit_content('c')
+        assert 'c' not in [p.name for p in second.path.iterdir()]
+        first.close()
+        second.close()
+
+    def test_built_once(self, tmpdir: TempDirectory):
+        calls = []
+
+        def builder(repo: Repo):
+            calls.append(repo)
+            repo.commit_content('a')
+
+        cache = RepoCache(tmpdir.getpath('cache'))
+        cache.repo(tmpdir.getpath('first'), builder, key='history').close()
+        cache.repo(tmpdir.getpath('second'), builder, key='history').close()
+        compare(len(calls), expected=1)
+        cache.repo(tmpdir.getpath('third'), builder, key='other').close()
+        compare(len(calls), expected=2)
+
+    def test_lambda_needs_key(self, tmpdir: TempDirectory):
+        cache = RepoCache(tmpdir.getpath('cache'))
+        first = lambda repo: repo.commit_content('A')  # noqa: E731
+        second = lambda repo: repo.commit_content('B')  # noqa: E731
+        with ShouldRaise(TypeError(f'A key must be supplied for {first!r}')):
+            cache.repo(tmpdir.getpath('first'), first)
+        with cache.repo(tmpdir.getpath('first'), first, key='first') as repo:
+            compare(sorted(p.name for p in repo.path.iterdir()), expected=['.git', 'A'])
+        with cache.repo(tmpdir.getpath('second'), second, key='second') as repo:
+            compare(sorted(p.name for p in repo.path.iterdir()), expected=['.git', 'B'])
+
+    def test_partial_needs_key(self, tmpdir: TempDirectory):
+        cache = RepoCache(tmpdir.getpath('cache'))
+        builder = partial(Repo.commit_content, prefix='A')
+        with ShouldRaise(TypeError(f'A key must be supplied for {builder!r}')):
+            cache.repo(tmpdir.getpath('first'), builder)
+        with cache.repo(tmpdir.getpath('first'), builder, key='a') as repo:
+            compare(sorted(p.name for p in repo.path.iterdir()), expected=['.git', 'A'])
+
+    def test_closure_needs_key(self, tmpdir: TempDirectory):
+        def make(name):
+            def build(repo):
+                repo.commit_content(name)
+            return build
+        cache = RepoCache(tmpdir.getpath('cache'))
+        first, second = make('A'), make('B')
+        with ShouldRaise(TypeError(f'A key must be supplied for {first!r}')):
+            cache.repo(tmpdir.getpath('first'), first)
+        with cache.repo(tmpdir.getpath('first'), first, key='first') as repo:
+            compare(sorted(p.name for p in repo.path.iterdir()), expected=['.git', 'A'])
+        with cache.repo(tmpdir.getpath('second'), second, key='second') as repo:
+            compare(sorted(p.name for p in repo.path.iterdir()), expected=['.git', 'B'])
+
+    def test_objects_shared(self, tmpdir: TempDirectory):
+        cache = RepoCache(tmpdir.getpath('cache'))
+        copy = cache.repo(tmpdir.getpath('copy'), build_history)
+        template, = Path(tmpdir.getpath('cache')).iterdir()
+        blob = copy.rev_parse('HEAD:a', short=False)
+        object_path = Path('.git', 'objects', blob[:2], blob[2:])
+        assert (copy.path / object_path).samefile(template / object_path)
+        assert not (copy.path / '.git' / 'index').samefile(template / '.git' / 'index')
+        copy.close()
+
+    def test_clock_continues(self, tmpdir: TempDirectory):
+        cache = RepoCache(tmpdir.getpath('cache'))
+        copy = cache.repo(tmpdir.getpath('copy'), build_history)
+        direct = Repo.make(tmpdir.getpath('direct'))
+        build_history(direct)
+        compare(copy.commit_content('c'), expected=direct.commit_content('c'))
+        copy.close()
+        direct.close()
+
+    def test_fixture(self, cached_repo):
+        first = cached_repo(build_history)
+        second = cached_repo(build_history)
+        assert first.path != second.path
+        compare(first.tags(), expected=['a-tag'])
+        compare(first.rev_parse('HEAD'), expected=second.rev_parse('HEAD'))
@@ -0,0 +1,156 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import Mock
+
+from testfixtures import compare, LogCapture, ShouldRaise, TempDirectory, Replacer
+
+from giterator import Git
+from giterator.aio import AsyncGit
+from giterator.git import GitError
+from giterator.testing import Repo
+from giterator.tracing import Call, Stats, trace, add_tracer, remove_tracer
+from giterator import tracing
+
+
+def subcommands(stats: Stats):
+    return [call.subcommand for call in stats.calls]
+
+
+class TestTracing:
+
+    def test_call(self, repo: Repo):
+        with trace() as stats:
+            repo('status', '--short')
+        call, = stats.calls
+        compare(call.command, expected=('git', 'status', '--short'))
+        compare(call.cwd, expected=repo.path)
+        compare(call.returncode, expected=0)
+        compare(call.output_size, expected=0)
+        assert call.duration > 0
+
+    def test_call_error(self, repo: Repo):
+        with trace() as stats:
+            with ShouldRaise(GitError):
+                repo('wut')
+        call, = stats.calls
+        compare(call.returncode, expected=1)
+        assert call.output_size > 0
+
+    def test_stream(self, repo: Repo):
+        repo.commit_content('a')
+        with trace() as stats:
+            compare(list(repo.stream('ls-files')), expected=['a'])
+        call, = stats.calls
+        compare(call.command, expected=('git', 'ls-files'))
+        compare(call.returncode, expected=0)
+        compare(call.output_size, expected=2)
+
+    def test_long_running_process(self, repo: Repo):
+        repo.commit_content('a')
+        repo.rev_parse('HEAD')
+        with trace() as stats:
+            repo.rev_parse('HEAD', short=False)
+            repo.rev_parse('HEAD', short=False)
+        compare([c.command for c in stats.calls], expected=[
+            ('git', 'cat-file', '--batch-check'),
+            ('git', 'cat-file', '--batch-check'),
+        ])
+        compare([c.returncode for c in stats.calls], expected=[None, None])
+        info = repo.object_info('HEAD')
+        compare(stats.calls[0].output_size, expected=len(f'{info.hash} commit {info.size}\n'))
+
+    def test_clone_commit_and_refs(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a', tag='a-tag')
+        with trace() as stats:
+            clone = Git.clone(repo, tmpdir.getpath('clone'))
+            (clone.path / 'b').write_text('b')
+            clone.commit('b', short=False)
+            clone.tag_hashes()
+            clone.branch_hashes()
+        compare(subcommands(stats), expected=[
+            'clone', 'config', 'config', 'add', 'commit', 'cat-file', 'for-each-ref', 'for-each-ref'
+        ])
+        clone.close()
+
+    def test_async(self, repo: Repo):
+        with trace() as stats:
+            asyncio.run(AsyncGit(repo.path)('status'))
+        compare(subcommands(stats), expected=['status'])
+
+    def test_add_and_remove(self, repo: Repo):
+        tracer = Mock()
+        add_tracer(tracer)
+        repo('status')
+        remove_tracer(tracer)
+        repo('status')
+        compare(tracer.call_count, expected=1)
+
+    def test_broken_tracer(self, repo: Repo):
+        repo.commit_content('a')
+        hash = repo.rev_parse('HEAD', short=False)
+
+        def broken(call: Call):
+            raise ValueError('broken')
+
+        with LogCapture() as log:
+            with trace(broken):
+                compare(repo.rev_parse('HEAD', short=False), expected=hash)
+                with ShouldRaise(GitError):
+                    list(repo.stream('wut'))
+                compare(repo('rev-parse', 'HEAD').strip(), expected=hash)
+        compare(len(log.records), expected=3)
+        compare(str(log.records[0].exc_info[1]), expected='broken')
+        # The long-running process is still usable from other threads:
+        with ThreadPoolExecutor(1) as executor:
+            compare(executor.submit(repo.rev_parse, 'HEAD', short=False).result(timeout=5),
+                    expected=hash)
+
+    def test_nothing_recorded_when_disabled(self, repo: Repo):
+        repo.commit_content('a')
+        with Replacer() as replace:
+            replace('giterator.tracing.record', Mock(side_effect=AssertionError))
+            repo('status')
+            list(repo.stream('ls-files'))
+            repo.rev_parse('HEAD')
+        compare(tracing.tracers, expected=())
+
+
+class TestCall:
+
+    def test_subcommand(self):
+        compare(Call(('git', 'log'), Path(), 0, 0, 0).subcommand, expected='log')
+
+    def test_subcommand_with_global_options(self):
+        call = Call(('git', '-c', 'a.b=c', '-C', 'foo', '--no-pager', 'log', '-1'), Path(), 0, 0, 0)
+        compare(call.subcommand, expected='log')
+
+    def test_no_subcommand(self):
+        compare(Call(('git', '--version'), Path(), 0, 0, 0).subcommand, expected='')
+
+
+class TestStats:
+
+    def test_report(self):
+        stats = Stats()
+        for i in range(1, 101):
+            stats(Call(('git', 'rev-parse'), Path(), i / 100, 0, 10))
+        stats(Call(('git', 'log'), Path(), 2, 0, 5))
+        report = stats.report()
+        compare(list(report), expected=['log', 'rev-parse'])
+        rev_parse = report['rev-parse']
+        compare(rev_parse.calls, expected=100)
+        compare(rev_parse.total, expected=50.5)
+        compare(rev_parse.p50, expected=0.5)
+        compare(rev_parse.p99, expected=0.99)
+        compare(rev_parse.output_size, expected=1000)
+        compare(report['log'].p50, expected=2)
+        compare(report['log'].p99, expected=2)
+
+    def test_str(self):
+        stats = Stats()
+        stats(Call(('git', 'log'), Path(), 0.5, 0, 5))
+        compare(str(stats), expected=(
+            'subcommand              calls      total        p50        p99\n'
+            'log                         1     0.5000     0.5000     0.5000'
+        ))
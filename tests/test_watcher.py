@@ -0,0 +1,139 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from testfixtures import compare, Replacer, TempDirectory
+
+from giterator import Git
+from giterator.testing import Repo
+from giterator.tracing import trace
+from giterator.watcher import RefChange, RepoWatcher, diff
+
+
+@pytest.fixture(params=[True, False], ids=['inotify', 'polling'])
+def watcher(request) -> Iterator[RepoWatcher]:
+    with RepoWatcher(interval=0.01, inotify=request.param) as watcher_:
+        yield watcher_
+
+
+class TestRepoWatcher:
+
+    def test_no_changes(self, watcher: RepoWatcher, repo: Repo):
+        repo.commit_content('a')
+        watcher.add(repo)
+        compare(watcher.poll(timeout=0.05), expected=[])
+
+    def test_added_moved_removed(self, watcher: RepoWatcher, repo: Repo):
+        a = repo.commit_content('a', tag='old', short=False)
+        watcher.add(repo)
+        compare(watcher.refs(repo), expected={
+            'HEAD': a, 'refs/heads/master': a, 'refs/tags/old': a,
+        })
+        b = repo.commit_content('b', short=False)
+        repo('tag', '-d', 'old')
+        repo('tag', 'new')
+        compare(watcher.poll(timeout=5), expected=[(repo, [
+            RefChange('HEAD', a, b),
+            RefChange('refs/heads/master', a, b),
+            RefChange('refs/tags/new', None, b),
+            RefChange('refs/tags/old', a, None),
+        ])])
+        compare(watcher.check(), expected=[])
+
+    def test_nested_and_packed(self, watcher: RepoWatcher, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        watcher.add(repo)
+        repo('branch', 'feature/one/deep')
+        compare(watcher.poll(timeout=5), expected=[(repo, [
+            RefChange('refs/heads/feature/one/deep', None, a),
+        ])])
+        b = repo.commit_content('b', short=False)
+        repo('pack-refs', '--all')
+        repo('update-ref', 'refs/heads/feature/one/deep', b)
+        compare(watcher.poll(timeout=5), expected=[(repo, [
+            RefChange('HEAD', a, b),
+            RefChange('refs/heads/feature/one/deep', a, b),
+            RefChange('refs/heads/master', a, b),
+        ])])
+        # Packing refs doesn't change what they point to:
+        repo('pack-refs', '--all')
+        compare(watcher.poll(timeout=0.05), expected=[])
+
+    def test_head_moves(self, watcher: RepoWatcher, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        b = repo.commit_content('b', branch='other', short=False)
+        watcher.add(repo)
+        repo('checkout', '--quiet', 'master')
+        compare(watcher.poll(timeout=5), expected=[(repo, [RefChange('HEAD', b, a)])])
+
+    def test_many_repos(self, watcher: RepoWatcher, tmpdir: TempDirectory):
+        repos = [Repo.make(Path(tmpdir.getpath(f'repo-{i}'))) for i in range(20)]
+        for repo in repos:
+            repo.commit_content('a')
+            watcher.add(repo)
+        with trace() as stats:
+            compare(watcher.check(), expected=[])
+        compare(stats.calls, expected=[])
+        changed = repos[7]
+        hash = changed.rev_parse('HEAD', short=False)
+        changed('tag', 'v1')
+        compare(watcher.poll(timeout=5), expected=[
+            (changed, [RefChange('refs/tags/v1', None, hash)]),
+        ])
+
+    def test_remove(self, watcher: RepoWatcher, repo: Repo):
+        repo.commit_content('a')
+        watcher.add(repo)
+        watcher.add(repo)
+        watcher.remove(repo)
+        repo.commit_content('b')
+        compare(watcher.poll(timeout=0.05), expected=[])
+
+    def test_worktrees_share_watches(self, repo: Repo, tmpdir: TempDirectory):
+        a = repo.commit_content('a', short=False)
+        repo('worktree', 'add', '--quiet', '--detach', tmpdir.getpath('wt'))
+        worktree = Git(tmpdir.getpath('wt'))
+        with RepoWatcher(inotify=True) as watcher:
+            watcher.add(repo)
+            watcher.add(worktree)
+            watcher.remove(worktree)
+            repo('tag', 'v1')
+            compare(watcher.poll(timeout=5), expected=[
+                (repo, [RefChange('refs/tags/v1', None, a)]),
+            ])
+
+    def test_watch_limit_falls_back_to_polling(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        with RepoWatcher(interval=0.01) as watcher:
+            if not watcher.uses_inotify:
+                pytest.skip('inotify not available')
+            # What happens when the limit on the number of watches is reached:
+            watcher._inotify.add = lambda path: None
+            watcher.add(repo)
+            compare(watcher._by_wd, expected={})
+            repo('tag', 'v1')
+            compare(watcher.poll(timeout=5), expected=[
+                (repo, [RefChange('refs/tags/v1', None, a)]),
+            ])
+
+    def test_refs_not_readable_directly(self, repo: Repo):
+        a = repo.commit_content('a', short=False)
+        with Replacer() as replace:
+            replace.in_environ('GIT_COMMON_DIR', str(repo.path / '.git'))
+            with RepoWatcher(interval=0.01) as watcher:
+                watcher.add(repo)
+                compare(watcher.refs(repo), expected={'HEAD': a, 'refs/heads/master': a})
+                repo('tag', 'v1')
+                compare(watcher.poll(timeout=5), expected=[
+                    (repo, [RefChange('refs/tags/v1', None, a)]),
+                ])
+
+
+class TestDiff:
+
+    def test_diff(self):
+        compare(diff({'a': '1', 'b': '2', 'c': '3'}, {'b': '2', 'c': '4', 'd': '5'}), expected=[
+            RefChange('a', '1', None),
+            RefChange('c', '3', '4'),
+            RefChange('d', None, '5'),
+        ])
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+from testfixtures import compare, ShouldRaise, TempDirectory
+
+from giterator import Git
+from giterator.git import GitError
+from giterator.testing import Repo
+from giterator.worktree import WorktreePool
+
+
+def worktrees(repo: Repo):
+    return [line.split()[0] for line in repo('worktree', 'list').splitlines()]
+
+
+class TestWorktreePool:
+
+    def test_lease(self, repo: Repo, tmpdir: TempDirectory):
+        first = repo.commit_content('a', tag='first')
+        repo.commit_content('b')
+        with WorktreePool(repo, tmpdir.getpath('worktrees')) as pool:
+            with pool.leased('first') as worktree:
+                compare(worktree.rev_parse('HEAD'), expected=first)
+                compare((worktree.path / 'a').read_text(), expected='a content')
+                assert not (worktree.path / 'b').exists()
+                compare(worktree('status', '--short'), expected='')
+                # the object store is shared:
+                compare(
+                    worktree('rev-parse', '--path-format=absolute', '--git-common-dir'),
+                    expected=f"{repo.path / '.git'}\n"
+                )
+
+    def test_reused_and_cleaned(self, repo: Repo, tmpdir: TempDirectory):
+        first = repo.commit_content('a')
+        second = repo.commit_content('b')
+        with WorktreePool(repo, tmpdir.getpath('worktrees')) as pool:
+            worktree = pool.lease(first)
+            (worktree.path / 'a').write_text('changed')
+            (worktree.path / 'untracked').write_text('u')
+            pool.release(worktree)
+            reused = pool.lease(second)
+            assert reused is worktree
+            compare(reused.rev_parse('HEAD'), expected=second)
+            compare((reused.path / 'a').read_text(), expected='a content')
+            assert not (reused.path / 'untracked').exists()
+            compare(reused('status', '--short', '--ignored'), expected='')
+            pool.release(reused)
+
+    def test_bounded(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        with WorktreePool(repo, tmpdir.getpath('worktrees'), size=2) as pool:
+            first = pool.lease()
+            second = pool.lease()
+            assert first is not second
+            with ShouldRaise(TimeoutError('No work tree available after 0.01s')):
+                pool.lease(timeout=0.01)
+            pool.release(first)
+            assert pool.lease(timeout=0.01) is first
+            compare(len(worktrees(repo)), expected=3)
+
+    def test_concurrent(self, repo: Repo, tmpdir: TempDirectory):
+        hash = repo.commit_content('a')
+        barrier = Barrier(3)
+
+        def job(_):
+            with pool.leased() as worktree:
+                barrier.wait(timeout=10)
+                return worktree.path, worktree.rev_parse('HEAD')
+
+        with WorktreePool(repo, tmpdir.getpath('worktrees'), size=3) as pool:
+            with ThreadPoolExecutor(3) as executor:
+                results = list(executor.map(job, range(3)))
+        compare(len({path for path, _ in results}), expected=3)
+        compare({commit for _, commit in results}, expected={hash})
+
+    def test_wait_for_release(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        with WorktreePool(repo, tmpdir.getpath('worktrees'), size=1) as pool:
+            worktree = pool.lease()
+            with ThreadPoolExecutor(1) as executor:
+                waiting = executor.submit(pool.lease, timeout=10)
+                pool.release(worktree)
+                assert waiting.result() is worktree
+
+    def test_release_not_leased(self, repo: Repo, git: Git, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        with WorktreePool(repo, tmpdir.getpath('worktrees')) as pool:
+            with ShouldRaise(ValueError(f'{git.path} is not leased from this pool')):
+                pool.release(git)
+            worktree = pool.lease()
+            pool.release(worktree)
+            with ShouldRaise(ValueError(f'{worktree.path} is not leased from this pool')):
+                pool.release(worktree)
+
+    def test_bad_revision(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        with WorktreePool(repo, tmpdir.getpath('worktrees'), size=1) as pool:
+            with ShouldRaise(GitError("Could not resolve 'nothere^{commit}'")):
+                pool.lease('nothere')
+            pool.release(pool.lease(timeout=0.01))
+
+    def test_add_fails(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        tmpdir.write('worktrees', 'not a directory')
+        with WorktreePool(repo, tmpdir.getpath('worktrees'), size=1) as pool:
+            with ShouldRaise(GitError):
+                pool.lease()
+            # the slot was given back, so this doesn't time out:
+            with ShouldRaise(GitError):
+                pool.lease(timeout=0.01)
+
+    def test_remove_fails_on_release(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        with WorktreePool(repo, tmpdir.getpath('worktrees'), size=1) as pool:
+            worktree = pool.lease()
+            (worktree.path / '.git').unlink()
+
+            def remove(worktree_):
+                raise OSError('boom')
+
+            pool._remove = remove
+            with ShouldRaise(OSError('boom')):
+                pool.release(worktree)
+            del pool._remove
+            # the slot was given back, so this doesn't time out:
+            pool.release(pool.lease(timeout=0.01))
+
+    def test_close(self, repo: Repo, tmpdir: TempDirectory):
+        repo.commit_content('a')
+        pool = WorktreePool(repo, tmpdir.getpath('worktrees'))
+        first = pool.lease()
+        second = pool.lease()
+        pool.release(first)
+        pool.close()
+        assert not first.path.exists()
+        assert second.path.exists()
+        compare(worktrees(repo), expected=[str(repo.path), str(second.path)])